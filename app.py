@@ -1,8 +1,18 @@
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, Response, after_this_request, request, jsonify, send_from_directory, stream_with_context
 from flask_cors import CORS
 from config import Config
 from utils import GeminiClient, SceneManager, MCPHandler, StatusManager
+from utils.admission import (
+    PRIORITY_CHAT, AdmissionRejected, admission_slot, create_admission_controller, rejection_response
+)
+from utils.history_manager import HistoryManager
+from utils.session_store import create_session_store
+from utils.prompt_templates import get_prompt_stats
 import os
+import re
+import json
+import uuid
+from contextlib import ExitStack
 import logging
 
 # Initialize Flask app
@@ -27,6 +37,13 @@ except ValueError as e:
     logger.warning(f"Gemini client initialization failed: {e}")
     logger.warning("API endpoints will return errors until GEMINI_API_KEY is set")
 
+# Server-side conversation history and status, keyed by the chat session cookie
+history_manager = HistoryManager(store=create_session_store('chat_history'))
+status_store = create_session_store('chat_status')
+
+# Per-session rate limit and global concurrency limit for Gemini calls
+admission = create_admission_controller()
+
 
 @app.route('/')
 def index():
@@ -39,7 +56,17 @@ def health_check():
     """Health check endpoint"""
     return jsonify({
         'status': 'ok',
-        'gemini_configured': gemini_client is not None
+        'gemini_configured': gemini_client is not None,
+        'http_pool': gemini_client.get_pool_stats() if gemini_client else {},
+        'response_cache': gemini_client.get_cache_stats() if gemini_client else {'enabled': False},
+        'coalescing': gemini_client.get_coalescing_stats() if gemini_client else {'enabled': False},
+        'context_cache': gemini_client.get_context_cache_stats() if gemini_client else {'enabled': False},
+        'resilience': gemini_client.get_resilience_stats() if gemini_client else {},
+        'providers': gemini_client.get_router_stats() if gemini_client else {},
+        'admission': admission.stats() if admission else {'enabled': False},
+        'prompts': get_prompt_stats(),
+        'history': history_manager.stats(),
+        'status_store': status_store.stats()
     })
 
 
@@ -91,10 +118,15 @@ def chat():
     Request JSON:
     {
         "message": "User message",
-        "current_scene": "scene_id",
-        "conversation_history": [...]  // Optional
+        "current_scene": "scene_id"
     }
 
+    Conversation history and status values are kept server-side per chat
+    session cookie.
+
+    Requests over the per-session rate limit get 429, and requests the server
+    cannot queue get 503; both carry a Retry-After header.
+
     Response JSON:
     {
         "success": true,
@@ -108,73 +140,245 @@ def chat():
     }
     """
     try:
-        # Check if Gemini client is initialized
-        if not gemini_client:
+        session_id = _flask_chat_session_id()
+        data = request.get_json(silent=True)
+        # Invalid requests are answered before they take a rate token or a slot
+        error = _validate_chat(data)
+        if error:
+            return jsonify(error[0]), error[1]
+
+        with admission_slot(admission, session_id, PRIORITY_CHAT):
+            prepared, error = _prepare_chat(data, session_id)
+            if error:
+                return jsonify(error[0]), error[1]
+
+            # Generate AI response
+            logger.info(f"Processing message in scene: {prepared['current_scene']}")
+            result = gemini_client.generate_response(
+                user_message=prepared['user_message'],
+                current_scene=prepared['current_scene'],
+                conversation_history=prepared['conversation_history']
+            )
+
+            if not result['success']:
+                return jsonify(result), 500
+
+            response_data = _finish_chat(result['data'], prepared)
+
             return jsonify({
-                'success': False,
-                'error': 'Gemini API is not configured. Please set GEMINI_API_KEY in .env file.'
-            }), 500
+                'success': True,
+                'data': response_data
+            })
 
-        # Parse request
-        data = request.get_json()
+    except AdmissionRejected as e:
+        return _admission_rejected(e)
+    except Exception as e:
+        logger.error(f"Error in chat endpoint: {e}", exc_info=True)
+        return jsonify({
+            'success': False,
+            'error': f'Internal server error: {str(e)}'
+        }), 500
 
-        if not data or 'message' not in data:
-            return jsonify({
-                'success': False,
-                'error': 'Missing required field: message'
-            }), 400
 
-        user_message = data['message']
-        current_scene = data.get('current_scene', SceneManager.DEFAULT_SCENE)
-        conversation_history = data.get('conversation_history', [])
-        status_data = data.get('status', {})
+@app.route('/api/chat/stream', methods=['POST'])
+def chat_stream():
+    """
+    Handle chat messages, streaming the reply as Server-Sent Events
 
-        # Validate scene
-        if not SceneManager.validate_scene(current_scene):
-            current_scene = SceneManager.DEFAULT_SCENE
+    Request JSON: same as /api/chat
 
-        # Initialize status manager
-        status_manager = StatusManager.from_dict(status_data)
+    Event stream:
+        event: delta   data: {"text": "next piece of the message"}
+        event: done    data: {"success": true, "data": {...same as /api/chat...}}
+        event: error   data: {"success": false, "error": "..."}
+    """
+    # The slot is held until the stream is closed
+    slot = ExitStack()
+    try:
+        session_id = _flask_chat_session_id()
+        data = request.get_json(silent=True)
+        error = _validate_chat(data)
+        if error:
+            return jsonify(error[0]), error[1]
+
+        slot.enter_context(admission_slot(admission, session_id, PRIORITY_CHAT))
+        prepared, error = _prepare_chat(data, session_id)
+        if error:
+            slot.close()
+            return jsonify(error[0]), error[1]
+    except AdmissionRejected as e:
+        return _admission_rejected(e)
+    except Exception as e:
+        slot.close()
+        logger.error(f"Error in chat stream endpoint: {e}", exc_info=True)
+        return jsonify({
+            'success': False,
+            'error': f'Internal server error: {str(e)}'
+        }), 500
 
-        # Apply scene effect on status
-        status_manager.apply_scene_effect(current_scene)
+    def generate():
+        logger.info(f"Streaming message in scene: {prepared['current_scene']}")
+        try:
+            for event in gemini_client.stream_response(
+                user_message=prepared['user_message'],
+                current_scene=prepared['current_scene'],
+                conversation_history=prepared['conversation_history']
+            ):
+                if event['event'] == 'delta':
+                    yield _sse('delta', {'text': event['text']})
+                elif event['event'] == 'done':
+                    response_data = _finish_chat(event['data'], prepared)
+                    yield _sse('done', {'success': True, 'data': response_data})
+                else:
+                    yield _sse('error', {'success': False, 'error': event['error']})
+        except Exception as e:
+            logger.error(f"Error while streaming chat: {e}", exc_info=True)
+            yield _sse('error', {'success': False, 'error': f'Internal server error: {str(e)}'})
+
+    response = Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'
+        }
+    )
+    response.call_on_close(slot.close)
+    return response
 
-        # Apply action effects based on user message
-        status_manager.apply_action_effect(user_message)
 
-        # Generate AI response
-        logger.info(f"Processing message in scene: {current_scene}")
-        result = gemini_client.generate_response(
-            user_message=user_message,
-            current_scene=current_scene,
-            conversation_history=conversation_history
-        )
+@app.route('/api/status', methods=['GET'])
+def get_status():
+    """Get the status values of this chat session"""
+    status_manager = StatusManager.from_state(status_store.get(_flask_chat_session_id()))
+    return jsonify({
+        'success': True,
+        'status': status_manager.to_dict()
+    })
 
-        if not result['success']:
-            return jsonify(result), 500
 
-        response_data = result['data']
+@app.route('/api/chat/history', methods=['DELETE'])
+def clear_chat_history():
+    """Forget the server-side conversation history of this chat session"""
+    history_manager.clear(_flask_chat_session_id())
+    return jsonify({'success': True})
 
-        # Execute MCP command if present
-        if response_data.get('mcp_command'):
-            logger.info(f"Executing MCP command: {response_data['mcp_command']}")
-            mcp_result = MCPHandler.execute_command(response_data['mcp_command'])
-            response_data['mcp_output'] = mcp_result
 
-        # Include updated status in response
-        response_data['status'] = status_manager.to_dict()
+def _chat_session_id(cookie_value):
+    """
+    Validate a chat session cookie value
 
-        return jsonify({
-            'success': True,
-            'data': response_data
-        })
+    Returns:
+        Tuple of (session id, whether it was newly created)
+    """
+    if cookie_value and re.fullmatch(r'[0-9a-f]{32}', cookie_value):
+        return cookie_value, False
+    return uuid.uuid4().hex, True
 
-    except Exception as e:
-        logger.error(f"Error in chat endpoint: {e}", exc_info=True)
-        return jsonify({
+
+def _flask_chat_session_id():
+    """Chat session id of the current Flask request, setting the cookie on the response if new"""
+    session_id, is_new = _chat_session_id(request.cookies.get(Config.CHAT_SESSION_COOKIE))
+    if is_new:
+        @after_this_request
+        def set_session_cookie(response):
+            response.set_cookie(Config.CHAT_SESSION_COOKIE, session_id, httponly=True, samesite='Lax')
+            return response
+    return session_id
+
+
+def _admission_rejected(error):
+    """429/503 response for a chat request turned away by admission control"""
+    body, status, headers = rejection_response(error)
+    logger.info(f"Chat request rejected: {error.reason}")
+    return jsonify(body), status, headers
+
+
+def _validate_chat(data):
+    """
+    Check a chat request before it is admitted
+
+    Args:
+        data: Parsed request JSON (None if the body was not JSON)
+
+    Returns:
+        None if valid, else (error body, HTTP status)
+    """
+    # Check if Gemini client is initialized
+    if not gemini_client:
+        return {
             'success': False,
-            'error': f'Internal server error: {str(e)}'
-        }), 500
+            'error': 'Gemini API is not configured. Please set GEMINI_API_KEY in .env file.'
+        }, 500
+
+    if not isinstance(data, dict) or not isinstance(data.get('message'), str) or not data['message'].strip():
+        return {
+            'success': False,
+            'error': 'Missing required field: message'
+        }, 400
+    return None
+
+
+def _prepare_chat(data, session_id):
+    """
+    Validate a chat request and apply its status effects
+
+    Args:
+        data: Parsed request JSON
+        session_id: Chat session id the conversation history is kept under
+
+    Returns:
+        Tuple of (prepared request dict, None) or (None, (error body, HTTP status))
+    """
+    error = _validate_chat(data)
+    if error:
+        return None, error
+
+    user_message = data['message']
+    current_scene = data.get('current_scene', SceneManager.DEFAULT_SCENE)
+
+    # Validate scene
+    if not SceneManager.validate_scene(current_scene):
+        current_scene = SceneManager.DEFAULT_SCENE
+
+    # Restore this session's status (with time decay since the last turn)
+    status_manager = StatusManager.from_state(status_store.get(session_id))
+
+    # Apply scene effect on status
+    status_manager.apply_scene_effect(current_scene)
+
+    # Apply action effects based on user message
+    status_manager.apply_action_effect(user_message)
+    status_store.set(session_id, status_manager.to_state())
+
+    return {
+        'user_message': user_message,
+        'current_scene': current_scene,
+        'conversation_history': history_manager.get(session_id),
+        'session_id': session_id,
+        'status_manager': status_manager
+    }, None
+
+
+def _finish_chat(response_data, prepared):
+    """Record the turn, execute any MCP command in the AI response and attach updated status"""
+    history_manager.record_exchange(prepared['session_id'], prepared['user_message'], response_data.get('message', ''))
+
+    # Execute MCP command if present
+    if response_data.get('mcp_command'):
+        logger.info(f"Executing MCP command: {response_data['mcp_command']}")
+        mcp_result = MCPHandler.execute_command(response_data['mcp_command'])
+        response_data['mcp_output'] = mcp_result
+
+    # Include updated status in response
+    response_data['status'] = prepared['status_manager'].to_dict()
+
+    return response_data
+
+
+def _sse(event, data):
+    """Format one Server-Sent Event frame"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
 
 
 @app.route('/api/mcp/execute', methods=['POST'])
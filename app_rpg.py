@@ -2,10 +2,21 @@ from flask import Flask, request, jsonify, send_from_directory, session, redirec
 from flask_cors import CORS
 from flask_login import LoginManager, login_user, logout_user, login_required, current_user
 from config import Config
-from models import db, User, Character, InventoryItem, QuestProgress, GameEvent
+from models import db, User, Character, InventoryItem, QuestProgress, GameEvent, load_character, unit_of_work
 from utils import GeminiClient
+from utils.admission import (
+    PRIORITY_CHAT, PRIORITY_COMBAT, AdmissionRejected, admission_slot, create_admission_controller, rejection_response
+)
 from utils.combat_manager import CombatManager
+from utils.combat_narrator import CombatNarrator
+from utils.combat_sessions import CombatSessionStore, combat_delta, public_state, snapshot
+from utils.database import database_stats, init_app_database
+from utils.economy import get_economy_tables
 from utils.game_manager import GameManager
+from utils.history_manager import HistoryManager
+from utils.migrations import migrate_on_startup, migration_summary
+from utils.session_store import create_session_store
+from utils.prompt_templates import PROMPT_TEMPLATES, get_prompt_stats
 from utils.game_data import (
     PERSONALITY_TEMPLATES, CHARACTER_CLASSES, ITEMS,
     ENEMIES, LOCATIONS, QUESTS, GAME_SETTINGS
@@ -17,14 +28,13 @@ from datetime import datetime
 # Initialize Flask app
 app = Flask(__name__, static_folder='static')
 app.config.from_object(Config)
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///game.db'
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
 # Enable CORS
 CORS(app, origins=Config.CORS_ORIGINS, supports_credentials=True)
 
-# Initialize extensions
-db.init_app(app)
+# Initialize extensions (engine settings from DB_PROFILE)
+init_app_database(app, db)
 login_manager = LoginManager()
 login_manager.init_app(app)
 login_manager.login_view = 'login'
@@ -43,6 +53,18 @@ try:
 except ValueError as e:
     logger.warning(f"Gemini client initialization failed: {e}")
 
+# Server-side narrator history, keyed by character id
+history_manager = HistoryManager(store=create_session_store('rpg_history'))
+
+# Server-authoritative combat state, keyed by character id
+combat_sessions = CombatSessionStore()
+
+# Per-account rate limit and global concurrency limit for Gemini calls
+admission = create_admission_controller()
+
+# Batched narration of combat logs (one Gemini call per encounter / cadence)
+combat_narrator = CombatNarrator(gemini_client) if gemini_client and Config.COMBAT_NARRATION_ENABLED else None
+
 
 @login_manager.user_loader
 def load_user(user_id):
@@ -242,22 +264,24 @@ def create_character():
             gold=GAME_SETTINGS['starting_gold']
         )
 
-        db.session.add(character)
-        db.session.commit()
+        # Character, tutorial quest and starting items commit together
+        with unit_of_work():
+            db.session.add(character)
+            db.session.flush()  # Assigns character.id
 
-        # Start tutorial quest
-        GameManager.start_quest(character, 'tutorial')
+            # Start tutorial quest
+            GameManager.start_quest(character, 'tutorial')
 
-        # Add starting items
-        GameManager.add_item_to_inventory(character, 'health_potion', 3)
-        GameManager.add_item_to_inventory(character, 'rusty_sword', 1)
-        GameManager.add_item_to_inventory(character, 'cloth_armor', 1)
+            # Add starting items
+            GameManager.add_item_to_inventory(character, 'health_potion', 3)
+            GameManager.add_item_to_inventory(character, 'rusty_sword', 1)
+            GameManager.add_item_to_inventory(character, 'cloth_armor', 1)
 
         logger.info(f"Character created: {name} (User: {current_user.username})")
 
         return jsonify({
             'success': True,
-            'character': character.to_dict(),
+            'character': load_character(character).to_dict(),
             'message': f'角色 {name} 创建成功！'
         })
 
@@ -286,7 +310,7 @@ def get_character():
 
     return jsonify({
         'success': True,
-        'character': character.to_dict()
+        'character': load_character(character).to_dict()
     })
 
 
@@ -303,7 +327,19 @@ def explore():
             return jsonify({'success': False, 'error': '角色不存在'}), 404
 
         character = current_user.character
-        result = GameManager.explore_location(character)
+        with combat_sessions.lock(character.id):
+            # An unfinished fight has to be resolved first
+            combat_state = combat_sessions.get(character.id)
+            if combat_state:
+                return jsonify({
+                    'success': True,
+                    'result': {'type': 'combat', 'combat_state': public_state(combat_state), 'message': '战斗尚未结束！'}
+                })
+
+            result = GameManager.explore_location(character)
+            if result['type'] == 'combat':
+                combat_sessions.save(character.id, result['combat_state'])
+                result['combat_state'] = public_state(result['combat_state'])
 
         db.session.commit()
 
@@ -345,64 +381,102 @@ def move_location():
 @app.route('/api/game/locations', methods=['GET'])
 @login_required
 def get_locations():
-    """Get all locations"""
-    return jsonify({
+    """
+    Get all locations
+
+    With ?include=economy, also returns the expected exp / gold / loot tables
+    per location (per exploration) and per enemy (per victory).
+    """
+    response = {
         'success': True,
         'locations': LOCATIONS
-    })
+    }
+    if 'economy' in request.args.get('include', '').split(','):
+        response['economy'] = get_economy_tables()
+    return jsonify(response)
 
 
 # ============================================================================
 # COMBAT ROUTES - 战斗路由
 # ============================================================================
 
+@app.route('/api/combat/state', methods=['GET'])
+@login_required
+def get_combat_state():
+    """Get the character's active combat (e.g. after a page reload)"""
+    if not current_user.character:
+        return jsonify({'success': False, 'error': '角色不存在'}), 404
+
+    state = combat_sessions.get(current_user.character.id)
+    return jsonify({
+        'success': True,
+        'combat_state': public_state(state) if state else None
+    })
+
+
 @app.route('/api/combat/action', methods=['POST'])
 @login_required
 def combat_action():
-    """Execute combat action"""
+    """
+    Execute combat action
+
+    The combat state is kept server-side; the request carries only 'action'
+    (and 'item_id' for use_item) and the response carries only what changed.
+    """
     try:
         if not current_user.character:
             return jsonify({'success': False, 'error': '角色不存在'}), 404
 
         data = request.get_json()
         action = data.get('action')
-        combat_state = data.get('combat_state')
-
         character = current_user.character
 
-        # Execute action
-        if action == 'attack':
-            result = CombatManager.player_attack(combat_state, character)
-        elif action == 'defend':
-            result = CombatManager.player_defend(combat_state, character)
-        elif action == 'flee':
-            success, result = CombatManager.attempt_flee(combat_state)
-        elif action == 'use_item':
-            item_id = data.get('item_id')
-            if not item_id:
-                return jsonify({'success': False, 'error': '请选择物品'}), 400
-
-            # Remove item from inventory
-            if GameManager.remove_item_from_inventory(character, item_id):
-                result = CombatManager.player_use_item(combat_state, character, item_id)
-            else:
-                return jsonify({'success': False, 'error': '物品不足'}), 400
-        else:
-            return jsonify({'success': False, 'error': '无效的行动'}), 400
-
-        # Save changes
-        db.session.commit()
-
-        # Add loot if combat ended victoriously
-        if not result.get('active') and result.get('victory'):
-            if 'loot' in result:
-                for item_id in result['loot']:
-                    GameManager.add_item_to_inventory(character, item_id)
+        with combat_sessions.lock(character.id):
+            combat_state = combat_sessions.get(character.id)
+            if not combat_state:
+                return jsonify({'success': False, 'error': '没有进行中的战斗'}), 404
+            before = snapshot(combat_state)
+
+            # Inventory changes, loot and the replay record commit together
+            with unit_of_work():
+                item_id = None
+                if action == 'use_item':
+                    item_id = data.get('item_id')
+                    if not item_id:
+                        return jsonify({'success': False, 'error': '请选择物品'}), 400
+
+                    # Remove item from inventory
+                    if not GameManager.remove_item_from_inventory(character, item_id):
+                        return jsonify({'success': False, 'error': '物品不足'}), 400
+                elif action not in ('attack', 'defend', 'flee'):
+                    return jsonify({'success': False, 'error': '无效的行动'}), 400
+
+                # Execute action
+                result = CombatManager.apply_action(combat_state, character, action, item_id)
+
+                if not result.get('active'):
+                    # Add loot if combat ended victoriously
+                    if result.get('victory') and 'loot' in result:
+                        for loot_id in result['loot']:
+                            GameManager.add_item_to_inventory(character, loot_id)
+
+                    # Keep the replay record (seed + actions) of every finished fight
+                    if 'replay' in result:
+                        event = GameEvent(character_id=character.id, event_type='combat')
+                        event.set_event_data(result['replay'])
+                        db.session.add(event)
+
+            combat_sessions.save(character.id, result)
+
+        # Narration is a slow LLM call; keep it out of the combat lock, which other characters share
+        narration = narrate_combat(result, character)
+        if narration and result.get('active'):
+            combat_sessions.record_narration(character.id, result)
 
         return jsonify({
             'success': True,
-            'combat_state': result,
-            'character': character.to_dict()
+            'combat': combat_delta(before, result),
+            'narration': narration
         })
 
     except Exception as e:
@@ -445,11 +519,9 @@ def equip_item():
         character = current_user.character
         result = GameManager.equip_item(character, item_id)
 
-        db.session.commit()
-
         return jsonify({
             **result,
-            'character': character.to_dict()
+            'character': load_character(character).to_dict()
         })
 
     except Exception as e:
@@ -495,11 +567,9 @@ def buy_item():
         character = current_user.character
         result = GameManager.buy_item(character, item_id, quantity)
 
-        db.session.commit()
-
         return jsonify({
             **result,
-            'character': character.to_dict()
+            'character': load_character(character).to_dict()
         })
 
     except Exception as e:
@@ -552,54 +622,40 @@ def chat():
                 'error': '请先创建角色'
             }), 400
 
-        data = request.get_json()
+        data = request.get_json(silent=True) or {}
         user_message = data.get('message')
-        conversation_history = data.get('conversation_history', [])
+        if not isinstance(user_message, str) or not user_message.strip():
+            return jsonify({
+                'success': False,
+                'error': '请输入消息'
+            }), 400
 
         character = current_user.character
 
-        # Build context for AI
-        context = f"""
-你是一个 RPG 游戏的叙述者。你的任务是根据游戏状态生成生动的剧情描述。
-
-**重要规则：**
-1. 你只能描述发生的事情，不能决定数值
-2. 战斗伤害、经验获得等数值已经由系统计算好
-3. 你需要根据提供的数值生成合适的描述
-4. 为玩家提供可选择的行动选项，但不要捏造这些选项的效果
-5. 保持角色性格：{character.personality}
-
-**当前角色状态：**
-- 姓名：{character.name}
-- 职业：{character.character_class}
-- 等级：{character.level}
-- HP：{character.hp}/{character.max_hp}
-- MP：{character.mp}/{character.max_mp}
-- 位置：{LOCATIONS[character.current_location]['name']}
-- 金币：{character.gold}
-
-**当前任务：**
-{', '.join([q['name'] for q in GameManager.get_active_quests(character)])}
-
-请根据玩家的输入，生成接下来的剧情描述。保持简洁生动。
-"""
+        # Build context for AI (history is kept server-side per character)
+        context = build_narrator_context(character, user_message, history_manager.get(character.id))
 
         # Generate AI response
-        result = gemini_client.generate_response(
-            user_message=user_message,
-            current_scene=character.current_location,
-            conversation_history=conversation_history,
-            system_context=context
-        )
+        with admission_slot(admission, current_user.id, PRIORITY_CHAT):
+            result = gemini_client.generate_response(
+                user_message=user_message,
+                current_scene=character.current_location,
+                system_context=context
+            )
 
         if not result['success']:
             return jsonify(result), 500
 
+        history_manager.record_exchange(character.id, user_message, result['data']['message'])
+
         return jsonify({
             'success': True,
             'data': result['data']
         })
 
+    except AdmissionRejected as e:
+        body, status, headers = rejection_response(e)
+        return jsonify(body), status, headers
     except Exception as e:
         logger.error(f"Chat error: {e}", exc_info=True)
         return jsonify({
@@ -608,6 +664,50 @@ def chat():
         }), 500
 
 
+def narrate_combat(combat_state, character):
+    """
+    Narrate the encounter's pending log lines if a batch is due
+
+    Returns:
+        List of {'seq', 'text'} segments (empty when nothing is due or narration is unavailable)
+    """
+    if not combat_narrator:
+        return []
+    try:
+        # Combat goes ahead of queued chat; the per-account chat rate limit does not apply
+        with admission_slot(admission, None, PRIORITY_COMBAT):
+            return combat_narrator.narrate(combat_state, character)
+    except AdmissionRejected as e:
+        logger.info(f"Combat narration skipped: {e.reason}")
+        return []
+
+
+def build_narrator_context(character, user_message, history=None):
+    """
+    Build the AI narrator prompt for the character's current game state
+
+    Args:
+        character: Player character
+        user_message: Player input
+        history: ConversationHistory of earlier narrator turns
+    """
+    return PROMPT_TEMPLATES['rpg_narrator'].render(
+        name=character.name,
+        personality=character.personality,
+        character_class=character.character_class,
+        level=character.level,
+        hp=character.hp,
+        max_hp=character.max_hp,
+        mp=character.mp,
+        max_mp=character.max_mp,
+        location=LOCATIONS[character.current_location]['name'],
+        gold=character.gold,
+        quests=', '.join([q['name'] for q in GameManager.get_active_quests(character)]),
+        history=history.render() if history else '',
+        user_message=user_message
+    )
+
+
 # ============================================================================
 # BASIC ROUTES - 基础路由
 # ============================================================================
@@ -653,7 +753,20 @@ def health_check():
     """Health check"""
     return jsonify({
         'status': 'ok',
-        'gemini_configured': gemini_client is not None
+        'gemini_configured': gemini_client is not None,
+        'http_pool': gemini_client.get_pool_stats() if gemini_client else {},
+        'response_cache': gemini_client.get_cache_stats() if gemini_client else {'enabled': False},
+        'coalescing': gemini_client.get_coalescing_stats() if gemini_client else {'enabled': False},
+        'context_cache': gemini_client.get_context_cache_stats() if gemini_client else {'enabled': False},
+        'resilience': gemini_client.get_resilience_stats() if gemini_client else {},
+        'providers': gemini_client.get_router_stats() if gemini_client else {},
+        'admission': admission.stats() if admission else {'enabled': False},
+        'combat_narration': combat_narrator.stats() if combat_narrator else {'enabled': False},
+        'combat_sessions': combat_sessions.stats(),
+        'database': database_stats(app, db),
+        'migrations': migration_summary(db.engine),
+        'prompts': get_prompt_stats(),
+        'history': history_manager.stats()
     })
 
 
@@ -662,9 +775,10 @@ def health_check():
 # ============================================================================
 
 def init_database():
-    """Initialize database"""
+    """Initialize database: create missing tables, then apply schema migrations (MIGRATIONS_ON_STARTUP)"""
     with app.app_context():
         db.create_all()
+        migrate_on_startup(db.engine)
         logger.info("Database initialized")
 
 
@@ -0,0 +1,175 @@
+"""
+ASGI entry point for the scene chat app (app.py)
+場景對話應用的 ASGI 入口
+
+The LLM-bound chat endpoints run as async handlers on the event loop, so a
+request waiting on Gemini no longer occupies a worker thread. Every other route
+is served by the unchanged Flask app, mounted as WSGI.
+
+Run with:
+    uvicorn asgi:app --host 127.0.0.1 --port 5000
+"""
+
+import logging
+from contextlib import AsyncExitStack, asynccontextmanager
+
+from a2wsgi import WSGIMiddleware
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.background import BackgroundTask
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Mount, Route
+
+from app import app as flask_app, admission, gemini_client, _chat_session_id, _validate_chat, _prepare_chat, _finish_chat, _sse
+from config import Config
+from utils.admission import PRIORITY_CHAT, AdmissionRejected, admission_async_slot, rejection_response
+from utils.async_llm_client import AsyncGeminiClient
+
+logger = logging.getLogger(__name__)
+
+async_gemini_client = AsyncGeminiClient() if gemini_client else None
+
+
+async def _read_json(request):
+    """Parse the request body, returning None on malformed JSON"""
+    try:
+        return await request.json()
+    except ValueError:
+        return None
+
+
+def _admission_rejected(error):
+    """429/503 response for a chat request turned away by admission control"""
+    body, status, headers = rejection_response(error)
+    logger.info(f"Chat request rejected: {error.reason}")
+    return JSONResponse(body, status_code=status, headers=headers)
+
+
+def _with_session_cookie(response, session_id, is_new):
+    """Set the chat session cookie on a response when the session was just created"""
+    if is_new:
+        response.set_cookie(Config.CHAT_SESSION_COOKIE, session_id, httponly=True, samesite='lax')
+    return response
+
+
+async def chat(request):
+    """Async version of POST /api/chat"""
+    session_id, is_new = _chat_session_id(request.cookies.get(Config.CHAT_SESSION_COOKIE))
+    response = await _chat(request, session_id)
+    return _with_session_cookie(response, session_id, is_new)
+
+
+async def _chat(request, session_id):
+    try:
+        data = await _read_json(request)
+        # Invalid requests are answered before they take a rate token or a slot
+        error = _validate_chat(data)
+        if error:
+            return JSONResponse(error[0], status_code=error[1])
+
+        async with admission_async_slot(admission, session_id, PRIORITY_CHAT):
+            # Status and history stores may be SQLite / Redis: keep their I/O off the event loop
+            prepared, error = await run_in_threadpool(_prepare_chat, data, session_id)
+            if error:
+                return JSONResponse(error[0], status_code=error[1])
+
+            logger.info(f"Processing message in scene: {prepared['current_scene']}")
+            result = await async_gemini_client.generate_response(
+                user_message=prepared['user_message'],
+                current_scene=prepared['current_scene'],
+                conversation_history=prepared['conversation_history']
+            )
+
+            if not result['success']:
+                return JSONResponse(result, status_code=500)
+
+            # MCP commands are simulated synchronously; keep them off the event loop
+            response_data = await run_in_threadpool(_finish_chat, result['data'], prepared)
+
+            return JSONResponse({
+                'success': True,
+                'data': response_data
+            })
+
+    except AdmissionRejected as e:
+        return _admission_rejected(e)
+    except Exception as e:
+        logger.error(f"Error in async chat endpoint: {e}", exc_info=True)
+        return JSONResponse({
+            'success': False,
+            'error': f'Internal server error: {str(e)}'
+        }, status_code=500)
+
+
+async def chat_stream(request):
+    """Async version of POST /api/chat/stream"""
+    session_id, is_new = _chat_session_id(request.cookies.get(Config.CHAT_SESSION_COOKIE))
+
+    data = await _read_json(request)
+    error = _validate_chat(data)
+    if error:
+        return _with_session_cookie(JSONResponse(error[0], status_code=error[1]), session_id, is_new)
+
+    # The slot is held until the stream finishes (or the client disconnects)
+    slot = AsyncExitStack()
+    try:
+        await slot.enter_async_context(admission_async_slot(admission, session_id, PRIORITY_CHAT))
+    except AdmissionRejected as e:
+        return _with_session_cookie(_admission_rejected(e), session_id, is_new)
+
+    try:
+        prepared, error = await run_in_threadpool(_prepare_chat, data, session_id)
+    except Exception:
+        await slot.aclose()
+        raise
+    if error:
+        await slot.aclose()
+        return _with_session_cookie(JSONResponse(error[0], status_code=error[1]), session_id, is_new)
+
+    async def generate():
+        try:
+            async for event in async_gemini_client.stream_response(
+                user_message=prepared['user_message'],
+                current_scene=prepared['current_scene'],
+                conversation_history=prepared['conversation_history']
+            ):
+                if event['event'] == 'delta':
+                    yield _sse('delta', {'text': event['text']})
+                elif event['event'] == 'done':
+                    response_data = await run_in_threadpool(_finish_chat, event['data'], prepared)
+                    yield _sse('done', {'success': True, 'data': response_data})
+                else:
+                    yield _sse('error', {'success': False, 'error': event['error']})
+        except Exception as e:
+            logger.error(f"Error while streaming chat: {e}", exc_info=True)
+            yield _sse('error', {'success': False, 'error': f'Internal server error: {str(e)}'})
+        finally:
+            await slot.aclose()
+
+    response = StreamingResponse(
+        generate(),
+        media_type='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'
+        },
+        background=BackgroundTask(slot.aclose)
+    )
+    return _with_session_cookie(response, session_id, is_new)
+
+
+@asynccontextmanager
+async def lifespan(app):
+    yield
+    if async_gemini_client:
+        await async_gemini_client.aclose()
+
+
+app = Starlette(
+    routes=[
+        Route('/api/chat', chat, methods=['POST']),
+        Route('/api/chat/stream', chat_stream, methods=['POST']),
+        Mount('/', app=WSGIMiddleware(flask_app))
+    ],
+    lifespan=lifespan
+)
@@ -0,0 +1,124 @@
+"""
+ASGI entry point for the RPG app (app_rpg.py)
+RPG 應用的 ASGI 入口
+
+POST /api/chat awaits the Gemini call on the event loop. Loading the logged-in
+character and building the narrator prompt still use Flask-Login and
+SQLAlchemy, so that short step runs in a worker thread inside a Flask request
+context built from the incoming cookies. All game routes (combat, inventory,
+shop, quests) are served by the unchanged Flask app, mounted as WSGI.
+
+Run with:
+    uvicorn asgi_rpg:app --host 127.0.0.1 --port 5000
+"""
+
+import logging
+from contextlib import asynccontextmanager
+
+from a2wsgi import WSGIMiddleware
+from flask_login import current_user
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import JSONResponse
+from starlette.routing import Mount, Route
+
+from app_rpg import app as flask_app, admission, gemini_client, build_narrator_context, history_manager, init_database
+from utils.admission import PRIORITY_CHAT, AdmissionRejected, admission_async_slot, rejection_response
+from utils.async_llm_client import AsyncGeminiClient
+
+logger = logging.getLogger(__name__)
+
+async_gemini_client = AsyncGeminiClient() if gemini_client else None
+
+
+def _prepare_chat(headers, data):
+    """
+    Authenticate the request and build the narrator prompt
+
+    Returns:
+        Tuple of (prepared request dict, None) or (None, (error body, HTTP status))
+    """
+    with flask_app.test_request_context('/api/chat', method='POST', headers=headers):
+        if not current_user.is_authenticated:
+            return None, ({'success': False, 'error': '请先登录'}, 401)
+
+        if not current_user.character:
+            return None, ({'success': False, 'error': '请先创建角色'}, 400)
+
+        user_message = data.get('message')
+        if not isinstance(user_message, str) or not user_message.strip():
+            return None, ({'success': False, 'error': '请输入消息'}, 400)
+
+        character = current_user.character
+        return {
+            'user_message': user_message,
+            'user_id': current_user.id,
+            'character_id': character.id,
+            'current_scene': character.current_location,
+            'context': build_narrator_context(character, user_message, history_manager.get(character.id))
+        }, None
+
+
+async def chat(request):
+    """Async version of POST /api/chat (RPG narrator)"""
+    try:
+        if not async_gemini_client:
+            return JSONResponse({
+                'success': False,
+                'error': 'Gemini API未配置'
+            }, status_code=500)
+
+        try:
+            data = await request.json()
+        except ValueError:
+            data = None
+        headers = {'Cookie': request.headers.get('cookie', '')}
+        prepared, error = await run_in_threadpool(_prepare_chat, headers, data or {})
+        if error:
+            return JSONResponse(error[0], status_code=error[1])
+
+        async with admission_async_slot(admission, prepared['user_id'], PRIORITY_CHAT):
+            result = await async_gemini_client.generate_response(
+                user_message=prepared['user_message'],
+                current_scene=prepared['current_scene'],
+                system_context=prepared['context']
+            )
+
+        if not result['success']:
+            return JSONResponse(result, status_code=500)
+
+        await run_in_threadpool(
+            history_manager.record_exchange, prepared['character_id'], prepared['user_message'], result['data']['message']
+        )
+
+        return JSONResponse({
+            'success': True,
+            'data': result['data']
+        })
+
+    except AdmissionRejected as e:
+        body, status, headers = rejection_response(e)
+        return JSONResponse(body, status_code=status, headers=headers)
+    except Exception as e:
+        logger.error(f"Async chat error: {e}", exc_info=True)
+        return JSONResponse({
+            'success': False,
+            'error': str(e)
+        }, status_code=500)
+
+
+@asynccontextmanager
+async def lifespan(app):
+    await run_in_threadpool(init_database)
+    yield
+    if async_gemini_client:
+        await async_gemini_client.aclose()
+
+
+app = Starlette(
+    routes=[
+        Route('/api/chat', chat, methods=['POST']),
+        Mount('/', app=WSGIMiddleware(flask_app))
+    ],
+    lifespan=lifespan
+)
@@ -19,7 +19,105 @@ class Config:
 
     # Gemini API Configuration
     GEMINI_API_KEY = os.getenv('GEMINI_API_KEY', '')
-    GEMINI_API_URL = 'https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash:generateContent'
+    GEMINI_API_BASE = os.getenv('GEMINI_API_BASE', 'https://generativelanguage.googleapis.com/v1beta')
+    GEMINI_MODEL = os.getenv('GEMINI_MODEL', 'gemini-2.0-flash')
+    GEMINI_API_URL = f'{GEMINI_API_BASE}/models/{GEMINI_MODEL}:generateContent'
+    GEMINI_STREAM_API_URL = f'{GEMINI_API_BASE}/models/{GEMINI_MODEL}:streamGenerateContent?alt=sse'
+    GEMINI_REQUEST_TIMEOUT = float(os.getenv('GEMINI_REQUEST_TIMEOUT', 30))
+    GEMINI_STRUCTURED_OUTPUT = os.getenv('GEMINI_STRUCTURED_OUTPUT', 'True') == 'True'  # JSON mode + response schema for scene chat
+
+    # LLM Providers (tried in latency / error / cost order, failing over to the next one)
+    LLM_PROVIDERS = [name.strip() for name in os.getenv('LLM_PROVIDERS', 'gemini').split(',') if name.strip()]  # gemini, openai, llamacpp
+    GEMINI_COST_WEIGHT = float(os.getenv('GEMINI_COST_WEIGHT', 1.0))  # Relative cost; higher = preferred less
+    OPENAI_API_BASE = os.getenv('OPENAI_API_BASE', 'https://api.openai.com/v1')  # Any OpenAI-compatible server
+    OPENAI_API_KEY = os.getenv('OPENAI_API_KEY', '')
+    OPENAI_MODEL = os.getenv('OPENAI_MODEL', 'gpt-4o-mini')
+    OPENAI_COST_WEIGHT = float(os.getenv('OPENAI_COST_WEIGHT', 1.0))
+    LLAMACPP_API_BASE = os.getenv('LLAMACPP_API_BASE', 'http://127.0.0.1:8080')  # llama.cpp server
+    LLAMACPP_COST_WEIGHT = float(os.getenv('LLAMACPP_COST_WEIGHT', 1.0))
+    LLM_ROUTER_EWMA_ALPHA = float(os.getenv('LLM_ROUTER_EWMA_ALPHA', 0.2))  # Weight of the newest latency / error sample
+    LLM_ROUTER_EXPLORE = float(os.getenv('LLM_ROUTER_EXPLORE', 0.05))  # Chance a request probes a random provider first
+
+    # HTTP Connection Pool (keep-alive connections to the Gemini API)
+    GEMINI_POOL_CONNECTIONS = int(os.getenv('GEMINI_POOL_CONNECTIONS', 4))  # Number of per-host pools
+    GEMINI_POOL_MAXSIZE = int(os.getenv('GEMINI_POOL_MAXSIZE', 32))  # Max connections per host
+    GEMINI_POOL_BLOCK = os.getenv('GEMINI_POOL_BLOCK', 'False') == 'True'  # Wait (up to GEMINI_REQUEST_TIMEOUT) instead of opening overflow connections
+
+    # LLM Response Cache (opt-in; caches raw model output for identical prompts)
+    LLM_CACHE_ENABLED = os.getenv('LLM_CACHE_ENABLED', 'False') == 'True'
+    LLM_CACHE_BACKEND = os.getenv('LLM_CACHE_BACKEND', 'memory')  # memory, redis
+    LLM_CACHE_TTL = float(os.getenv('LLM_CACHE_TTL', 300))  # Seconds
+    LLM_CACHE_MAX_ENTRIES = int(os.getenv('LLM_CACHE_MAX_ENTRIES', 1000))
+    LLM_CACHE_MAX_BYTES = int(os.getenv('LLM_CACHE_MAX_BYTES', 8 * 1024 * 1024))
+    LLM_CACHE_REDIS_URL = os.getenv('LLM_CACHE_REDIS_URL', 'redis://localhost:6379/0')
+
+    # Request Coalescing (identical in-flight prompts share one upstream call)
+    LLM_COALESCE_ENABLED = os.getenv('LLM_COALESCE_ENABLED', 'True') == 'True'
+    LLM_COALESCE_WAIT_TIMEOUT = float(os.getenv('LLM_COALESCE_WAIT_TIMEOUT', 30))  # Max seconds a waiter waits
+
+    # Upstream Resilience (retry with jittered backoff, hedged requests, circuit breaker; applied per provider)
+    GEMINI_RETRY_MAX_ATTEMPTS = int(os.getenv('GEMINI_RETRY_MAX_ATTEMPTS', 3))  # Total tries per call
+    GEMINI_RETRY_BASE_DELAY = float(os.getenv('GEMINI_RETRY_BASE_DELAY', 0.5))  # Seconds
+    GEMINI_RETRY_MAX_DELAY = float(os.getenv('GEMINI_RETRY_MAX_DELAY', 8))  # Cap per backoff / Retry-After
+    GEMINI_RETRY_DEADLINE = float(os.getenv('GEMINI_RETRY_DEADLINE', 20))  # No new retry after this many seconds
+    GEMINI_HEDGE_ENABLED = os.getenv('GEMINI_HEDGE_ENABLED', 'False') == 'True'
+    GEMINI_HEDGE_PERCENTILE = float(os.getenv('GEMINI_HEDGE_PERCENTILE', 0.95))
+    GEMINI_HEDGE_MIN_SAMPLES = int(os.getenv('GEMINI_HEDGE_MIN_SAMPLES', 20))
+    GEMINI_HEDGE_MIN_DELAY = float(os.getenv('GEMINI_HEDGE_MIN_DELAY', 0.5))  # Seconds
+    GEMINI_BREAKER_FAILURE_THRESHOLD = int(os.getenv('GEMINI_BREAKER_FAILURE_THRESHOLD', 5))  # Consecutive failed calls
+    GEMINI_BREAKER_RECOVERY_TIMEOUT = float(os.getenv('GEMINI_BREAKER_RECOVERY_TIMEOUT', 30))  # Seconds open
+
+    # Upstream Context Cache (opt-in; registers static prompt prefixes via the cachedContents API)
+    GEMINI_CONTEXT_CACHE_ENABLED = os.getenv('GEMINI_CONTEXT_CACHE_ENABLED', 'False') == 'True'
+    GEMINI_CONTEXT_CACHE_TTL = int(os.getenv('GEMINI_CONTEXT_CACHE_TTL', 3600))  # Seconds
+    GEMINI_CONTEXT_CACHE_REFRESH_MARGIN = int(os.getenv('GEMINI_CONTEXT_CACHE_REFRESH_MARGIN', 300))  # Extend TTL this long before expiry
+    GEMINI_CONTEXT_CACHE_MIN_TOKENS = int(os.getenv('GEMINI_CONTEXT_CACHE_MIN_TOKENS', 1024))  # Model's minimum cacheable size
+    GEMINI_CONTEXT_CACHE_RETRY_AFTER = int(os.getenv('GEMINI_CONTEXT_CACHE_RETRY_AFTER', 600))  # Inline for this long after a failure
+
+    # Conversation History (server-side rolling summary plus recent turns)
+    HISTORY_TOKEN_BUDGET = int(os.getenv('HISTORY_TOKEN_BUDGET', 800))  # Estimated tokens for summary + turns
+    HISTORY_KEEP_TURNS = int(os.getenv('HISTORY_KEEP_TURNS', 6))  # Turns kept verbatim
+    HISTORY_SUMMARY_MAX_TOKENS = int(os.getenv('HISTORY_SUMMARY_MAX_TOKENS', 200))
+    CHAT_SESSION_COOKIE = 'chat_session'
+
+    # Session Store (server-side chat history and status)
+    SESSION_STORE_BACKEND = os.getenv('SESSION_STORE_BACKEND', 'memory')  # memory, sqlite, redis
+    SESSION_STORE_TTL = float(os.getenv('SESSION_STORE_TTL', 7 * 24 * 3600))  # Seconds after last write
+    SESSION_STORE_MAX_SESSIONS = int(os.getenv('SESSION_STORE_MAX_SESSIONS', 10000))  # Memory backend only
+    SESSION_STORE_SQLITE_PATH = os.getenv('SESSION_STORE_SQLITE_PATH', 'sessions.db')
+    SESSION_STORE_REDIS_URL = os.getenv('SESSION_STORE_REDIS_URL', 'redis://localhost:6379/0')
+
+    # Combat Sessions (server-authoritative combat state, keyed by character)
+    COMBAT_SESSION_BACKEND = os.getenv('COMBAT_SESSION_BACKEND', 'memory')  # memory, sqlite (SESSION_STORE_SQLITE_PATH), redis
+    COMBAT_SESSION_TTL = float(os.getenv('COMBAT_SESSION_TTL', 1800))  # Seconds an idle fight is kept
+    COMBAT_LOG_CAPACITY = int(os.getenv('COMBAT_LOG_CAPACITY', 50))  # Log entries kept per fight (oldest overwritten)
+
+    # Database (RPG app)
+    DATABASE_URL = os.getenv('DATABASE_URL', 'sqlite:///game.db')  # Relative SQLite paths live in the instance folder
+    DB_PROFILE = os.getenv('DB_PROFILE', 'development')  # development (SQLite defaults), production (WAL, tuned pragmas)
+    DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE')) if os.getenv('DB_POOL_SIZE') else None  # Override the profile's pool size
+    DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW')) if os.getenv('DB_MAX_OVERFLOW') else None
+    DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT')) if os.getenv('DB_POOL_TIMEOUT') else None  # Seconds to wait for a pooled connection
+    DB_BUSY_TIMEOUT = int(os.getenv('DB_BUSY_TIMEOUT')) if os.getenv('DB_BUSY_TIMEOUT') else None  # Milliseconds to wait for a SQLite lock
+    EQUIPMENT_LOADING = os.getenv('EQUIPMENT_LOADING', 'joined')  # How Character loads equipped items: joined, selectin, select (lazy)
+    MIGRATIONS_ON_STARTUP = os.getenv('MIGRATIONS_ON_STARTUP', 'sync')  # sync, background (backfills in a thread), off (tools/migrate.py)
+    MIGRATION_BATCH_SIZE = int(os.getenv('MIGRATION_BATCH_SIZE', 1000))  # Rows per backfill transaction
+    MIGRATION_BATCH_PAUSE = float(os.getenv('MIGRATION_BATCH_PAUSE', 0.05))  # Seconds between backfill batches
+    MIGRATION_LOCK_TTL = float(os.getenv('MIGRATION_LOCK_TTL', 60))  # Seconds before a stalled migration's lease can be taken over
+
+    # Admission Control (per-user rate limit, global concurrency limit, priority queue for LLM calls)
+    ADMISSION_ENABLED = os.getenv('ADMISSION_ENABLED', 'True') == 'True'
+    ADMISSION_MAX_CONCURRENT = int(os.getenv('ADMISSION_MAX_CONCURRENT', 16))  # Upstream calls at once
+    ADMISSION_QUEUE_SIZE = int(os.getenv('ADMISSION_QUEUE_SIZE', 64))  # Requests waiting for a slot
+    ADMISSION_QUEUE_TIMEOUT = float(os.getenv('ADMISSION_QUEUE_TIMEOUT', 10))  # Seconds before a queued request is rejected
+    ADMISSION_USER_RATE = float(os.getenv('ADMISSION_USER_RATE', 0.5))  # Sustained requests/second per user (0 = unlimited)
+    ADMISSION_USER_BURST = float(os.getenv('ADMISSION_USER_BURST', 5))  # Back-to-back requests per user
+    ADMISSION_MAX_TRACKED_USERS = int(os.getenv('ADMISSION_MAX_TRACKED_USERS', 10000))
+
+    # Combat Narration (pending combat log lines narrated in one batched Gemini call)
+    COMBAT_NARRATION_ENABLED = os.getenv('COMBAT_NARRATION_ENABLED', 'True') == 'True'
+    COMBAT_NARRATION_CADENCE = int(os.getenv('COMBAT_NARRATION_CADENCE', 0))  # Also narrate every N turns (0 = only at encounter end)
+    COMBAT_NARRATION_MAX_LINES = int(os.getenv('COMBAT_NARRATION_MAX_LINES', 40))  # Log lines per batch
 
     # CORS Configuration
     CORS_ORIGINS = ['http://localhost:5000', 'http://127.0.0.1:5000']
@@ -30,6 +128,8 @@ class Config:
     @staticmethod
     def validate():
         """Validate required configuration"""
-        if not Config.GEMINI_API_KEY:
+        if not Config.LLM_PROVIDERS:
+            raise ValueError("LLM_PROVIDERS is empty")
+        if 'gemini' in Config.LLM_PROVIDERS and not Config.GEMINI_API_KEY:
             raise ValueError("GEMINI_API_KEY is not set in environment variables")
         return True
@@ -1,12 +1,48 @@
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
+from sqlalchemy import inspect
+from sqlalchemy.orm import joinedload, selectinload
 from werkzeug.security import generate_password_hash, check_password_hash
+from contextlib import contextmanager
 from datetime import datetime
 import json
 
+from config import Config
+
 db = SQLAlchemy()
 
 
+@contextmanager
+def unit_of_work():
+    """
+    Run one game action as a single transaction
+
+    Changes made inside the block (by routes and GameManager helpers alike) are
+    flushed and committed once when the outermost block exits, or rolled back
+    if it raises. Nested blocks join the enclosing transaction, so a helper
+    that opens its own unit commits on its own when called standalone but
+    not when called from a route's unit.
+
+    Usage:
+        with unit_of_work():
+            GameManager.buy_item(character, 'health_potion')
+            GameManager.equip_item(character, item_id)
+    """
+    info = db.session.info
+    depth = info.get('unit_of_work_depth', 0)
+    info['unit_of_work_depth'] = depth + 1
+    try:
+        yield db.session
+        if depth == 0:
+            db.session.commit()
+    except BaseException:
+        if depth == 0:
+            db.session.rollback()
+        raise
+    finally:
+        info['unit_of_work_depth'] = depth
+
+
 class User(UserMixin, db.Model):
     """User account model"""
     __tablename__ = 'users'
@@ -37,7 +73,7 @@ class Character(db.Model):
     __tablename__ = 'characters'
 
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)  # current_user.character
 
     # Basic info
     name = db.Column(db.String(80), nullable=False)
@@ -73,10 +109,20 @@ class Character(db.Model):
                                backref='owner',
                                cascade='all, delete-orphan')
     quest_progress = db.relationship('QuestProgress', backref='character', cascade='all, delete-orphan')
-
-    def to_dict(self):
-        """Convert character to dictionary"""
-        return {
+    # Equipped items; post_update breaks the characters <-> inventory_items foreign key cycle
+    equipped_weapon = db.relationship('InventoryItem', foreign_keys=[equipped_weapon_id],
+                                      post_update=True, lazy=Config.EQUIPMENT_LOADING)
+    equipped_armor = db.relationship('InventoryItem', foreign_keys=[equipped_armor_id],
+                                     post_update=True, lazy=Config.EQUIPMENT_LOADING)
+
+    def to_dict(self, include_inventory=False):
+        """
+        Convert character to dictionary
+
+        Args:
+            include_inventory: Also serialize the inventory (load it with load_character to avoid a query)
+        """
+        data = {
             'id': self.id,
             'name': self.name,
             'personality': self.personality,
@@ -95,20 +141,17 @@ class Character(db.Model):
             'equipped_weapon': self.get_equipped_weapon(),
             'equipped_armor': self.get_equipped_armor()
         }
+        if include_inventory:
+            data['inventory'] = [item.to_dict() for item in self.inventory]
+        return data
 
     def get_equipped_weapon(self):
         """Get equipped weapon details"""
-        if self.equipped_weapon_id:
-            weapon = InventoryItem.query.get(self.equipped_weapon_id)
-            return weapon.to_dict() if weapon else None
-        return None
+        return self.equipped_weapon.to_dict() if self.equipped_weapon else None
 
     def get_equipped_armor(self):
         """Get equipped armor details"""
-        if self.equipped_armor_id:
-            armor = InventoryItem.query.get(self.equipped_armor_id)
-            return armor.to_dict() if armor else None
-        return None
+        return self.equipped_armor.to_dict() if self.equipped_armor else None
 
     def gain_experience(self, amount):
         """Add experience and handle level ups"""
@@ -131,21 +174,12 @@ class Character(db.Model):
         self.experience -= self.experience_needed()
 
         # Stat increases based on class
-        if self.character_class == '战士':
-            self.max_hp += 15
-            self.max_mp += 3
-            self.attack += 3
-            self.defense += 2
-        elif self.character_class == '法师':
-            self.max_hp += 8
-            self.max_mp += 10
-            self.attack += 2
-            self.defense += 1
-        elif self.character_class == '游侠':
-            self.max_hp += 12
-            self.max_mp += 5
-            self.attack += 2
-            self.defense += 2
+        from utils.game_data import CHARACTER_CLASSES
+        growth = CHARACTER_CLASSES.get(self.character_class, {}).get('growth', {})
+        self.max_hp += growth.get('max_hp', 0)
+        self.max_mp += growth.get('max_mp', 0)
+        self.attack += growth.get('attack', 0)
+        self.defense += growth.get('defense', 0)
 
         # Restore HP and MP
         self.hp = self.max_hp
@@ -177,6 +211,10 @@ class Character(db.Model):
 class InventoryItem(db.Model):
     """Player inventory item"""
     __tablename__ = 'inventory_items'
+    __table_args__ = (
+        # Inventory listing and stack lookup: filter_by(character_id=..., item_id=...)
+        db.Index('ix_inventory_items_character_item', 'character_id', 'item_id'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     character_id = db.Column(db.Integer, db.ForeignKey('characters.id'), nullable=False)
@@ -191,12 +229,13 @@ class InventoryItem(db.Model):
         from utils.game_data import ITEMS
         item_data = ITEMS.get(self.item_id, {})
 
+        # Row fields go last: ITEMS entries carry their own 'id' (the item id)
         return {
+            **item_data,
             'id': self.id,
             'item_id': self.item_id,
             'quantity': self.quantity,
-            'is_equipped': self.is_equipped,
-            **item_data
+            'is_equipped': self.is_equipped
         }
 
     def __repr__(self):
@@ -206,6 +245,10 @@ class InventoryItem(db.Model):
 class QuestProgress(db.Model):
     """Quest progress tracking"""
     __tablename__ = 'quest_progress'
+    __table_args__ = (
+        # filter_by(character_id=..., quest_id=...[, status=...]); its prefix serves character_id + status
+        db.Index('ix_quest_progress_character_quest_status', 'character_id', 'quest_id', 'status'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     character_id = db.Column(db.Integer, db.ForeignKey('characters.id'), nullable=False)
@@ -236,6 +279,10 @@ class QuestProgress(db.Model):
 class GameEvent(db.Model):
     """Game event log for story tracking"""
     __tablename__ = 'game_events'
+    __table_args__ = (
+        # Per-character timeline, newest first
+        db.Index('ix_game_events_character_timestamp', 'character_id', 'timestamp'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     character_id = db.Column(db.Integer, db.ForeignKey('characters.id'), nullable=False)
@@ -254,5 +301,36 @@ class GameEvent(db.Model):
         """Set event data from dict"""
         self.event_data = json.dumps(data)
 
+    @staticmethod
+    def timeline(character_id, event_type=None, limit=50):
+        """A character's most recent events, newest first"""
+        query = GameEvent.query.filter_by(character_id=character_id)
+        if event_type:
+            query = query.filter_by(event_type=event_type)
+        return query.order_by(GameEvent.timestamp.desc()).limit(limit).all()
+
     def __repr__(self):
         return f'<GameEvent {self.event_type}>'
+
+
+def load_character(character, with_inventory=False):
+    """
+    Load a character with its equipment (and optionally inventory) for serialization
+
+    One query (equipment joined), plus one for the inventory. Objects already in
+    the session, e.g. expired by a commit, are refreshed in place, so to_dict()
+    afterwards issues no further queries.
+
+    Args:
+        character: Character ID, or a Character instance (read by identity, so an
+            instance expired by a commit is not refreshed just to get its ID)
+        with_inventory: Also load the inventory
+
+    Returns:
+        Character instance or None
+    """
+    character_id = inspect(character).identity[0] if isinstance(character, Character) else character
+    options = [joinedload(Character.equipped_weapon), joinedload(Character.equipped_armor)]
+    if with_inventory:
+        options.append(selectinload(Character.inventory))
+    return Character.query.options(*options).populate_existing().filter_by(id=character_id).first()
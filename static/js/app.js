@@ -31,9 +31,7 @@ createApp({
             // LocalStorage keys
             STORAGE_KEYS: {
                 MESSAGES: 'flask_llm_messages',
-                CURRENT_SCENE: 'flask_llm_current_scene',
-                STATUS: 'flask_llm_status',
-                LAST_UPDATE: 'flask_llm_last_update'
+                CURRENT_SCENE: 'flask_llm_current_scene'
             }
         };
     },
@@ -46,14 +44,6 @@ createApp({
 
         currentEmojiPath() {
             return `/static/images/emoji/${this.currentEmoji}`;
-        },
-
-        conversationHistory() {
-            // Get last 10 messages for context
-            return this.messages.slice(-10).map(msg => ({
-                role: msg.role,
-                message: msg.content
-            }));
         }
     },
 
@@ -72,8 +62,8 @@ createApp({
             // Load conversation history from localStorage
             this.loadConversationHistory();
 
-            // Load status values from localStorage
-            this.loadStatus();
+            // Load status values from the server
+            await this.loadStatus();
 
             // Load last scene from localStorage or use default
             const savedSceneId = localStorage.getItem(this.STORAGE_KEYS.CURRENT_SCENE);
@@ -147,6 +137,10 @@ createApp({
             if (confirm('確定要清除所有對話記錄嗎？')) {
                 this.messages = [];
                 localStorage.removeItem(this.STORAGE_KEYS.MESSAGES);
+                // The AI's context is kept server-side; forget it too
+                fetch('/api/chat/history', { method: 'DELETE' }).catch(error => {
+                    console.error('Error clearing server history:', error);
+                });
                 console.log('Conversation history cleared');
             }
         },
@@ -165,55 +159,115 @@ createApp({
             this.addMessage('user', userMessage);
 
             try {
-                // Send to API with status values
-                const response = await fetch('/api/chat', {
+                // Send to API, streaming the reply (history and status are kept server-side)
+                const response = await fetch('/api/chat/stream', {
                     method: 'POST',
                     headers: {
                         'Content-Type': 'application/json'
                     },
                     body: JSON.stringify({
                         message: userMessage,
-                        current_scene: this.currentScene.id,
-                        conversation_history: this.conversationHistory,
-                        status: this.status
+                        current_scene: this.currentScene.id
                     })
                 });
 
-                const data = await response.json();
+                const contentType = response.headers.get('Content-Type') || '';
+                if (!response.body || !contentType.includes('text/event-stream')) {
+                    // Validation errors come back as plain JSON
+                    const data = await response.json();
+                    this.showError(data.error || 'Failed to get response from AI');
+                    return;
+                }
 
-                if (data.success) {
-                    const aiResponse = data.data;
+                await this.readChatStream(response);
 
-                    // Update status values from API
-                    if (aiResponse.status) {
-                        this.updateStatusFromAPI(aiResponse.status);
-                    }
+            } catch (error) {
+                console.error('Error sending message:', error);
+                this.showError('Network error. Please check your connection and try again.');
+            } finally {
+                this.isLoading = false;
+            }
+        },
 
-                    // Update emoji
-                    if (aiResponse.emoji) {
-                        this.currentEmoji = aiResponse.emoji;
+        async readChatStream(response) {
+            const reader = response.body.getReader();
+            const decoder = new TextDecoder('utf-8');
+            let buffer = '';
+            let streamingMessage = null;
+
+            while (true) {
+                const { value, done } = await reader.read();
+                if (done) break;
+
+                buffer += decoder.decode(value, { stream: true });
+
+                // SSE frames are separated by a blank line
+                let boundary;
+                while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                    const frame = buffer.slice(0, boundary);
+                    buffer = buffer.slice(boundary + 2);
+
+                    let eventName = 'message';
+                    let dataText = '';
+                    for (const line of frame.split('\n')) {
+                        if (line.startsWith('event:')) {
+                            eventName = line.slice(6).trim();
+                        } else if (line.startsWith('data:')) {
+                            dataText += line.slice(5).trim();
+                        }
                     }
+                    if (!dataText) continue;
+                    const payload = JSON.parse(dataText);
 
-                    // Switch scene if suggested
-                    if (aiResponse.scene && aiResponse.scene !== this.currentScene.id) {
-                        const newScene = this.scenes.find(s => s.id === aiResponse.scene);
-                        if (newScene) {
-                            this.setScene(aiResponse.scene);
+                    if (eventName === 'delta') {
+                        if (!streamingMessage) {
+                            this.isLoading = false;
+                            streamingMessage = this.addMessage('assistant', '');
+                        }
+                        streamingMessage.content += payload.text;
+                        this.$nextTick(() => {
+                            this.scrollToBottom();
+                        });
+                    } else if (eventName === 'done') {
+                        this.applyAIResponse(payload.data, streamingMessage);
+                    } else if (eventName === 'error') {
+                        if (streamingMessage) {
+                            this.messages.splice(this.messages.indexOf(streamingMessage), 1);
+                            this.saveConversationHistory();
                         }
+                        this.showError(payload.error || 'Failed to get response from AI');
                     }
+                }
+            }
+        },
 
-                    // Add AI response to chat
-                    this.addMessage('assistant', aiResponse.message, aiResponse.mcp_output);
+        applyAIResponse(aiResponse, streamingMessage = null) {
+            // Update status values from API
+            if (aiResponse.status) {
+                this.updateStatusFromAPI(aiResponse.status);
+            }
 
-                } else {
-                    this.showError(data.error || 'Failed to get response from AI');
+            // Update emoji
+            if (aiResponse.emoji) {
+                this.currentEmoji = aiResponse.emoji;
+            }
+
+            // Switch scene if suggested
+            if (aiResponse.scene && aiResponse.scene !== this.currentScene.id) {
+                const newScene = this.scenes.find(s => s.id === aiResponse.scene);
+                if (newScene) {
+                    this.setScene(aiResponse.scene);
                 }
+            }
 
-            } catch (error) {
-                console.error('Error sending message:', error);
-                this.showError('Network error. Please check your connection and try again.');
-            } finally {
-                this.isLoading = false;
+            if (streamingMessage) {
+                // Replace streamed text with the final parsed message
+                streamingMessage.content = aiResponse.message;
+                streamingMessage.mcpOutput = aiResponse.mcp_output || null;
+                this.saveConversationHistory();
+            } else {
+                // Add AI response to chat
+                this.addMessage('assistant', aiResponse.message, aiResponse.mcp_output);
             }
         },
 
@@ -235,6 +289,9 @@ createApp({
             this.$nextTick(() => {
                 this.scrollToBottom();
             });
+
+            // Return the reactive entry so streamed text can be appended to it
+            return this.messages[this.messages.length - 1];
         },
 
         scrollToBottom() {
@@ -260,38 +317,20 @@ createApp({
 
         // ===== Status Management Methods =====
 
-        loadStatus() {
+        async loadStatus() {
             try {
-                const saved = localStorage.getItem(this.STORAGE_KEYS.STATUS);
-                const lastUpdate = localStorage.getItem(this.STORAGE_KEYS.LAST_UPDATE);
-
-                if (saved) {
-                    this.status = JSON.parse(saved);
-
-                    // Apply time decay if time has passed
-                    if (lastUpdate) {
-                        const minutesElapsed = (Date.now() - parseInt(lastUpdate)) / 60000;
-                        if (minutesElapsed > 0) {
-                            this.applyTimeDecay(minutesElapsed);
-                        }
-                    }
+                // The server applies time decay since the last interaction
+                const response = await fetch('/api/status');
+                const data = await response.json();
 
-                    console.log('Loaded status values:', this.status);
+                if (data.success) {
+                    this.updateStatusFromAPI(data.status);
                 }
             } catch (error) {
                 console.error('Error loading status:', error);
             }
         },
 
-        saveStatus() {
-            try {
-                localStorage.setItem(this.STORAGE_KEYS.STATUS, JSON.stringify(this.status));
-                localStorage.setItem(this.STORAGE_KEYS.LAST_UPDATE, Date.now().toString());
-            } catch (error) {
-                console.error('Error saving status:', error);
-            }
-        },
-
         applyTimeDecay(minutes) {
             // Decay rates per minute (matching backend)
             const decayRates = {
@@ -310,10 +349,9 @@ createApp({
         },
 
         startStatusDecay() {
-            // Update status every 30 seconds
+            // Update displayed status every 30 seconds (the server tracks the real values)
             this.statusUpdateInterval = setInterval(() => {
                 this.applyTimeDecay(0.5); // 30 seconds = 0.5 minutes
-                this.saveStatus();
             }, 30000);
 
             console.log('Status decay timer started');
@@ -322,7 +360,6 @@ createApp({
         updateStatusFromAPI(statusData) {
             if (statusData && statusData.values) {
                 this.status = statusData.values;
-                this.saveStatus();
                 console.log('Status updated from API:', this.status);
             }
         },
@@ -128,23 +128,59 @@ createApp({
                 console.error('Move error:', error);
             }
         },
-        async doCombatAction(action) {
+        async loadCombat() {
+            try {
+                const res = await fetch('/api/combat/state', { credentials: 'include' });
+                const data = await res.json();
+                if (data.success) {
+                    this.combatState = data.combat_state;
+                }
+            } catch (error) {
+                console.error('Load combat error:', error);
+            }
+        },
+        applyCombatDelta(delta) {
+            // The server keeps the combat state and returns only what changed
+            const state = this.combatState;
+            state.log.push(...delta.log);
+            if (state.log.length > state.log_capacity) {
+                state.log.splice(0, state.log.length - state.log_capacity);
+            }
+            Object.assign(state.enemy, delta.enemy || {});
+            Object.assign(state.character, delta.character || {});
+            for (const [key, value] of Object.entries(delta)) {
+                if (!['log', 'log_start', 'enemy', 'character'].includes(key)) {
+                    state[key] = value;
+                }
+            }
+            if (this.character && delta.character) {
+                if ('hp' in delta.character) this.character.hp = delta.character.hp;
+                if ('mp' in delta.character) this.character.mp = delta.character.mp;
+            }
+        },
+        async doCombatAction(action, itemId = null) {
             this.isLoading = true;
             try {
+                const body = { action: action };
+                if (itemId) {
+                    body.item_id = itemId;
+                }
                 const res = await fetch('/api/combat/action', {
                     method: 'POST',
                     credentials: 'include',
                     headers: { 'Content-Type': 'application/json' },
-                    body: JSON.stringify({
-                        action: action,
-                        combat_state: this.combatState
-                    })
+                    body: JSON.stringify(body)
                 });
                 const data = await res.json();
                 if (data.success) {
-                    this.combatState = data.combat_state;
-                    this.character = data.character;
-                    
+                    this.applyCombatDelta(data.combat);
+                    if (data.narration && data.narration.length) {
+                        this.messages.push({
+                            role: 'assistant',
+                            content: data.narration.map(segment => segment.text).join('\n')
+                        });
+                    }
+
                     if (!this.combatState.active) {
                         setTimeout(() => {
                             alert(this.combatState.victory ? '战斗胜利！' : '战斗失败！');
@@ -153,6 +189,9 @@ createApp({
                             this.loadInventory();
                         }, 1000);
                     }
+                } else if (res.status === 404) {
+                    // The fight expired or ended elsewhere
+                    this.combatState = null;
                 }
             } catch (error) {
                 console.error('Combat action error:', error);
@@ -162,8 +201,8 @@ createApp({
         },
         async useItemInCombat(itemId) {
             this.showItemSelection = false;
-            await this.doCombatAction('use_item');
-            // Note: Would need to pass item_id properly
+            await this.doCombatAction('use_item', itemId);
+            this.loadInventory();
         },
         async equipItem(item) {
             if (item.type !== 'weapon' && item.type !== 'armor') {
@@ -219,8 +258,7 @@ createApp({
                     credentials: 'include',
                     headers: { 'Content-Type': 'application/json' },
                     body: JSON.stringify({
-                        message: userMsg,
-                        conversation_history: this.messages.slice(-10)
+                        message: userMsg
                     })
                 });
                 const data = await res.json();
@@ -249,5 +287,6 @@ createApp({
         this.loadShop();
         this.loadLocations();
         this.loadQuests();
+        this.loadCombat();
     }
 }).mount('#app');
@@ -0,0 +1,28 @@
+"""
+Hot ORM queries must be served by an index
+热点查询必须走索引
+
+Same check as tools/check_query_plans.py, against a scratch schema built from
+the models, so a dropped or mismatched index fails the test suite.
+"""
+
+import pytest
+from sqlalchemy import create_engine
+
+from models import db
+from tools.check_query_plans import HOT_QUERIES
+from utils.database import explain_query_plan, unindexed_steps
+
+
+@pytest.fixture(scope='module')
+def engine():
+    engine = create_engine('sqlite://')
+    db.metadata.create_all(engine)
+    yield engine
+    engine.dispose()
+
+
+@pytest.mark.parametrize('name', list(HOT_QUERIES))
+def test_hot_query_uses_index(engine, name):
+    plan = explain_query_plan(engine, HOT_QUERIES[name])
+    assert unindexed_steps(plan) == [], f'{name}: {plan}'
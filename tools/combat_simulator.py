@@ -0,0 +1,439 @@
+"""
+Vectorized Monte Carlo combat simulator for balance analysis
+向量化蒙地卡羅戰鬥模擬器（數值平衡分析用）
+
+Runs many fights per matchup (class x personality x level x equipment versus
+an ENEMIES entry) as batched NumPy arrays, one array element per fight, and
+reports win rate, turns-to-kill and per-fight experience / gold.
+
+The turn logic mirrors CombatManager step by step (player attack, enemy
+special ability or attack, boss phases, Character.take_damage) and reads every
+number from utils/game_data.py: COMBAT_RULES, CHARACTER_CLASSES (base stats and
+per-level growth), PERSONALITY_TEMPLATES, ITEMS and ENEMIES. A balance change
+there is picked up on the next run. --verify replays fights through the real
+CombatManager and Character model and compares win rates.
+
+One seed drives a run: the NumPy generator is seeded with it and each
+reference fight gets the stream derive_seed(seed, index) (utils/rng.py), so the
+same command line always prints the same numbers. Without --seed a fresh seed
+is drawn and printed.
+
+The simulated player attacks every turn, starts at full HP and uses no items.
+
+Requires numpy (pip install -r requirements-tools.txt).
+
+Usage:
+    python tools/combat_simulator.py --levels 1-10 --enemies slime,goblin,wolf --fights 100000
+    python tools/combat_simulator.py --classes warrior --personalities brave --levels 15 \\
+        --weapons legendary_sword --armors legendary_armor --enemies demon_lord --fights 1000000
+    python tools/combat_simulator.py --levels 5 --enemies orc --verify 2000
+"""
+
+import argparse
+import itertools
+import json
+import os
+import sys
+import time
+
+try:
+    import numpy as np
+except ImportError as e:
+    raise ImportError("combat_simulator requires the 'numpy' package: pip install -r requirements-tools.txt") from e
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.game_data import (  # noqa: E402
+    CHARACTER_CLASSES, COMBAT_RULES, ENEMIES, GAME_SETTINGS, ITEMS, PERSONALITY_TEMPLATES
+)
+from utils.rng import derive_seed, new_seed  # noqa: E402
+
+
+def character_stats(class_id, personality_id, level=1, weapon=None, armor=None):
+    """
+    Stats of a character as the game would build them
+
+    Base class stats plus personality bonus (character creation), class growth
+    for every level above 1 (Character.level_up) and equipment bonuses
+    (GameManager.equip_item). HP is full, as after a level up.
+
+    Returns:
+        Dict with hp, max_hp, mp, max_mp, attack and defense
+    """
+    class_data = CHARACTER_CLASSES[class_id]
+    base = class_data['base_stats']
+    bonus = PERSONALITY_TEMPLATES[personality_id].get('stat_bonus', {})
+    growth = class_data.get('growth', {})
+    levels = level - 1
+
+    stats = {
+        'max_hp': base['max_hp'] + bonus.get('hp', 0) + growth.get('max_hp', 0) * levels,
+        'max_mp': base['max_mp'] + bonus.get('mp', 0) + growth.get('max_mp', 0) * levels,
+        'attack': base['attack'] + bonus.get('attack', 0) + growth.get('attack', 0) * levels,
+        'defense': base['defense'] + bonus.get('defense', 0) + growth.get('defense', 0) * levels
+    }
+    for item_id in (weapon, armor):
+        if item_id:
+            item = ITEMS[item_id]
+            stats['attack'] += item.get('attack_bonus', 0)
+            stats['defense'] += item.get('defense_bonus', 0)
+            stats['max_mp'] += item.get('mp_bonus', 0)
+    stats['hp'] = stats['max_hp']
+    stats['mp'] = stats['max_mp']
+    return stats
+
+
+def build_matchups(classes, personalities, levels, weapons, armors, enemies):
+    """Every combination of the given options"""
+    matchups = []
+    for class_id, personality_id, level, weapon, armor, enemy_id in itertools.product(
+            classes, personalities, levels, weapons, armors, enemies):
+        matchups.append({
+            'class': class_id,
+            'personality': personality_id,
+            'level': level,
+            'weapon': weapon,
+            'armor': armor,
+            'enemy': enemy_id,
+            'stats': character_stats(class_id, personality_id, level, weapon, armor)
+        })
+    return matchups
+
+
+# ----------------------------------------------------------------------
+# Vectorized rules (mirror CombatManager / Character)
+# ----------------------------------------------------------------------
+
+def _damage(rng, attack, defense, critical, multiplier):
+    """CombatManager.calculate_damage over arrays"""
+    low, high = COMBAT_RULES['damage_variance']
+    base = np.maximum(1, attack - defense)
+    damage = (base * rng.uniform(low, high, base.size) * multiplier).astype(np.int64)
+    damage = np.where(critical, (damage * COMBAT_RULES['crit_multiplier']).astype(np.int64), damage)
+    return np.maximum(1, damage)
+
+
+def _taken(damage, defense):
+    """Character.take_damage: armor applies again to the rolled damage"""
+    return np.maximum(1, damage - defense)
+
+
+def _enemy_tables(enemies):
+    """Per-matchup enemy arrays, with phases and special abilities padded to a common width"""
+    boss_level = COMBAT_RULES['boss_level']
+    abilities = [
+        enemy.get('special_abilities', []) if enemy['level'] >= boss_level else []
+        for enemy in enemies
+    ]
+    phases = [enemy.get('phases', []) for enemy in enemies]
+    width_a = max(1, max(len(a) for a in abilities))
+    width_p = max(1, max(len(p) for p in phases))
+
+    tables = {
+        'n_abilities': np.array([len(a) for a in abilities], dtype=np.int64),
+        'ability_multiplier': np.ones((len(enemies), width_a)),
+        'ability_heal': np.zeros((len(enemies), width_a)),
+        'ability_cooldown': np.zeros((len(enemies), width_a), dtype=np.int64),
+        'n_phases': np.array([len(p) for p in phases], dtype=np.int64),
+        'phase_threshold': np.zeros((len(enemies), width_p), dtype=np.int64),
+        'phase_multiplier': np.ones((len(enemies), width_p)),
+        'width_a': width_a if any(abilities) else 0
+    }
+    for row, (enemy_abilities, enemy_phases) in enumerate(zip(abilities, phases)):
+        for col, ability in enumerate(enemy_abilities):
+            tables['ability_multiplier'][row, col] = ability['damage_multiplier']
+            tables['ability_heal'][row, col] = ability.get('heal_percent', 0.0)
+            tables['ability_cooldown'][row, col] = ability['cooldown']
+        for col, phase in enumerate(enemy_phases):
+            tables['phase_threshold'][row, col] = phase['hp_threshold']
+            tables['phase_multiplier'][row, col] = phase.get('attack_multiplier', 1.0)
+    return tables
+
+
+def _simulate_chunk(matchups, fights, max_turns, rng):
+    """
+    Fight `fights` battles for each matchup at once
+
+    Returns:
+        Arrays of shape (len(matchups), fights): win, timeout, turns, hp_left
+    """
+    m = len(matchups)
+    owner = np.repeat(np.arange(m), fights)  # Matchup index of each fight
+    enemies = [ENEMIES[matchup['enemy']] for matchup in matchups]
+
+    def per_fight(values):
+        return np.asarray(values, dtype=np.int64)[owner]
+
+    p_attack = per_fight([matchup['stats']['attack'] for matchup in matchups])
+    p_defense = per_fight([matchup['stats']['defense'] for matchup in matchups])
+    p_hp = per_fight([matchup['stats']['hp'] for matchup in matchups])
+    e_attack = per_fight([enemy['attack'] for enemy in enemies])
+    e_defense = per_fight([enemy['defense'] for enemy in enemies])
+    e_hp = per_fight([enemy['hp'] for enemy in enemies])
+    e_max_hp = per_fight([enemy['max_hp'] for enemy in enemies])
+
+    tables = _enemy_tables(enemies)
+    n_abilities = tables['n_abilities'][owner]
+    n_phases = tables['n_phases'][owner]
+    width_a = tables['width_a']
+    cooldowns = np.zeros((owner.size, max(1, width_a)), dtype=np.int64)
+    phase = np.zeros(owner.size, dtype=np.int64)
+
+    active = np.ones(owner.size, dtype=bool)
+    win = np.zeros(owner.size, dtype=bool)
+    turns = np.full(owner.size, max_turns, dtype=np.int64)
+    crit_chance = COMBAT_RULES['crit_chance']
+    ability_chance = COMBAT_RULES['special_ability_chance']
+
+    for turn in range(1, max_turns + 1):
+        rows = np.flatnonzero(active)
+        if rows.size == 0:
+            break
+
+        # Player attacks
+        critical = rng.random(rows.size) < crit_chance
+        e_hp[rows] -= _damage(rng, p_attack[rows], e_defense[rows], critical, 1.0)
+        killed = e_hp[rows] <= 0
+        won = rows[killed]
+        win[won] = True
+        active[won] = False
+        turns[won] = turn
+        rows = rows[~killed]
+
+        # Enemy picks the first ready special ability that passes its roll
+        chosen = np.full(rows.size, -1, dtype=np.int64)
+        if width_a:
+            ability_count = n_abilities[rows]
+            for col in range(width_a):
+                ready = (chosen < 0) & (col < ability_count) & (cooldowns[rows, col] == 0)
+                chosen[ready & (rng.random(rows.size) < ability_chance)] = col
+            # Cooldowns tick down only on turns without an ability
+            ticking = rows[(chosen < 0) & (ability_count > 0)]
+            cooldowns[ticking] = np.maximum(cooldowns[ticking] - 1, 0)
+
+        uses = chosen >= 0
+        ability_rows = rows[uses]
+        if ability_rows.size:
+            col = chosen[uses]
+            source = owner[ability_rows]
+            damage = _damage(rng, e_attack[ability_rows], p_defense[ability_rows],
+                             np.zeros(ability_rows.size, dtype=bool), tables['ability_multiplier'][source, col])
+            p_hp[ability_rows] -= _taken(damage, p_defense[ability_rows])
+            heal = (damage * tables['ability_heal'][source, col]).astype(np.int64)
+            e_hp[ability_rows] = np.minimum(e_max_hp[ability_rows], e_hp[ability_rows] + heal)
+            cooldowns[ability_rows, col] = tables['ability_cooldown'][source, col]
+
+        attack_rows = rows[~uses]
+        critical = rng.random(attack_rows.size) < crit_chance
+        damage = _damage(rng, e_attack[attack_rows], p_defense[attack_rows], critical, 1.0)
+        p_hp[attack_rows] -= _taken(damage, p_defense[attack_rows])
+
+        dead = rows[p_hp[rows] <= 0]
+        active[dead] = False
+        turns[dead] = turn
+
+        # Boss phase transitions (checked after a normal attack only, one phase per turn)
+        survivors = attack_rows[p_hp[attack_rows] > 0]
+        survivors = survivors[phase[survivors] < n_phases[survivors]]
+        if survivors.size:
+            source = owner[survivors]
+            current = phase[survivors]
+            shifting = e_hp[survivors] <= tables['phase_threshold'][source, current]
+            shifted = survivors[shifting]
+            e_attack[shifted] = (
+                e_attack[shifted] * tables['phase_multiplier'][source[shifting], current[shifting]]
+            ).astype(np.int64)
+            phase[shifted] += 1
+
+    shape = (m, fights)
+    return {
+        'win': win.reshape(shape),
+        'timeout': active.reshape(shape),
+        'turns': turns.reshape(shape),
+        'hp_left': np.maximum(p_hp, 0).reshape(shape)
+    }
+
+
+def simulate(matchups, fights=100000, max_turns=200, seed=None, chunk_fights=2_000_000, gold=None):
+    """
+    Simulate every matchup
+
+    Args:
+        matchups: From build_matchups
+        fights: Battles per matchup
+        max_turns: Battles still running after this many turns count as timeouts (not wins)
+        seed: RNG seed for reproducible runs
+        chunk_fights: Upper bound on battles held in memory at once
+        gold: Gold carried into each fight, for the death penalty (GAME_SETTINGS starting gold if not provided)
+
+    Returns:
+        One result dict per matchup
+    """
+    rng = np.random.default_rng(seed)
+    gold = GAME_SETTINGS['starting_gold'] if gold is None else gold
+    penalty = GAME_SETTINGS['death_penalty']
+    gold_lost = int(gold * penalty['gold_loss_percent'])
+    per_chunk = max(1, chunk_fights // fights)
+
+    results = []
+    for start in range(0, len(matchups), per_chunk):
+        chunk = matchups[start:start + per_chunk]
+        outcome = _simulate_chunk(chunk, fights, max_turns, rng)
+
+        for row, matchup in enumerate(chunk):
+            enemy = ENEMIES[matchup['enemy']]
+            win = outcome['win'][row]
+            turns = outcome['turns'][row]
+            wins = int(win.sum())
+            exp = np.where(win, enemy['experience'], 0)
+            gold_delta = np.where(win, enemy['gold'], np.where(outcome['timeout'][row], 0, -gold_lost))
+            win_turns = turns[win]
+            results.append({
+                **{key: value for key, value in matchup.items() if key != 'stats'},
+                'stats': matchup['stats'],
+                'fights': fights,
+                'win_rate': wins / fights,
+                'timeout_rate': float(outcome['timeout'][row].mean()),
+                'turns_mean': float(turns.mean()),
+                'turns_to_kill': {
+                    'mean': float(win_turns.mean()) if wins else None,
+                    'p50': float(np.percentile(win_turns, 50)) if wins else None,
+                    'p90': float(np.percentile(win_turns, 90)) if wins else None,
+                    'p99': float(np.percentile(win_turns, 99)) if wins else None
+                },
+                'hp_left_on_win': float(outcome['hp_left'][row][win].mean() / matchup['stats']['max_hp']) if wins else None,
+                'exp': {'mean': float(exp.mean()), 'std': float(exp.std()), 'per_turn': float(exp.sum() / turns.sum())},
+                'gold': {
+                    'mean': float(gold_delta.mean()),
+                    'std': float(gold_delta.std()),
+                    'per_turn': float(gold_delta.sum() / turns.sum())
+                },
+                'loot': {
+                    entry['item_id']: wins / fights * entry['chance'] for entry in enemy.get('loot', [])
+                }
+            })
+    return results
+
+
+# ----------------------------------------------------------------------
+# Reference check against the real game code
+# ----------------------------------------------------------------------
+
+def reference_win_rate(matchup, fights, max_turns=200, seed=0):
+    """Win rate of the same matchup fought through CombatManager and the Character model (fight i uses derive_seed(seed, i))"""
+    from models import Character
+    from utils.combat_manager import CombatManager
+
+    stats = matchup['stats']
+    wins = 0
+    for index in range(fights):
+        character = Character(
+            name='sim', personality=matchup['personality'], character_class=matchup['class'],
+            level=matchup['level'], experience=0, gold=GAME_SETTINGS['starting_gold'], **stats
+        )
+        state = CombatManager.start_combat(character, matchup['enemy'], seed=derive_seed(seed, index))
+        for _ in range(max_turns):
+            state = CombatManager.apply_action(state, character, 'attack')
+            if not state['active']:
+                break
+        wins += bool(state.get('victory'))
+    return wins / fights
+
+
+# ----------------------------------------------------------------------
+# CLI
+# ----------------------------------------------------------------------
+
+def _parse_list(value, choices, allow_none=False):
+    if value == 'all':
+        return list(choices)
+    names = [name.strip() for name in value.split(',') if name.strip()]
+    parsed = []
+    for name in names:
+        if allow_none and name == 'none':
+            parsed.append(None)
+        elif name in choices:
+            parsed.append(name)
+        else:
+            raise SystemExit(f'Unknown value: {name} (choose from {", ".join(choices)})')
+    return parsed
+
+
+def _parse_levels(value):
+    levels = []
+    for part in value.split(','):
+        low, _, high = part.partition('-')
+        levels.extend(range(int(low), int(high or low) + 1))
+    return levels
+
+
+def _format(value, spec='.1f'):
+    return '-' if value is None else format(value, spec)
+
+
+def main():
+    weapons = [item_id for item_id, item in ITEMS.items() if item['type'] == 'weapon']
+    armors = [item_id for item_id, item in ITEMS.items() if item['type'] == 'armor']
+
+    parser = argparse.ArgumentParser(description='Vectorized Monte Carlo combat simulator')
+    parser.add_argument('--classes', default='all', help=f'Comma-separated or "all" ({", ".join(CHARACTER_CLASSES)})')
+    parser.add_argument('--personalities', default='all', help=f'Comma-separated or "all" ({", ".join(PERSONALITY_TEMPLATES)})')
+    parser.add_argument('--levels', default='1,5,10,15', help='Levels, e.g. "1-10" or "1,5,10"')
+    parser.add_argument('--weapons', default='none', help=f'Comma-separated, "none" or "all" ({", ".join(weapons)})')
+    parser.add_argument('--armors', default='none', help=f'Comma-separated, "none" or "all" ({", ".join(armors)})')
+    parser.add_argument('--enemies', default='all', help=f'Comma-separated or "all" ({", ".join(ENEMIES)})')
+    parser.add_argument('--fights', type=int, default=100000, help='Battles per matchup')
+    parser.add_argument('--max-turns', type=int, default=200)
+    parser.add_argument('--gold', type=int, default=None, help='Gold carried into each fight (death penalty)')
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--chunk', type=int, default=2_000_000, help='Battles held in memory at once')
+    parser.add_argument('--json', help='Also write full results to this file')
+    parser.add_argument('--verify', type=int, default=0, metavar='N',
+                        help='Also fight N battles per matchup through CombatManager and compare win rates')
+    args = parser.parse_args()
+    seed = new_seed() if args.seed is None else args.seed
+
+    matchups = build_matchups(
+        _parse_list(args.classes, CHARACTER_CLASSES),
+        _parse_list(args.personalities, PERSONALITY_TEMPLATES),
+        _parse_levels(args.levels),
+        _parse_list(args.weapons, weapons, allow_none=True),
+        _parse_list(args.armors, armors, allow_none=True),
+        _parse_list(args.enemies, ENEMIES)
+    )
+
+    started = time.perf_counter()
+    results = simulate(matchups, args.fights, args.max_turns, seed, args.chunk, args.gold)
+    elapsed = time.perf_counter() - started
+
+    header = (f"{'class':<8} {'pers.':<9} {'lv':>3} {'weapon':<16} {'armor':<16} {'enemy':<11} "
+              f"{'win%':>6} {'ttk p50':>7} {'p90':>5} {'hp left':>7} {'exp/fight':>9} {'gold/fight':>10}")
+    print(header)
+    print('-' * len(header))
+    for result in results:
+        print(f"{result['class']:<8} {result['personality']:<9} {result['level']:>3} "
+              f"{result['weapon'] or '-':<16} {result['armor'] or '-':<16} {result['enemy']:<11} "
+              f"{result['win_rate'] * 100:>6.1f} {_format(result['turns_to_kill']['p50'], '.0f'):>7} "
+              f"{_format(result['turns_to_kill']['p90'], '.0f'):>5} "
+              f"{_format(result['hp_left_on_win'] and result['hp_left_on_win'] * 100, '.0f'):>6}% "
+              f"{result['exp']['mean']:>9.1f} {result['gold']['mean']:>10.1f}")
+
+    total = len(matchups) * args.fights
+    print(f'\n{total:,} fights across {len(matchups)} matchups in {elapsed:.2f}s ({total / elapsed:,.0f} fights/s, seed {seed})')
+
+    if args.verify:
+        print(f'\nReference check ({args.verify} fights per matchup through CombatManager):')
+        for index, (result, matchup) in enumerate(zip(results, matchups)):
+            reference = reference_win_rate(matchup, args.verify, args.max_turns, derive_seed(seed, index))
+            equipment = f"{matchup['weapon'] or '-'}/{matchup['armor'] or '-'}"
+            print(f"  {matchup['class']}/{matchup['personality']} lv{matchup['level']} {equipment} vs {matchup['enemy']}: "
+                  f"simulated {result['win_rate'] * 100:.1f}%  reference {reference * 100:.1f}%")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f'Results written to {args.json}')
+
+
+if __name__ == '__main__':
+    main()
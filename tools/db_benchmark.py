@@ -0,0 +1,200 @@
+"""
+Concurrency benchmark for the RPG database profiles
+RPG 数据库配置档并发基准测试
+
+Builds a scratch SQLite database per profile (utils/database.py) with the game
+schema and a population of characters, then runs the game's action mix from
+several threads for a fixed time and reports throughput and latency:
+
+    view       read   character with equipment (GET /api/character)
+    inventory  read   character inventory (GET /api/inventory)
+    combat     write  combat turn: character HP / exp / gold update, every
+                      fifth turn also a replay GameEvent (POST /api/combat/action)
+    buy        write  gold deduction plus inventory stack update (POST /api/shop/buy)
+
+Every action is one session and one commit, as in the routes.
+
+Usage:
+    python tools/db_benchmark.py
+    python tools/db_benchmark.py --threads 16 --duration 10 --mix view=50,inventory=20,combat=25,buy=5
+"""
+
+import argparse
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, select  # noqa: E402
+from sqlalchemy.exc import OperationalError  # noqa: E402
+from sqlalchemy.orm import Session, joinedload  # noqa: E402
+
+from models import Character, GameEvent, InventoryItem, User, db  # noqa: E402
+from utils.database import DB_PROFILES, apply_pragmas, engine_options, get_profile  # noqa: E402
+
+READS = ('view', 'inventory')
+WRITES = ('combat', 'buy')
+
+
+def build_database(url, profile, characters):
+    """Create the schema and seed characters, each with a weapon, armor and a potion stack"""
+    engine = create_engine(url, **engine_options(url, profile))
+    apply_pragmas(engine, profile['pragmas'])
+    db.metadata.create_all(engine)
+
+    with Session(engine) as session:
+        for index in range(characters):
+            user = User(username=f'bench{index}', password_hash='-')
+            character = Character(user=user, name=f'Hero{index}', personality='brave', character_class='warrior',
+                                  level=1, experience=0, hp=130, max_hp=130, mp=30, max_mp=30,
+                                  attack=17, defense=9, gold=100000)
+            weapon = InventoryItem(item_id='iron_sword', is_equipped=True)
+            armor = InventoryItem(item_id='leather_armor', is_equipped=True)
+            character.inventory.extend([weapon, armor, InventoryItem(item_id='health_potion', quantity=5)])
+            character.equipped_weapon = weapon
+            character.equipped_armor = armor
+            session.add(character)
+        session.commit()
+    return engine
+
+
+def run_action(engine, action, character_id, turn):
+    with Session(engine) as session:
+        if action == 'view':
+            character = session.scalars(
+                select(Character)
+                .options(joinedload(Character.equipped_weapon), joinedload(Character.equipped_armor))
+                .where(Character.id == character_id)
+            ).first()
+            character.to_dict()
+        elif action == 'inventory':
+            items = session.scalars(select(InventoryItem).where(InventoryItem.character_id == character_id)).all()
+            [item.to_dict() for item in items]
+        elif action == 'combat':
+            character = session.get(Character, character_id)
+            character.hp = max(1, character.hp - 7)
+            character.experience += 3
+            character.gold += 2
+            if turn % 5 == 0:
+                event = GameEvent(character_id=character_id, event_type='combat')
+                event.set_event_data({'seed': turn, 'enemy_id': 'goblin', 'actions': [['attack']] * 5})
+                session.add(event)
+            session.commit()
+        elif action == 'buy':
+            character = session.get(Character, character_id)
+            potion = session.scalars(
+                select(InventoryItem).where(InventoryItem.character_id == character_id,
+                                            InventoryItem.item_id == 'health_potion')
+            ).first()
+            character.gold -= 50
+            potion.quantity += 1
+            session.commit()
+
+
+def run_profile(name, args):
+    """Benchmark one profile; returns a result dict"""
+    profile = get_profile(name)
+    if args.pool_size:
+        profile['pool_size'] = args.pool_size
+    workdir = tempfile.mkdtemp(prefix='db_benchmark_')
+    url = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    engine = build_database(url, profile, args.characters)
+
+    actions, weights = zip(*args.mix.items())
+    latencies = {action: [] for action in actions}
+    errors = []
+    stop = threading.Event()
+    lock = threading.Lock()
+
+    def worker(seed):
+        rng = random.Random(seed)
+        local = {action: [] for action in actions}
+        local_errors = 0
+        turn = 0
+        while not stop.is_set():
+            action = rng.choices(actions, weights)[0]
+            turn += 1
+            started = time.perf_counter()
+            try:
+                run_action(engine, action, rng.randint(1, args.characters), turn)
+            except OperationalError:
+                local_errors += 1
+                continue
+            local[action].append(time.perf_counter() - started)
+        with lock:
+            for action, values in local.items():
+                latencies[action].extend(values)
+            errors.append(local_errors)
+
+    threads = [threading.Thread(target=worker, args=(args.seed + index,)) for index in range(args.threads)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    time.sleep(args.duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    engine.dispose()
+    shutil.rmtree(workdir, ignore_errors=True)
+
+    def summary(kinds):
+        values = sorted(value for kind in kinds if kind in latencies for value in latencies[kind])
+        if not values:
+            return {'ops': 0, 'per_sec': 0.0, 'p50_ms': None, 'p99_ms': None}
+        return {
+            'ops': len(values),
+            'per_sec': len(values) / elapsed,
+            'p50_ms': statistics.median(values) * 1000,
+            'p99_ms': values[min(len(values) - 1, int(len(values) * 0.99))] * 1000
+        }
+
+    return {'profile': name, 'reads': summary(READS), 'writes': summary(WRITES), 'errors': sum(errors)}
+
+
+def _parse_mix(value):
+    mix = {}
+    for part in value.split(','):
+        action, _, weight = part.partition('=')
+        if action not in READS + WRITES:
+            raise SystemExit(f'Unknown action: {action} (choose from {", ".join(READS + WRITES)})')
+        mix[action] = float(weight)
+    return mix
+
+
+def _format(value):
+    return '-' if value is None else f'{value:.2f}'
+
+
+def main():
+    parser = argparse.ArgumentParser(description='RPG database profile concurrency benchmark')
+    parser.add_argument('--profiles', default=','.join(DB_PROFILES), help='Comma-separated profiles to compare')
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=5.0, help='Seconds per profile')
+    parser.add_argument('--characters', type=int, default=200)
+    parser.add_argument('--mix', default='view=40,inventory=20,combat=30,buy=10', help='Action weights')
+    parser.add_argument('--pool-size', type=int, default=None, help='Override the profiles\' pool size')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    args.mix = _parse_mix(args.mix)
+
+    print(f'{args.threads} threads, {args.duration:g}s per profile, mix {args.mix}')
+    header = (f"{'profile':<12} {'reads/s':>9} {'p50 ms':>8} {'p99 ms':>8} "
+              f"{'writes/s':>9} {'p50 ms':>8} {'p99 ms':>8} {'locked':>7}")
+    print(header)
+    print('-' * len(header))
+    for name in args.profiles.split(','):
+        result = run_profile(name.strip(), args)
+        reads, writes = result['reads'], result['writes']
+        print(f"{result['profile']:<12} {reads['per_sec']:>9.0f} {_format(reads['p50_ms']):>8} {_format(reads['p99_ms']):>8} "
+              f"{writes['per_sec']:>9.0f} {_format(writes['p50_ms']):>8} {_format(writes['p99_ms']):>8} {result['errors']:>7}")
+
+
+if __name__ == '__main__':
+    main()
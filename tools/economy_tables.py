@@ -0,0 +1,65 @@
+"""
+Print the economy expected-value tables
+輸出遊戲經濟期望值表
+
+Per enemy (one victory) and per location (one exploration, every encounter
+won): expected experience, gold and loot value with their standard deviation,
+and expected drops per item. Computed from utils/game_data.py by
+utils/economy.py; the same tables are served by
+GET /api/game/locations?include=economy.
+
+Usage:
+    python tools/economy_tables.py
+    python tools/economy_tables.py --json economy.json
+"""
+
+import argparse
+import json
+import math
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.economy import get_economy_tables  # noqa: E402
+from utils.game_data import ENEMIES, ITEMS, LOCATIONS  # noqa: E402
+
+
+def _stat(moments):
+    return f"{moments['mean']:>8.1f} ±{math.sqrt(moments['variance']):>7.1f}"
+
+
+def _drops(loot):
+    return ', '.join(
+        f"{ITEMS.get(item_id, {}).get('name', item_id)} {drops['expected']:.3f}"
+        for item_id, drops in loot.items()
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Economy expected-value tables')
+    parser.add_argument('--json', help='Also write the tables to this file')
+    args = parser.parse_args()
+
+    tables = get_economy_tables()
+
+    print('Per location (one exploration):')
+    print(f"{'location':<12} {'rate':>5} {'exp':>17} {'gold':>17} {'loot value':>17}  drops")
+    for location_id, row in tables['locations'].items():
+        print(f"{LOCATIONS[location_id]['name']:<12} {row['encounter_rate']:>5.2f} "
+              f"{_stat(row['exp'])} {_stat(row['gold'])} {_stat(row['loot_value'])}  {_drops(row['loot'])}")
+
+    print('\nPer enemy (one victory):')
+    print(f"{'enemy':<12} {'lv':>5} {'exp':>17} {'gold':>17} {'loot value':>17}  drops")
+    for enemy_id, row in tables['enemies'].items():
+        print(f"{ENEMIES[enemy_id]['name']:<12} {row['level']:>5} "
+              f"{_stat(row['exp'])} {_stat(row['gold'])} {_stat(row['loot_value'])}  {_drops(row['loot'])}")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(tables, f, ensure_ascii=False, indent=2)
+        print(f'\nTables written to {args.json}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,375 @@
+"""
+Local Gemini API stand-in for offline testing and load tests
+本地 Gemini API 模擬伺服器（離線測試與壓力測試用）
+
+Emulates the endpoints GeminiClient / AsyncGeminiClient use:
+    POST .../models/<model>:generateContent
+    POST .../models/<model>:streamGenerateContent?alt=sse
+    POST .../cachedContents, PATCH/GET/DELETE .../cachedContents/<id>
+    POST .../chat/completions  (OpenAI-compatible provider, stream or not)
+    POST .../completion        (llama.cpp server provider, stream or not)
+    GET  /_stats  (request counters of this server)
+
+Replies are canned JSON bodies in the format _parse_ai_response expects (or,
+for combat narration requests, one segment per numbered log line), with
+configurable latency, error injection and streaming chunking.
+
+Usage:
+    python tools/fake_gemini_server.py --port 8089 --latency lognormal:0.8,0.4 --error-rate 0.02
+    GEMINI_API_BASE=http://127.0.0.1:8089/v1beta GEMINI_API_KEY=fake python app.py
+
+Latency specs (seconds):
+    fixed:0.2  uniform:0.1,0.5  normal:0.5,0.1  lognormal:<median>,<sigma>  exponential:<mean>
+"""
+
+import argparse
+import itertools
+import json
+import math
+import random
+import re
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+DEFAULT_RESPONSES = [
+    {'message': '你好！今天想做些什麼呢？', 'emoji': '開心.png', 'scene': 'computer_room', 'mcp_command': ''},
+    {'message': '讓我想想……這個問題很有意思，我們可以一步一步來分析。', 'emoji': '思考.png', 'scene': 'planning_room', 'mcp_command': ''},
+    {'message': '辛苦了，要不要先休息一下？', 'emoji': '放鬆.png', 'scene': 'bedroom', 'mcp_command': ''},
+    {'message': '好的，我來列出可用的工具。', 'emoji': '自信.png', 'scene': 'mcp_studio', 'mcp_command': 'mcp list-tools'}
+]
+
+
+def parse_latency(spec):
+    """
+    Build a latency sampler from a spec string
+
+    Args:
+        spec: e.g. 'fixed:0.2', 'uniform:0.1,0.5', 'normal:0.5,0.1', 'lognormal:0.8,0.4', 'exponential:0.3'
+
+    Returns:
+        Callable returning a non-negative delay in seconds
+    """
+    kind, _, args = spec.partition(':')
+    params = [float(value) for value in args.split(',') if value]
+
+    if kind == 'fixed':
+        return lambda: params[0]
+    if kind == 'uniform':
+        return lambda: random.uniform(params[0], params[1])
+    if kind == 'normal':
+        return lambda: max(0.0, random.gauss(params[0], params[1]))
+    if kind == 'lognormal':
+        return lambda: random.lognormvariate(math.log(params[0]), params[1])
+    if kind == 'exponential':
+        return lambda: random.expovariate(1 / params[0])
+    raise ValueError(f'Unknown latency distribution: {spec}')
+
+
+class FakeGeminiState:
+    """Server-wide settings, canned replies, cached contents and counters"""
+
+    def __init__(self, args):
+        self.latency = parse_latency(args.latency)
+        self.error_rate = args.error_rate
+        self.error_statuses = [int(code) for code in args.error_statuses.split(',')]
+        self.retry_after = args.retry_after
+        self.stream_chunks = args.stream_chunks
+        self.stream_interval = parse_latency(args.stream_interval)
+        self.fence = args.fence
+        self.cache_min_tokens = args.cache_min_tokens
+
+        responses = DEFAULT_RESPONSES
+        if args.responses:
+            with open(args.responses, encoding='utf-8') as f:
+                responses = json.load(f)
+        self._responses = itertools.cycle(responses)
+
+        self.cached_contents = {}
+        self._cache_ids = itertools.count(1)
+        self.lock = threading.Lock()
+        self.counters = {
+            'generate': 0, 'stream': 0, 'cache_create': 0, 'cache_update': 0,
+            'cached_requests': 0, 'injected_errors': 0
+        }
+
+    def count(self, name):
+        with self.lock:
+            self.counters[name] += 1
+
+    def next_reply_text(self, json_mode=False):
+        """Raw model text for the next reply (never fenced in JSON mode, like the real API)"""
+        with self.lock:
+            reply = next(self._responses)
+        text = reply if isinstance(reply, str) else json.dumps(reply, ensure_ascii=False)
+        if self.fence and not json_mode:
+            text = f'```json\n{text}\n```'
+        return text
+
+
+class FakeGeminiHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    state = None  # FakeGeminiState, set by main()
+
+    def log_message(self, format, *args):
+        pass
+
+    # ------------------------------------------------------------------
+    # Routing
+    # ------------------------------------------------------------------
+
+    def do_POST(self):
+        path = urlparse(self.path).path
+        body = self._read_json()
+
+        if path.endswith(':generateContent'):
+            self._generate(body, stream=False)
+        elif path.endswith(':streamGenerateContent'):
+            self._generate(body, stream=True)
+        elif path.endswith('/cachedContents'):
+            self._create_cache(body)
+        elif path.endswith('/chat/completions'):
+            self._generate(body, stream=bool(body.get('stream')), wire='openai')
+        elif path.endswith('/completion'):
+            self._generate(body, stream=bool(body.get('stream')), wire='llamacpp')
+        else:
+            self._send_json(404, {'error': {'code': 404, 'message': f'Unknown endpoint {path}'}})
+
+    def do_PATCH(self):
+        body = self._read_json()
+        entry = self._cache_entry()
+        if entry is None:
+            return self._send_json(404, {'error': {'code': 404, 'message': 'CachedContent not found'}})
+        entry['expires_at'] = time.time() + _parse_ttl(body.get('ttl', '3600s'))
+        self.state.count('cache_update')
+        self._send_json(200, self._cache_resource(entry))
+
+    def do_GET(self):
+        path = urlparse(self.path).path
+        if path == '/_stats':
+            with self.state.lock:
+                stats = dict(self.state.counters, cached_contents=len(self.state.cached_contents))
+            return self._send_json(200, stats)
+
+        entry = self._cache_entry()
+        if entry is None:
+            return self._send_json(404, {'error': {'code': 404, 'message': 'CachedContent not found'}})
+        self._send_json(200, self._cache_resource(entry))
+
+    def do_DELETE(self):
+        match = re.search(r'(cachedContents/[^/?]+)$', urlparse(self.path).path)
+        with self.state.lock:
+            removed = match and self.state.cached_contents.pop(match.group(1), None)
+        self._send_json(200 if removed else 404, {})
+
+    # ------------------------------------------------------------------
+    # generateContent / streamGenerateContent
+    # ------------------------------------------------------------------
+
+    def _generate(self, body, stream, wire='gemini'):
+        state = self.state
+        state.count('stream' if stream else 'generate')
+        time.sleep(state.latency())
+
+        if random.random() < state.error_rate:
+            state.count('injected_errors')
+            code = random.choice(state.error_statuses)
+            headers = {'Retry-After': str(state.retry_after)} if code == 429 else {}
+            return self._send_json(code, {'error': {'code': code, 'message': 'Injected error'}}, headers)
+
+        cache_name = body.get('cachedContent')
+        if cache_name:
+            entry = self._cache_entry(cache_name)
+            if entry is None:
+                return self._send_json(404, {'error': {'code': 404, 'message': f'{cache_name} not found'}})
+            state.count('cached_requests')
+
+        prompt, schema = _request_prompt_and_schema(body, wire)
+        if 'segments' in (schema or {}).get('properties', {}):
+            text = _narration_reply(prompt)
+        else:
+            text = state.next_reply_text(json_mode=schema is not None)
+        if not stream:
+            return self._send_json(200, _generate_response(text, wire))
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.close_connection = True
+
+        size = max(1, math.ceil(len(text) / state.stream_chunks))
+        for start in range(0, len(text), size):
+            if start:
+                time.sleep(state.stream_interval())
+            chunk = json.dumps(_stream_chunk(text[start:start + size], wire), ensure_ascii=False)
+            self.wfile.write(f'data: {chunk}\r\n\r\n'.encode('utf-8'))
+            self.wfile.flush()
+        if wire == 'openai':
+            self.wfile.write(b'data: [DONE]\r\n\r\n')
+        elif wire == 'llamacpp':
+            self.wfile.write(f'data: {json.dumps({"content": "", "stop": True})}\r\n\r\n'.encode('utf-8'))
+        self.wfile.flush()
+
+    # ------------------------------------------------------------------
+    # cachedContents
+    # ------------------------------------------------------------------
+
+    def _create_cache(self, body):
+        state = self.state
+        parts = body.get('systemInstruction', {}).get('parts', [])
+        for content in body.get('contents', []):
+            parts = parts + content.get('parts', [])
+        text = ''.join(part.get('text', '') for part in parts)
+
+        # Rough size check, mirroring the real API's minimum cacheable token count
+        if len(text) // 2 < state.cache_min_tokens:
+            return self._send_json(400, {'error': {
+                'code': 400,
+                'message': f'Cached content is too small. min_total_token_count={state.cache_min_tokens}'
+            }})
+
+        name = f'cachedContents/fake{next(state._cache_ids)}'
+        entry = {'name': name, 'model': body.get('model'), 'expires_at': time.time() + _parse_ttl(body.get('ttl', '3600s'))}
+        with state.lock:
+            state.cached_contents[name] = entry
+        state.count('cache_create')
+        self._send_json(200, self._cache_resource(entry))
+
+    def _cache_entry(self, name=None):
+        if name is None:
+            match = re.search(r'(cachedContents/[^/?]+)$', urlparse(self.path).path)
+            if not match:
+                return None
+            name = match.group(1)
+        with self.state.lock:
+            entry = self.state.cached_contents.get(name)
+            if entry and entry['expires_at'] <= time.time():
+                del self.state.cached_contents[name]
+                entry = None
+        return entry
+
+    @staticmethod
+    def _cache_resource(entry):
+        expire = datetime.fromtimestamp(entry['expires_at'], tz=timezone.utc)
+        return {
+            'name': entry['name'],
+            'model': entry['model'],
+            'expireTime': expire.isoformat().replace('+00:00', 'Z')
+        }
+
+    # ------------------------------------------------------------------
+    # Helpers
+    # ------------------------------------------------------------------
+
+    def _read_json(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        raw = self.rfile.read(length) if length else b''
+        try:
+            return json.loads(raw) if raw else {}
+        except ValueError:
+            return {}
+
+    def _send_json(self, code, data, headers=None):
+        payload = json.dumps(data, ensure_ascii=False).encode('utf-8')
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+def _request_prompt_and_schema(body, wire):
+    """Prompt text and requested output schema (None for free text) of a generation request"""
+    if wire == 'openai':
+        prompt = ''.join(message.get('content', '') for message in body.get('messages', []))
+        schema = body.get('response_format', {}).get('json_schema', {}).get('schema')
+    elif wire == 'llamacpp':
+        prompt = body.get('prompt', '')
+        schema = body.get('json_schema')
+    else:
+        prompt = ''.join(part.get('text', '') for content in body.get('contents', []) for part in content.get('parts', []))
+        generation_config = body.get('generationConfig', {})
+        json_mode = generation_config.get('responseMimeType') == 'application/json'
+        schema = generation_config.get('responseSchema', {}) if json_mode else None
+    return prompt, schema
+
+
+def _generate_response(text, wire='gemini'):
+    """Complete response body carrying the text, in the provider's format"""
+    if wire == 'openai':
+        return {
+            'object': 'chat.completion',
+            'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': text}, 'finish_reason': 'stop'}]
+        }
+    if wire == 'llamacpp':
+        return {'content': text, 'stop': True}
+    return {
+        'candidates': [{
+            'content': {'parts': [{'text': text}], 'role': 'model'},
+            'finishReason': 'STOP',
+            'index': 0
+        }]
+    }
+
+
+def _stream_chunk(text, wire='gemini'):
+    """One streamed chunk carrying a piece of text, in the provider's format"""
+    if wire == 'openai':
+        return {'object': 'chat.completion.chunk', 'choices': [{'index': 0, 'delta': {'content': text}}]}
+    if wire == 'llamacpp':
+        return {'content': text, 'stop': False}
+    return _generate_response(text)
+
+
+def _narration_reply(prompt):
+    """Combat narration reply: one segment per '[index] line' of the prompt"""
+    segments = [
+        {'index': int(index), 'text': f'（叙述）{line}'}
+        for index, line in re.findall(r'^\[(\d+)\] (.*)$', prompt, re.MULTILINE)
+    ]
+    return json.dumps({'segments': segments}, ensure_ascii=False)
+
+
+def _parse_ttl(ttl):
+    """Parse a protobuf Duration string such as '3600s'"""
+    return float(str(ttl).rstrip('s'))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local Gemini API stand-in')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8089)
+    parser.add_argument('--latency', default='lognormal:0.8,0.4',
+                        help='Time before the first byte (default: lognormal:0.8,0.4)')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of requests answered with an error')
+    parser.add_argument('--error-statuses', default='503',
+                        help='Comma-separated statuses to inject, picked at random (e.g. 429,500,503)')
+    parser.add_argument('--retry-after', type=float, default=1, help='Retry-After seconds sent with injected 429s')
+    parser.add_argument('--stream-chunks', type=int, default=8, help='SSE chunks per streamed reply')
+    parser.add_argument('--stream-interval', default='fixed:0.05', help='Delay between SSE chunks')
+    parser.add_argument('--responses', help='JSON file with a list of reply objects (or raw strings) to cycle through')
+    parser.add_argument('--fence', action='store_true', help='Wrap free-text replies in ```json fences like the real model often does')
+    parser.add_argument('--cache-min-tokens', type=int, default=0,
+                        help='Reject cachedContents smaller than this (roughly 2 characters per token)')
+    args = parser.parse_args()
+
+    FakeGeminiHandler.state = FakeGeminiState(args)
+    server = ThreadingHTTPServer((args.host, args.port), FakeGeminiHandler)
+    server.daemon_threads = True
+    print(f'Fake Gemini API listening on http://{args.host}:{args.port}/v1beta')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,219 @@
+"""
+Load generator for the chat endpoints
+對話端點的壓力測試工具
+
+Drives app.py (POST /api/chat or /api/chat/stream) or app_rpg.py (POST /api/chat
+after registering, logging in and creating a character per virtual user) at a
+target request rate and reports latency percentiles and throughput.
+
+Requests are scheduled open-loop: latency is measured from each request's
+scheduled start, so a saturated server shows up as growing latency instead of
+a silently reduced request rate.
+
+Usage (against the fake Gemini server, see tools/fake_gemini_server.py):
+    python tools/load_test.py --target chat --base-url http://127.0.0.1:5000 --rps 20 --duration 30
+    python tools/load_test.py --target stream --rps 20 --duration 30
+    python tools/load_test.py --target rpg --base-url http://127.0.0.1:5000 --rps 10 --users 20
+"""
+
+import argparse
+import itertools
+import json
+import random
+import string
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+MESSAGES = ['你好', '今天天氣如何？', '我想吃點東西', '幫我規劃一下明天的行程', '我有點累了', '用工具查一下資料']
+SCENES = ['computer_room', 'bedroom', 'mcp_studio', 'planning_room']
+
+
+def percentile(samples, fraction):
+    """Nearest-rank percentile of a sorted list"""
+    if not samples:
+        return None
+    return samples[min(len(samples) - 1, int(fraction * len(samples)))]
+
+
+class VirtualUser:
+    """One client with its own cookie jar (chat session or login session)"""
+
+    def __init__(self, base_url, target):
+        self.base_url = base_url.rstrip('/')
+        self.target = target
+        self.session = requests.Session()
+
+    def setup(self, run_id, index):
+        """Register, log in and create a character (RPG target only)"""
+        if self.target != 'rpg':
+            return
+
+        username = f'load_{run_id}_{index}'
+        password = 'load-test-password'
+        self.session.post(f'{self.base_url}/api/auth/register',
+                          json={'username': username, 'password': password}, timeout=30)
+        response = self.session.post(f'{self.base_url}/api/auth/login',
+                                     json={'username': username, 'password': password}, timeout=30)
+        response.raise_for_status()
+        if not response.json()['user']['has_character']:
+            response = self.session.post(f'{self.base_url}/api/character/create', json={
+                'name': f'壓測{index}',
+                'personality': 'brave',
+                'character_class': 'warrior'
+            }, timeout=30)
+            response.raise_for_status()
+
+    def send(self, message):
+        """
+        Send one chat request
+
+        Returns:
+            Tuple of (HTTP status, seconds to first byte or None, whether the reply reported success)
+        """
+        if self.target == 'stream':
+            return self._send_stream(message)
+
+        body = {'message': message}
+        if self.target == 'chat':
+            body['current_scene'] = random.choice(SCENES)
+        response = self.session.post(f'{self.base_url}/api/chat', json=body, timeout=120)
+        try:
+            ok = response.json().get('success', False)
+        except ValueError:
+            ok = False
+        return response.status_code, None, ok
+
+    def _send_stream(self, message):
+        started = time.monotonic()
+        first_byte = None
+        ok = False
+        with self.session.post(f'{self.base_url}/api/chat/stream', json={
+            'message': message,
+            'current_scene': random.choice(SCENES)
+        }, timeout=120, stream=True) as response:
+            event = None
+            for line in response.iter_lines(decode_unicode=True):
+                if first_byte is None:
+                    first_byte = time.monotonic() - started
+                if line.startswith('event:'):
+                    event = line[6:].strip()
+                elif line.startswith('data:') and event in ('done', 'error'):
+                    ok = event == 'done' and json.loads(line[5:]).get('success', False)
+            return response.status_code, first_byte, ok
+
+
+class LoadTest:
+    """Open-loop request scheduler and result collector"""
+
+    def __init__(self, args):
+        self.args = args
+        self.users = [VirtualUser(args.base_url, args.target) for _ in range(args.users)]
+        self.latencies = []
+        self.first_bytes = []
+        self.statuses = Counter()
+        self.failures = 0
+        self._lock = threading.Lock()
+
+    def run(self):
+        run_id = ''.join(random.choices(string.ascii_lowercase + string.digits, k=6))
+        for index, user in enumerate(self.users):
+            user.setup(run_id, index)
+
+        total = int(self.args.rps * self.args.duration)
+        interval = 1.0 / self.args.rps
+        users = itertools.cycle(self.users)
+        messages = itertools.cycle(MESSAGES)
+
+        with ThreadPoolExecutor(max_workers=self.args.concurrency) as executor:
+            started = time.monotonic()
+            for n in range(total):
+                scheduled = started + n * interval
+                delay = scheduled - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                executor.submit(self._one, next(users), next(messages), scheduled)
+        elapsed = time.monotonic() - started
+
+        return self.report(total, elapsed)
+
+    def _one(self, user, message, scheduled):
+        try:
+            status, first_byte, ok = user.send(message)
+        except requests.exceptions.RequestException as e:
+            status, first_byte, ok = type(e).__name__, None, False
+        latency = time.monotonic() - scheduled
+
+        with self._lock:
+            self.statuses[status] += 1
+            if ok:
+                self.latencies.append(latency)
+                if first_byte is not None:
+                    self.first_bytes.append(first_byte)
+            else:
+                self.failures += 1
+
+    def report(self, total, elapsed):
+        latencies = sorted(self.latencies)
+        first_bytes = sorted(self.first_bytes)
+        completed = len(latencies) + self.failures
+
+        def summary(samples):
+            if not samples:
+                return None
+            return {
+                'p50': round(percentile(samples, 0.50), 4),
+                'p95': round(percentile(samples, 0.95), 4),
+                'p99': round(percentile(samples, 0.99), 4),
+                'max': round(samples[-1], 4),
+                'mean': round(sum(samples) / len(samples), 4)
+            }
+
+        return {
+            'target': self.args.target,
+            'requested_rps': self.args.rps,
+            'duration': round(elapsed, 2),
+            'requests': total,
+            'completed': completed,
+            'succeeded': len(latencies),
+            'failed': self.failures,
+            'throughput_rps': round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+            'statuses': {str(status): count for status, count in self.statuses.items()},
+            'latency': summary(latencies),
+            'time_to_first_byte': summary(first_bytes)
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Chat endpoint load generator')
+    parser.add_argument('--base-url', default='http://127.0.0.1:5000')
+    parser.add_argument('--target', choices=['chat', 'stream', 'rpg'], default='chat',
+                        help='chat/stream: app.py; rpg: app_rpg.py')
+    parser.add_argument('--rps', type=float, default=10, help='Target requests per second')
+    parser.add_argument('--duration', type=float, default=30, help='Seconds to send requests for')
+    parser.add_argument('--users', type=int, default=10, help='Virtual users (separate sessions)')
+    parser.add_argument('--concurrency', type=int, default=200, help='Maximum requests in flight')
+    parser.add_argument('--json', action='store_true', help='Print the report as JSON')
+    args = parser.parse_args()
+
+    report = LoadTest(args).run()
+
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+        return
+
+    print(f"Target:             {report['target']} @ {report['requested_rps']} rps for {report['duration']}s")
+    print(f"Requests:           {report['requests']} sent, {report['succeeded']} ok, {report['failed']} failed")
+    print(f"Throughput:         {report['throughput_rps']} successful req/s")
+    print(f"Statuses:           {report['statuses']}")
+    for name in ('latency', 'time_to_first_byte'):
+        stats = report[name]
+        if stats:
+            print(f"{name + ':':<20}p50 {stats['p50']}s  p95 {stats['p95']}s  p99 {stats['p99']}s  max {stats['max']}s")
+
+
+if __name__ == '__main__':
+    main()
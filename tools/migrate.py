@@ -0,0 +1,71 @@
+"""
+Apply or inspect the RPG database schema migrations
+RPG 数据库迁移（执行/查看状态）
+
+Runs the migrations in utils/migrations.py against the app's database while
+the game keeps running: backfills go in batches of --batch-size rows with
+--pause seconds between them, and an interrupted run (Ctrl+C, crash, deploy)
+resumes at the next batch when started again.
+
+The default database is DATABASE_URL with DB_PROFILE's engine settings; relative
+SQLite paths resolve against instance/, as in the app.
+
+Usage:
+    python tools/migrate.py status
+    python tools/migrate.py upgrade
+    python tools/migrate.py upgrade --batch-size 500 --pause 0.2 --database sqlite:///instance/game.db
+"""
+
+import argparse
+import logging
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models import db  # noqa: E402
+from utils.database import create_database_engine  # noqa: E402
+from utils.migrations import MigrationError, migration_status, run_migrations  # noqa: E402
+
+
+def print_status(engine):
+    print(f"{'version':>7}  {'status':<8} {'step':>5}  {'rows':>8}  {'applied at':<19}  name")
+    for entry in migration_status(engine):
+        print(f"{entry['version']:>7}  {entry['status']:<8} {entry['step']:>2}/{entry['steps']:<2}  "
+              f"{entry['rows_done']:>8}  {entry['applied_at'] or '-':<19}  {entry['name']}")
+        if entry['operation']:
+            print(f"{'':>18}next: {entry['operation']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='RPG database schema migrations')
+    parser.add_argument('command', choices=('status', 'upgrade'))
+    parser.add_argument('--database', help='Database URL (default: DATABASE_URL)')
+    parser.add_argument('--batch-size', type=int, default=None, help='Backfill rows per transaction')
+    parser.add_argument('--pause', type=float, default=None, help='Seconds between backfill batches')
+    parser.add_argument('--wait', type=float, default=0,
+                        help='Seconds to wait if another process is migrating (default: fail at once)')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(message)s')
+    engine = create_database_engine(args.database)
+    print(f'Database: {engine.url.render_as_string()}')
+
+    if args.command == 'upgrade':
+        # Tables that do not exist yet are created whole, as by the app's init_database()
+        db.metadata.create_all(engine)
+        try:
+            applied = run_migrations(engine, batch_size=args.batch_size, pause=args.pause, wait=args.wait)
+        except MigrationError as e:
+            print(f'Error: {e}')
+            sys.exit(1)
+        except KeyboardInterrupt:
+            print('\nInterrupted; run upgrade again to resume')
+            sys.exit(130)
+        print(f"Applied: {', '.join(map(str, applied)) or 'nothing pending'}")
+
+    print_status(engine)
+
+
+if __name__ == '__main__':
+    main()
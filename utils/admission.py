@@ -0,0 +1,372 @@
+"""
+Admission control for LLM-bound requests
+LLM 請求的准入控制
+
+Sits in front of the Gemini clients so one user cannot take every worker and
+every upstream quota slot:
+
+- a token bucket per user (session or account) limits the request rate;
+- a global limit caps concurrent upstream calls;
+- requests beyond that wait in a bounded priority queue (combat narration
+  ahead of chat) and give up after queue_timeout.
+
+Rejections are raised as AdmissionRejected carrying a Retry-After estimate, so
+routes can answer immediately with 429/503 instead of piling up behind Gemini.
+The controller is thread-safe and usable from both Flask threads and asyncio
+handlers (a slot released in a thread wakes an asyncio waiter and vice versa).
+"""
+
+import asyncio
+import heapq
+import itertools
+import math
+import threading
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager, contextmanager, nullcontext
+from typing import Dict, Hashable, Optional, Tuple
+
+from config import Config
+
+# Lower value = served first when queued
+PRIORITY_COMBAT = 0
+PRIORITY_CHAT = 1
+
+RATE_LIMITED = 'rate_limited'
+QUEUE_FULL = 'queue_full'
+QUEUE_TIMEOUT = 'queue_timeout'
+
+
+class AdmissionRejected(Exception):
+    """Raised when a request is not admitted"""
+
+    def __init__(self, reason: str, retry_after: float, message: str):
+        super().__init__(message)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """Token bucket refilled continuously at `rate` tokens per second"""
+
+    __slots__ = ('rate', 'capacity', 'tokens', 'updated_at')
+
+    def __init__(self, rate: float, capacity: float, now: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = now
+
+    def take(self, now: float) -> float:
+        """
+        Take one token
+
+        Returns:
+            0 if a token was taken, otherwise seconds until one is available
+        """
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def refund(self):
+        self.tokens = min(self.capacity, self.tokens + 1)
+
+
+class _Waiter:
+    """A queued request; wake() is called (under no lock) once it has been handed a slot"""
+
+    __slots__ = ('wake', 'granted', 'cancelled', 'bucket')
+
+    def __init__(self, wake, bucket: Optional[TokenBucket] = None):
+        self.wake = wake
+        self.granted = False
+        self.cancelled = False
+        self.bucket = bucket  # Token bucket charged for the request, refunded if it is never served
+
+
+class AdmissionTicket:
+    """A held concurrency slot; release() is idempotent"""
+
+    def __init__(self, controller: 'AdmissionController'):
+        self._controller = controller
+        self._acquired_at = time.monotonic()
+        self._released = False
+        self._lock = threading.Lock()
+
+    def release(self):
+        with self._lock:
+            if self._released:
+                return
+            self._released = True
+        self._controller._release(time.monotonic() - self._acquired_at)
+
+
+class AdmissionController:
+    """Per-user token buckets, a global concurrency limit and a bounded priority queue"""
+
+    def __init__(
+        self,
+        max_concurrent: int = 16,
+        queue_size: int = 64,
+        queue_timeout: float = 10,
+        user_rate: float = 0.5,
+        user_burst: float = 5,
+        max_users: int = 10000
+    ):
+        """
+        Args:
+            max_concurrent: Upstream calls allowed at once
+            queue_size: Requests allowed to wait for a slot
+            queue_timeout: Seconds a queued request waits before being rejected
+            user_rate: Sustained requests per second per user (0 disables per-user limits)
+            user_burst: Requests a user may send back-to-back
+            max_users: Token buckets kept (least recently used are dropped)
+        """
+        self.max_concurrent = max_concurrent
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.user_rate = user_rate
+        self.user_burst = user_burst
+        self.max_users = max_users
+
+        self._lock = threading.Lock()
+        self._active = 0
+        self._queue = []  # heap of (priority, seq, waiter); cancelled waiters are skipped lazily
+        self._queued = 0
+        self._seq = itertools.count()
+        self._buckets = OrderedDict()
+        self._hold_time = 1.0  # Moving average of seconds a slot is held, for Retry-After estimates
+        self._counters = {
+            'admitted': 0, 'queued': 0, 'rate_limited': 0,
+            'queue_full': 0, 'queue_timeout': 0
+        }
+
+    # ------------------------------------------------------------------
+    # Acquire / release
+    # ------------------------------------------------------------------
+
+    def acquire(self, user_id: Optional[Hashable] = None, priority: int = PRIORITY_CHAT) -> AdmissionTicket:
+        """
+        Wait for a slot (blocking the calling thread)
+
+        Args:
+            user_id: Key of the per-user token bucket (None skips the per-user limit)
+            priority: PRIORITY_COMBAT or PRIORITY_CHAT
+
+        Returns:
+            Ticket to release when the upstream call is finished
+
+        Raises:
+            AdmissionRejected: If rate limited, the queue is full or the wait timed out
+        """
+        event = threading.Event()
+        waiter = self._admit(user_id, priority, event.set)
+        if waiter is not None:
+            event.wait(self.queue_timeout)
+            self._finish_wait(waiter)
+        return AdmissionTicket(self)
+
+    async def acquire_async(self, user_id: Optional[Hashable] = None, priority: int = PRIORITY_CHAT) -> AdmissionTicket:
+        """Async counterpart of acquire (waits without blocking the event loop)"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        def wake():
+            loop.call_soon_threadsafe(lambda: future.done() or future.set_result(None))
+
+        waiter = self._admit(user_id, priority, wake)
+        if waiter is not None:
+            try:
+                await asyncio.wait_for(future, self.queue_timeout)
+            except asyncio.TimeoutError:
+                pass
+            except asyncio.CancelledError:
+                self._abandon(waiter)
+                raise
+            self._finish_wait(waiter)
+        return AdmissionTicket(self)
+
+    @contextmanager
+    def slot(self, user_id: Optional[Hashable] = None, priority: int = PRIORITY_CHAT):
+        """Hold a slot for the duration of a with-block"""
+        ticket = self.acquire(user_id, priority)
+        try:
+            yield ticket
+        finally:
+            ticket.release()
+
+    @asynccontextmanager
+    async def async_slot(self, user_id: Optional[Hashable] = None, priority: int = PRIORITY_CHAT):
+        """Hold a slot for the duration of an async with-block"""
+        ticket = await self.acquire_async(user_id, priority)
+        try:
+            yield ticket
+        finally:
+            ticket.release()
+
+    def _admit(self, user_id, priority, wake) -> Optional[_Waiter]:
+        """Take a slot or a queue position; returns the waiter if the caller must wait"""
+        now = time.monotonic()
+        with self._lock:
+            bucket = None
+            if user_id is not None and self.user_rate > 0:
+                bucket = self._bucket(user_id, now)
+                wait = bucket.take(now)
+                if wait:
+                    self._counters['rate_limited'] += 1
+                    raise AdmissionRejected(RATE_LIMITED, wait, 'Too many requests, please slow down')
+
+            if self._active < self.max_concurrent:
+                self._active += 1
+                self._counters['admitted'] += 1
+                return None
+
+            if self._queued >= self.queue_size:
+                # The request never ran, so it should not count against the user's rate
+                if bucket is not None:
+                    bucket.refund()
+                self._counters['queue_full'] += 1
+                raise AdmissionRejected(QUEUE_FULL, self._estimated_wait(), 'Server is busy, please try again shortly')
+
+            waiter = _Waiter(wake, bucket)
+            heapq.heappush(self._queue, (priority, next(self._seq), waiter))
+            self._queued += 1
+            self._counters['queued'] += 1
+            return waiter
+
+    def _finish_wait(self, waiter: _Waiter):
+        """After waking or timing out: keep the handed-over slot, or leave the queue and reject"""
+        with self._lock:
+            if waiter.granted:
+                self._counters['admitted'] += 1
+                return
+            waiter.cancelled = True
+            self._queued -= 1
+            self._refund(waiter)
+            self._counters['queue_timeout'] += 1
+            retry_after = self._estimated_wait()
+        raise AdmissionRejected(QUEUE_TIMEOUT, retry_after, 'Server is busy, please try again shortly')
+
+    def _abandon(self, waiter: _Waiter):
+        """Leave the queue on cancellation, passing on a slot handed over in the meantime"""
+        with self._lock:
+            if not waiter.granted:
+                waiter.cancelled = True
+                self._queued -= 1
+                self._refund(waiter)
+                return
+        self._release(0.0)
+
+    def _release(self, held: float):
+        """Hand the slot to the best queued waiter, or free it"""
+        with self._lock:
+            self._hold_time += 0.1 * (held - self._hold_time)
+            while self._queue:
+                _, _, waiter = heapq.heappop(self._queue)
+                if waiter.cancelled:
+                    continue
+                waiter.granted = True
+                self._queued -= 1
+                break
+            else:
+                self._active -= 1
+                return
+        waiter.wake()
+
+    # ------------------------------------------------------------------
+    # Helpers
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _refund(waiter: _Waiter):
+        """Return the token of a queued request that was never served (call under self._lock)"""
+        if waiter.bucket is not None:
+            waiter.bucket.refund()
+
+    def _bucket(self, user_id, now: float) -> TokenBucket:
+        bucket = self._buckets.get(user_id)
+        if bucket is None:
+            bucket = TokenBucket(self.user_rate, self.user_burst, now)
+            self._buckets[user_id] = bucket
+            if len(self._buckets) > self.max_users:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(user_id)
+        return bucket
+
+    def _estimated_wait(self) -> float:
+        """Rough seconds until a new request could be served"""
+        return self._hold_time * (self._queued + 1) / self.max_concurrent
+
+    def stats(self) -> Dict:
+        """Current load and admission counters"""
+        with self._lock:
+            return dict(
+                self._counters,
+                enabled=True,
+                active=self._active,
+                waiting=self._queued,
+                max_concurrent=self.max_concurrent,
+                queue_size=self.queue_size,
+                tracked_users=len(self._buckets),
+                avg_hold_time=round(self._hold_time, 3)
+            )
+
+
+def rejection_response(error: AdmissionRejected) -> Tuple[Dict, int, Dict]:
+    """
+    Build the JSON body, HTTP status and headers for a rejected request
+
+    Returns:
+        Tuple of (body, status, headers): 429 when the user is rate limited,
+        503 when the server is saturated
+    """
+    retry_after = max(1, math.ceil(error.retry_after))
+    status = 429 if error.reason == RATE_LIMITED else 503
+    return {
+        'success': False,
+        'error': str(error),
+        'reason': error.reason,
+        'retry_after': retry_after
+    }, status, {'Retry-After': str(retry_after)}
+
+
+def admission_slot(controller: Optional[AdmissionController], user_id, priority: int = PRIORITY_CHAT):
+    """controller.slot(...), or a no-op context manager when admission control is off"""
+    if controller is None:
+        return nullcontext()
+    return controller.slot(user_id, priority)
+
+
+def admission_async_slot(controller: Optional[AdmissionController], user_id, priority: int = PRIORITY_CHAT):
+    """controller.async_slot(...), or a no-op async context manager when admission control is off"""
+    if controller is None:
+        return _null_async_slot()
+    return controller.async_slot(user_id, priority)
+
+
+@asynccontextmanager
+async def _null_async_slot():
+    yield None
+
+
+def create_admission_controller() -> Optional[AdmissionController]:
+    """
+    Build the admission controller from Config
+
+    Returns:
+        AdmissionController, or None when ADMISSION_ENABLED is off
+    """
+    if not Config.ADMISSION_ENABLED:
+        return None
+    return AdmissionController(
+        max_concurrent=Config.ADMISSION_MAX_CONCURRENT,
+        queue_size=Config.ADMISSION_QUEUE_SIZE,
+        queue_timeout=Config.ADMISSION_QUEUE_TIMEOUT,
+        user_rate=Config.ADMISSION_USER_RATE,
+        user_burst=Config.ADMISSION_USER_BURST,
+        max_users=Config.ADMISSION_MAX_TRACKED_USERS
+    )
@@ -0,0 +1,243 @@
+"""
+Async Gemini client for the ASGI chat endpoints
+非同步 Gemini 客戶端（供 ASGI 對話端點使用）
+
+``GeminiClient`` blocks a worker thread for the whole upstream call. This client
+has the same ``generate_response`` / ``stream_response`` contract but awaits the
+HTTP call on an event loop, so one process can hold many in-flight LLM calls.
+"""
+
+import asyncio
+import json
+import time
+from typing import AsyncIterator, Dict, List, Optional
+
+import httpx
+
+from config import Config
+from .context_cache import CONTEXT_CACHE_MISS_STATUSES
+from .llm_client import BaseGeminiClient
+from .llm_providers import LLMProvider
+from .resilience import CircuitOpenError
+from .response_cache import ResponseCache
+from .single_flight import AsyncSingleFlight, SingleFlightTimeout
+from .stream_parser import ResponseStreamParser
+
+
+class AsyncGeminiClient(BaseGeminiClient):
+    """Asyncio client for interacting with Google Gemini 2.0 Flash API"""
+
+    def __init__(
+        self,
+        api_key: Optional[str] = None,
+        client: Optional[httpx.AsyncClient] = None,
+        response_cache: Optional[ResponseCache] = None
+    ):
+        """
+        Initialize async Gemini client
+
+        Args:
+            api_key: Gemini API key (uses Config.GEMINI_API_KEY if not provided)
+            client: httpx.AsyncClient to reuse (created lazily on first request if not provided)
+            response_cache: Cache for identical prompts (built from Config.LLM_CACHE_* if not provided)
+        """
+        super().__init__(api_key, response_cache)
+        self._client = client
+        self.single_flight = AsyncSingleFlight(Config.LLM_COALESCE_WAIT_TIMEOUT) if Config.LLM_COALESCE_ENABLED else None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """Pooled keep-alive HTTP client, bound to the running event loop"""
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                timeout=self.timeout,
+                limits=httpx.Limits(
+                    max_connections=Config.GEMINI_POOL_MAXSIZE,
+                    max_keepalive_connections=Config.GEMINI_POOL_MAXSIZE
+                )
+            )
+        return self._client
+
+    async def aclose(self):
+        """Close pooled connections"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def generate_response(
+        self,
+        user_message: str,
+        current_scene: str,
+        conversation_history: Optional[List[Dict]] = None,
+        system_context: Optional[str] = None
+    ) -> Dict:
+        """
+        Generate AI response using Gemini API (see GeminiClient.generate_response)
+
+        Returns:
+            Dict with 'success' and either 'data' (message/emoji/scene/mcp_command) or 'error'
+        """
+        prompt = self._build_prompt(user_message, current_scene, conversation_history, system_context)
+
+        result = await self.generate_text(prompt, self._response_schema(system_context))
+        if not result['success']:
+            return result
+
+        return {
+            'success': True,
+            'data': self._parse_ai_response(result['text'], current_scene)
+        }
+
+    async def generate_text(self, prompt: str, response_schema: Optional[Dict] = None) -> Dict:
+        """
+        Generate raw model text for a prompt built by the caller (see GeminiClient.generate_text)
+
+        Returns:
+            Dict with 'success' and either 'text' or 'error'
+        """
+        payload = self._build_payload(prompt, response_schema)
+
+        request_key = self._request_key(prompt, payload)
+        cached_text = self._cache_get(request_key)
+        if cached_text is not None:
+            return {'success': True, 'text': cached_text}
+
+        try:
+            if self.single_flight:
+                ai_text = await self.single_flight.do(request_key, lambda: self._fetch_text(prompt, payload, request_key))
+            else:
+                ai_text = await self._fetch_text(prompt, payload, request_key)
+
+            return {'success': True, 'text': ai_text}
+
+        except httpx.HTTPError as e:
+            return {
+                'success': False,
+                'error': f'API request failed: {str(e)}'
+            }
+        except SingleFlightTimeout as e:
+            return {
+                'success': False,
+                'error': f'API request timed out: {str(e)}'
+            }
+        except CircuitOpenError as e:
+            return {
+                'success': False,
+                'error': f'API temporarily unavailable: {str(e)}'
+            }
+        except (KeyError, IndexError, json.JSONDecodeError) as e:
+            return {
+                'success': False,
+                'error': f'Failed to parse API response: {str(e)}'
+            }
+
+    async def _post(self, prompt: str, payload: Dict, stream: bool = False):
+        """Async counterpart of GeminiClient._post (close streamed responses with aclose())"""
+        error = None
+        for provider in self.router.ordered():
+            self.router.begin(provider)
+            started = time.monotonic()
+            try:
+                response = await self._post_to(provider, prompt, payload, stream)
+            except (httpx.HTTPError, CircuitOpenError) as e:
+                self.router.end(provider, time.monotonic() - started, ok=False)
+                error = e
+                continue
+            except BaseException:
+                # Cancelled or a bug on our side: nothing to learn about the provider
+                self.router.end(provider, time.monotonic() - started, ok=None)
+                raise
+            self.router.end(provider, time.monotonic() - started, ok=True)
+            return provider, response
+        raise error
+
+    async def _post_to(self, provider: LLMProvider, prompt: str, payload: Dict, stream: bool) -> httpx.Response:
+        """Async counterpart of GeminiClient._post_to"""
+        cached_content = None
+        if self.context_cache and provider.supports_context_cache:
+            # Registration and refresh are blocking calls; keep them off the event loop
+            cached_content = await asyncio.to_thread(self._cached_context_for, prompt)
+
+        if cached_content:
+            response = await self._send(provider, self._cached_payload(payload, prompt, cached_content), stream)
+            if response.status_code not in CONTEXT_CACHE_MISS_STATUSES:
+                return await self._raise_for_status(response)
+
+            # The cached context expired or was deleted upstream; retry with the prefix inlined
+            await response.aclose()
+            self.context_cache.invalidate(prompt.static_prefix)
+
+        response = await self._send(provider, payload, stream)
+        return await self._raise_for_status(response)
+
+    async def _send(self, provider: LLMProvider, payload: Dict, stream: bool) -> httpx.Response:
+        """Send one request under the provider's retry / hedge / circuit-breaker policy"""
+        url, headers, body = provider.request(payload, stream)
+        return await provider.resilience.execute_async(
+            lambda: self.client.send(self.client.build_request('POST', url, headers=headers, json=body), stream=stream),
+            hedge=not stream
+        )
+
+    @staticmethod
+    async def _raise_for_status(response: httpx.Response) -> httpx.Response:
+        """Raise HTTPStatusError for error statuses, releasing the connection first"""
+        if response.is_error:
+            await response.aclose()
+        response.raise_for_status()
+        return response
+
+    async def _fetch_text(self, prompt: str, payload: Dict, request_key: str) -> str:
+        """Generate text with the routed provider and return (and cache) it"""
+        provider, response = await self._post(prompt, payload)
+
+        ai_text = provider.extract_text(response.json())
+        self._cache_set(request_key, ai_text)
+        return ai_text
+
+    async def stream_response(
+        self,
+        user_message: str,
+        current_scene: str,
+        conversation_history: Optional[List[Dict]] = None,
+        system_context: Optional[str] = None
+    ) -> AsyncIterator[Dict]:
+        """
+        Stream AI response using the streamGenerateContent endpoint
+
+        Yields:
+            The same 'delta' / 'done' / 'error' events as GeminiClient.stream_response
+        """
+        prompt = self._build_prompt(user_message, current_scene, conversation_history, system_context)
+        payload = self._build_payload(prompt, self._response_schema(system_context))
+        streamer = ResponseStreamParser()
+
+        request_key = self._request_key(prompt, payload)
+        cached_text = self._cache_get(request_key)
+        if cached_text is not None:
+            for event in self._replay_cached(cached_text, current_scene):
+                yield event
+            return
+
+        try:
+            provider, response = await self._post(prompt, payload, stream=True)
+            try:
+                async for line in response.aiter_lines():
+                    for text in provider.stream_chunk_texts(line):
+                        delta = streamer.feed(text)
+                        if delta:
+                            yield {'event': 'delta', 'text': delta}
+            finally:
+                await response.aclose()
+
+            self._cache_set(request_key, streamer.text)
+            yield {
+                'event': 'done',
+                'data': self._parse_ai_response(streamer.text, current_scene, streamer.fields)
+            }
+
+        except httpx.HTTPError as e:
+            yield {'event': 'error', 'error': f'API request failed: {str(e)}'}
+        except CircuitOpenError as e:
+            yield {'event': 'error', 'error': f'API temporarily unavailable: {str(e)}'}
+        except (KeyError, IndexError, ValueError) as e:
+            yield {'event': 'error', 'error': f'Failed to parse API response: {str(e)}'}
@@ -0,0 +1,165 @@
+"""
+Combat log - typed events in a bounded ring buffer
+戰鬥日誌 - 固定容量環形緩衝區中的事件記錄
+
+Each entry is a compact event ``[seq, actor, kind, amount, crit, detail]``
+rather than a formatted string. Entries are rendered to text only when a client
+or the narrator asks for them. The log keeps at most ``capacity`` entries (the
+oldest are overwritten), and every entry carries a monotonically increasing
+sequence number, so callers can ask for "entries since N" no matter how long
+the fight has run.
+
+The log is stored inside combat_state as a plain JSON-serializable dict, so it
+works with every SessionStore backend:
+
+    {'capacity': 50, 'seq': 123, 'entries': [...], 'enemy': '史莱姆', 'icon': '🟢'}
+"""
+
+from typing import Any, Dict, List, Optional
+
+from config import Config
+from .game_data import ITEMS
+
+PLAYER = 'player'
+ENEMY = 'enemy'
+
+# (actor, kind[, crit]) -> template; fields: enemy, icon, amount, detail
+_TEMPLATES = {
+    (ENEMY, 'encounter'): '遭遇了 {icon} {enemy}！',
+    (PLAYER, 'attack'): '⚔️ 你攻击 {enemy}，造成了 {amount} 点伤害',
+    (PLAYER, 'attack', True): '💥 暴击！你对 {enemy} 造成了 {amount} 点伤害！',
+    (ENEMY, 'attack'): '👹 {enemy} 攻击你，造成了 {amount} 点伤害',
+    (ENEMY, 'attack', True): '💥 {enemy} 暴击！对你造成了 {amount} 点伤害！',
+    (PLAYER, 'defend'): '🛡️ 你进入了防御姿态',
+    (PLAYER, 'item_invalid'): '❌ 无法使用该物品',
+    (PLAYER, 'heal'): '💊 使用 {detail}，恢复了 {amount} HP',
+    (PLAYER, 'restore_mp'): '💙 使用 {detail}，恢复了 {amount} MP',
+    (PLAYER, 'full_restore'): '✨ 使用 {detail}，完全恢复！',
+    (ENEMY, 'ability'): '🔥 {enemy} 使用了 {detail}！造成了 {amount} 点伤害！',
+    (ENEMY, 'drain'): '💚 {enemy} 吸取了 {amount} 点生命值',
+    (ENEMY, 'phase'): '⚠️ {detail}',
+    (ENEMY, 'flee_blocked'): '❌ 无法逃离！{enemy} 阻止了你的逃跑！',
+    (PLAYER, 'flee'): '🏃 成功逃离了战斗！',
+    (PLAYER, 'flee_failed'): '❌ 逃跑失败！',
+    (PLAYER, 'victory'): '🎉 战斗胜利！',
+    (PLAYER, 'exp'): '📈 获得 {amount} 经验值',
+    (PLAYER, 'gold'): '💰 获得 {amount} 金币',
+    (PLAYER, 'level_up'): '⬆️ 等级提升！当前等级: {amount}',
+    (PLAYER, 'loot'): '🎁 获得物品: {detail}',
+    (PLAYER, 'game_complete'): '👑 恭喜！你击败了魔王，拯救了世界！',
+    (PLAYER, 'defeat'): '💀 你被击败了...',
+    (PLAYER, 'gold_lost'): '💸 失去了 {amount} 金币',
+    (PLAYER, 'respawn'): '你在 {detail} 醒来',
+}
+
+# Kinds whose detail is an item id (or list of ids), rendered as item names
+_ITEM_DETAILS = frozenset({'heal', 'restore_mp', 'full_restore', 'loot'})
+
+_SEQ, _ACTOR, _KIND, _AMOUNT, _CRIT, _DETAIL = range(6)
+
+
+class CombatLog:
+    """View over the log dict stored in combat_state['log']"""
+
+    __slots__ = ('data',)
+
+    def __init__(self, data: Dict):
+        """
+        Args:
+            data: The log dict (mutated in place by append)
+        """
+        self.data = data
+
+    @classmethod
+    def create(cls, enemy: Dict, capacity: Optional[int] = None) -> 'CombatLog':
+        """
+        Start an empty log for an encounter
+
+        Args:
+            enemy: Enemy instance from combat_state (name and icon are kept for rendering)
+            capacity: Entries kept (Config.COMBAT_LOG_CAPACITY if not provided)
+        """
+        return cls({
+            'capacity': capacity or Config.COMBAT_LOG_CAPACITY,
+            'seq': 0,
+            'entries': [],
+            'enemy': enemy['name'],
+            'icon': enemy['icon']
+        })
+
+    @property
+    def next_seq(self) -> int:
+        """Sequence number the next entry will get"""
+        return self.data['seq']
+
+    @property
+    def first_seq(self) -> int:
+        """Sequence number of the oldest entry still held"""
+        return self.data['seq'] - len(self.data['entries'])
+
+    @property
+    def capacity(self) -> int:
+        return self.data['capacity']
+
+    def __len__(self) -> int:
+        return len(self.data['entries'])
+
+    def append(self, actor: str, kind: str, amount: int = 0, crit: bool = False, detail: Any = None) -> int:
+        """
+        Record an event, overwriting the oldest entry once the log is full
+
+        Args:
+            actor: PLAYER or ENEMY
+            kind: Event kind (a key of the render templates)
+            amount: Damage, healing, gold, level, ...
+            crit: Whether the hit was critical
+            detail: Item id(s), ability name or other text the template needs
+
+        Returns:
+            Sequence number of the new entry
+        """
+        data = self.data
+        seq = data['seq']
+        entry = [seq, actor, kind, amount, crit, detail]
+        entries = data['entries']
+        if len(entries) < data['capacity']:
+            entries.append(entry)
+        else:
+            entries[seq % data['capacity']] = entry
+        data['seq'] = seq + 1
+        return seq
+
+    def since(self, seq: int = 0) -> List[List]:
+        """Entries with sequence number >= seq that are still held, oldest first"""
+        data = self.data
+        entries = data['entries']
+        capacity = data['capacity']
+        return [entries[index % capacity] for index in range(max(seq, self.first_seq), data['seq'])]
+
+    def render(self, entry: List) -> str:
+        """Format one entry as a log line"""
+        actor, kind, crit = entry[_ACTOR], entry[_KIND], entry[_CRIT]
+        template = _TEMPLATES.get((actor, kind, True)) if crit else None
+        template = template or _TEMPLATES.get((actor, kind), '{detail}')
+        detail = entry[_DETAIL]
+        if kind in _ITEM_DETAILS:
+            detail = _item_names(detail)
+        return template.format(
+            enemy=self.data['enemy'],
+            icon=self.data['icon'],
+            amount=entry[_AMOUNT],
+            detail='' if detail is None else detail
+        )
+
+    def lines(self, since: int = 0) -> List[str]:
+        """Rendered lines of the entries since a sequence number"""
+        return [self.render(entry) for entry in self.since(since)]
+
+    def numbered_lines(self, since: int = 0) -> List[tuple]:
+        """(sequence number, rendered line) pairs of the entries since a sequence number"""
+        return [(entry[_SEQ], self.render(entry)) for entry in self.since(since)]
+
+
+def _item_names(detail) -> str:
+    item_ids = detail if isinstance(detail, list) else [detail]
+    return ', '.join(ITEMS.get(item_id, {}).get('name', str(item_id)) for item_id in item_ids)
@@ -8,25 +8,30 @@ Gemini can only provide narrative descriptions, not calculate damage.
 Gemini 只能提供叙述描述，不能计算伤害。
 """
 
-import random
-from typing import Dict, List, Tuple
-from .game_data import ENEMIES, ITEMS
+from typing import Dict, List, Optional, Tuple
+from .combat_log import ENEMY, PLAYER, CombatLog
+from .game_data import COMBAT_RULES, ENEMIES, ITEMS
+from .rng import SeededRNG
+
+# Character fields a replay starts from
+_REPLAY_FIELDS = ('level', 'experience', 'hp', 'max_hp', 'mp', 'max_mp', 'attack', 'defense', 'gold', 'character_class')
 
 
 class CombatManager:
     """Manages combat encounters and calculations"""
 
     @staticmethod
-    def start_combat(character, enemy_id: str) -> Dict:
+    def start_combat(character, enemy_id: str, seed: Optional[int] = None) -> Dict:
         """
         Start a new combat encounter
 
         Args:
             character: Character model instance
             enemy_id: Enemy ID from ENEMIES
+            seed: Seed of the fight's random stream (a fresh one if not provided)
 
         Returns:
-            Combat state dictionary
+            Combat state dictionary (its 'replay' record reproduces the fight with replay())
         """
         enemy_data = ENEMIES.get(enemy_id)
         if not enemy_data:
@@ -47,6 +52,10 @@ class CombatManager:
             'ability_cooldowns': {}
         }
 
+        log = CombatLog.create(enemy)
+        log.append(ENEMY, 'encounter')
+        rng = SeededRNG.create(seed)
+
         combat_state = {
             'active': True,
             'turn': 1,
@@ -59,14 +68,81 @@ class CombatManager:
                 'attack': character.attack,
                 'defense': character.defense
             },
-            'log': [f'遭遇了 {enemy["icon"]} {enemy["name"]}！']
+            'log': log.data,
+            'rng': rng.data,
+            'replay': {
+                'seed': rng.seed,
+                'enemy_id': enemy_id,
+                'character': {field: getattr(character, field) for field in _REPLAY_FIELDS},
+                'actions': []
+            }
         }
 
         return combat_state
 
+    @staticmethod
+    def _log(combat_state: Dict) -> CombatLog:
+        """The encounter's combat log"""
+        return CombatLog(combat_state['log'])
+
+    @staticmethod
+    def _rng(combat_state: Dict) -> SeededRNG:
+        """The encounter's random stream"""
+        # Fights stored before streams existed get a fresh one
+        return SeededRNG(combat_state.setdefault('rng', SeededRNG.create().data))
+
+    @staticmethod
+    def apply_action(combat_state: Dict, character, action: str, item_id: Optional[str] = None) -> Dict:
+        """
+        Execute one player action and record it for replay
+
+        Args:
+            combat_state: Current combat state
+            character: Character instance
+            action: attack, defend, flee or use_item
+            item_id: Consumable to use (use_item only; the caller takes it from the inventory)
+
+        Returns:
+            Updated combat state
+        """
+        if action == 'attack':
+            result = CombatManager.player_attack(combat_state, character)
+        elif action == 'defend':
+            result = CombatManager.player_defend(combat_state, character)
+        elif action == 'flee':
+            _, result = CombatManager.attempt_flee(combat_state)
+        elif action == 'use_item':
+            result = CombatManager.player_use_item(combat_state, character, item_id)
+        else:
+            raise ValueError(f"Invalid combat action: {action}")
+
+        if 'replay' in result:
+            result['replay']['actions'].append([action, item_id] if item_id else [action])
+        return result
+
+    @staticmethod
+    def replay(record: Dict) -> Tuple[Dict, object]:
+        """
+        Re-run a recorded fight
+
+        Args:
+            record: combat_state['replay'] (seed, enemy_id, starting character fields, actions)
+
+        Returns:
+            Tuple of (final combat state, in-memory Character after the fight)
+        """
+        from models import Character
+
+        character = Character(name='replay', **record['character'])
+        combat_state = CombatManager.start_combat(character, record['enemy_id'], seed=record['seed'])
+        for action in record['actions']:
+            combat_state = CombatManager.apply_action(combat_state, character, *action)
+        return combat_state, character
+
     @staticmethod
     def calculate_damage(attacker_attack: int, defender_defense: int,
-                        is_critical: bool = False, multiplier: float = 1.0) -> int:
+                        is_critical: bool = False, multiplier: float = 1.0,
+                        rng: Optional[SeededRNG] = None) -> int:
         """
         Calculate damage (backend controlled)
 
@@ -75,6 +151,7 @@ class CombatManager:
             defender_defense: Defender's defense value
             is_critical: Whether this is a critical hit
             multiplier: Damage multiplier
+            rng: Random stream (a fresh one if not provided)
 
         Returns:
             Final damage amount
@@ -82,19 +159,19 @@ class CombatManager:
         base_damage = max(1, attacker_attack - defender_defense)
 
         # Add variance (90% - 110%)
-        variance = random.uniform(0.9, 1.1)
+        variance = (rng or SeededRNG.create()).uniform(*COMBAT_RULES['damage_variance'])
         damage = int(base_damage * variance * multiplier)
 
         # Critical hit
         if is_critical:
-            damage = int(damage * 1.5)
+            damage = int(damage * COMBAT_RULES['crit_multiplier'])
 
         return max(1, damage)
 
     @staticmethod
-    def check_critical_hit() -> bool:
+    def check_critical_hit(rng: Optional[SeededRNG] = None) -> bool:
         """Check if attack is critical hit (15% chance)"""
-        return random.random() < 0.15
+        return (rng or SeededRNG.create()).random() < COMBAT_RULES['crit_chance']
 
     @staticmethod
     def player_attack(combat_state: Dict, character) -> Dict:
@@ -109,25 +186,24 @@ class CombatManager:
             Updated combat state with results
         """
         enemy = combat_state['enemy']
+        rng = CombatManager._rng(combat_state)
 
         # Check critical hit
-        is_critical = CombatManager.check_critical_hit()
+        is_critical = CombatManager.check_critical_hit(rng)
 
         # Calculate damage
         damage = CombatManager.calculate_damage(
             character.attack,
             enemy['defense'],
-            is_critical
+            is_critical,
+            rng=rng
         )
 
         # Apply damage
         enemy['hp'] -= damage
 
         # Create log entry
-        if is_critical:
-            combat_state['log'].append(f"💥 暴击！你对 {enemy['name']} 造成了 {damage} 点伤害！")
-        else:
-            combat_state['log'].append(f"⚔️ 你攻击 {enemy['name']}，造成了 {damage} 点伤害")
+        CombatManager._log(combat_state).append(PLAYER, 'attack', damage, is_critical)
 
         # Check if enemy defeated
         if enemy['hp'] <= 0:
@@ -150,11 +226,11 @@ class CombatManager:
             Updated combat state
         """
         combat_state['defending'] = True
-        combat_state['log'].append("🛡️ 你进入了防御姿态")
+        CombatManager._log(combat_state).append(PLAYER, 'defend')
 
         # Enemy turn with reduced damage
         result = CombatManager.enemy_turn(combat_state, character,
-                                         defend_multiplier=0.5)
+                                         defend_multiplier=COMBAT_RULES['defend_multiplier'])
         combat_state['defending'] = False
 
         return result
@@ -174,7 +250,7 @@ class CombatManager:
         """
         item_data = ITEMS.get(item_id)
         if not item_data or item_data['type'] != 'consumable':
-            combat_state['log'].append("❌ 无法使用该物品")
+            CombatManager._log(combat_state).append(PLAYER, 'item_invalid')
             return combat_state
 
         # Apply item effect
@@ -182,20 +258,20 @@ class CombatManager:
             heal_amount = item_data['heal_amount']
             character.heal(heal_amount)
             combat_state['character']['hp'] = character.hp
-            combat_state['log'].append(f"💊 使用 {item_data['name']}，恢复了 {heal_amount} HP")
+            CombatManager._log(combat_state).append(PLAYER, 'heal', heal_amount, detail=item_id)
 
         elif item_data['effect'] == 'restore_mp':
             mp_amount = item_data['mp_amount']
             character.restore_mp(mp_amount)
             combat_state['character']['mp'] = character.mp
-            combat_state['log'].append(f"💙 使用 {item_data['name']}，恢复了 {mp_amount} MP")
+            CombatManager._log(combat_state).append(PLAYER, 'restore_mp', mp_amount, detail=item_id)
 
         elif item_data['effect'] == 'full_restore':
             character.heal(character.max_hp)
             character.restore_mp(character.max_mp)
             combat_state['character']['hp'] = character.hp
             combat_state['character']['mp'] = character.mp
-            combat_state['log'].append(f"✨ 使用 {item_data['name']}，完全恢复！")
+            CombatManager._log(combat_state).append(PLAYER, 'full_restore', detail=item_id)
 
         # Enemy turn
         return CombatManager.enemy_turn(combat_state, character)
@@ -217,7 +293,7 @@ class CombatManager:
         enemy_data = ENEMIES.get(enemy['id'])
 
         # Check for special abilities (BOSS only)
-        if 'special_abilities' in enemy_data and enemy['level'] >= 10:
+        if 'special_abilities' in enemy_data and enemy['level'] >= COMBAT_RULES['boss_level']:
             ability = CombatManager._check_special_ability(combat_state, enemy_data)
             if ability:
                 return CombatManager._execute_special_ability(
@@ -225,12 +301,14 @@ class CombatManager:
                 )
 
         # Normal attack
-        is_critical = CombatManager.check_critical_hit()
+        rng = CombatManager._rng(combat_state)
+        is_critical = CombatManager.check_critical_hit(rng)
         damage = CombatManager.calculate_damage(
             enemy['attack'],
             character.defense,
             is_critical,
-            defend_multiplier
+            defend_multiplier,
+            rng
         )
 
         # Apply damage to character
@@ -238,10 +316,7 @@ class CombatManager:
         combat_state['character']['hp'] = character.hp
 
         # Log
-        if is_critical:
-            combat_state['log'].append(f"💥 {enemy['name']} 暴击！对你造成了 {damage} 点伤害！")
-        else:
-            combat_state['log'].append(f"👹 {enemy['name']} 攻击你，造成了 {damage} 点伤害")
+        CombatManager._log(combat_state).append(ENEMY, 'attack', damage, is_critical)
 
         # Check if player died
         if character.hp <= 0:
@@ -261,10 +336,11 @@ class CombatManager:
         """Check if enemy should use special ability"""
         abilities = enemy_data.get('special_abilities', [])
         enemy = combat_state['enemy']
+        rng = CombatManager._rng(combat_state)
 
         for ability in abilities:
             cooldown = enemy['ability_cooldowns'].get(ability['name'], 0)
-            if cooldown == 0 and random.random() < 0.3:  # 30% chance
+            if cooldown == 0 and rng.random() < COMBAT_RULES['special_ability_chance']:
                 return ability
 
         # Decrement cooldowns
@@ -284,7 +360,8 @@ class CombatManager:
         damage = CombatManager.calculate_damage(
             enemy['attack'],
             character.defense,
-            multiplier=ability['damage_multiplier'] * defend_multiplier
+            multiplier=ability['damage_multiplier'] * defend_multiplier,
+            rng=CombatManager._rng(combat_state)
         )
 
         # Apply damage
@@ -292,15 +369,13 @@ class CombatManager:
         combat_state['character']['hp'] = character.hp
 
         # Log special ability
-        combat_state['log'].append(
-            f"🔥 {enemy['name']} 使用了 {ability['name']}！造成了 {damage} 点伤害！"
-        )
+        CombatManager._log(combat_state).append(ENEMY, 'ability', damage, detail=ability['name'])
 
         # Heal if applicable
         if 'heal_percent' in ability:
             heal_amount = int(damage * ability['heal_percent'])
             enemy['hp'] = min(enemy['max_hp'], enemy['hp'] + heal_amount)
-            combat_state['log'].append(f"💚 {enemy['name']} 吸取了 {heal_amount} 点生命值")
+            CombatManager._log(combat_state).append(ENEMY, 'drain', heal_amount)
 
         # Set cooldown
         enemy['ability_cooldowns'][ability['name']] = ability['cooldown']
@@ -326,7 +401,7 @@ class CombatManager:
                 if 'attack_multiplier' in phase:
                     enemy['attack'] = int(enemy['attack'] * phase['attack_multiplier'])
 
-                combat_state['log'].append(f"⚠️ {phase['message']}")
+                CombatManager._log(combat_state).append(ENEMY, 'phase', detail=phase['message'])
                 enemy['current_phase'] = current_phase + 1
 
     @staticmethod
@@ -344,19 +419,19 @@ class CombatManager:
         enemy_data = ENEMIES.get(enemy['id'])
 
         # Cannot flee from bosses
-        if enemy_data['level'] >= 10:
-            combat_state['log'].append("❌ 无法逃离！{enemy['name']} 阻止了你的逃跑！")
+        if enemy_data['level'] >= COMBAT_RULES['boss_level']:
+            CombatManager._log(combat_state).append(ENEMY, 'flee_blocked')
             # Enemy gets free attack
             return False, combat_state
 
         # 50% chance to flee
-        if random.random() < 0.5:
-            combat_state['log'].append("🏃 成功逃离了战斗！")
+        if CombatManager._rng(combat_state).random() < COMBAT_RULES['flee_chance']:
+            CombatManager._log(combat_state).append(PLAYER, 'flee')
             combat_state['active'] = False
             combat_state['fled'] = True
             return True, combat_state
         else:
-            combat_state['log'].append("❌ 逃跑失败！")
+            CombatManager._log(combat_state).append(PLAYER, 'flee_failed')
             return False, combat_state
 
     @staticmethod
@@ -390,29 +465,30 @@ class CombatManager:
             combat_state['gold_gained'] = gold_gained
 
             # Process loot
-            loot_items = CombatManager._process_loot(enemy_data['loot'])
+            loot_items = CombatManager._process_loot(enemy_data['loot'], CombatManager._rng(combat_state))
             combat_state['loot'] = loot_items
 
             # Log victory
-            combat_state['log'].append(f"🎉 战斗胜利！")
-            combat_state['log'].append(f"📈 获得 {exp_gained} 经验值")
-            combat_state['log'].append(f"💰 获得 {gold_gained} 金币")
+            log = CombatManager._log(combat_state)
+            log.append(PLAYER, 'victory')
+            log.append(PLAYER, 'exp', exp_gained)
+            log.append(PLAYER, 'gold', gold_gained)
 
             if level_ups > 0:
-                combat_state['log'].append(f"⬆️ 等级提升！当前等级: {character.level}")
+                log.append(PLAYER, 'level_up', character.level)
 
             if loot_items:
-                items_str = ', '.join([ITEMS[item]['name'] for item in loot_items])
-                combat_state['log'].append(f"🎁 获得物品: {items_str}")
+                log.append(PLAYER, 'loot', detail=loot_items)
 
             # Check if final boss
             if enemy['id'] == 'demon_lord':
                 combat_state['game_complete'] = True
-                combat_state['log'].append("👑 恭喜！你击败了魔王，拯救了世界！")
+                log.append(PLAYER, 'game_complete')
 
         else:
             # Player died
-            combat_state['log'].append("💀 你被击败了...")
+            log = CombatManager._log(combat_state)
+            log.append(PLAYER, 'defeat')
 
             # Apply death penalty
             from .game_data import GAME_SETTINGS
@@ -425,26 +501,28 @@ class CombatManager:
             character.hp = int(character.max_hp * penalty['hp_restore_percent'])
 
             combat_state['gold_lost'] = gold_loss
-            combat_state['log'].append(f"💸 失去了 {gold_loss} 金币")
-            combat_state['log'].append(f"你在 {penalty['respawn_location']} 醒来")
+            log.append(PLAYER, 'gold_lost', gold_loss)
+            log.append(PLAYER, 'respawn', detail=penalty['respawn_location'])
 
         return combat_state
 
     @staticmethod
-    def _process_loot(loot_table: List[Dict]) -> List[str]:
+    def _process_loot(loot_table: List[Dict], rng: Optional[SeededRNG] = None) -> List[str]:
         """
         Process loot drops based on drop rates
 
         Args:
             loot_table: List of loot items with chances
+            rng: Random stream (a fresh one if not provided)
 
         Returns:
             List of item IDs that dropped
         """
         dropped_items = []
+        rng = rng or SeededRNG.create()
 
         for loot_entry in loot_table:
-            if random.random() < loot_entry['chance']:
+            if rng.random() < loot_entry['chance']:
                 dropped_items.append(loot_entry['item_id'])
 
         return dropped_items
@@ -478,7 +556,7 @@ class CombatManager:
 
         # Add flee option (not for bosses)
         enemy_data = ENEMIES.get(combat_state['enemy']['id'])
-        if enemy_data['level'] < 10:
+        if enemy_data['level'] < COMBAT_RULES['boss_level']:
             actions.append({
                 'id': 'flee',
                 'name': '逃跑',
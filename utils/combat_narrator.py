@@ -0,0 +1,139 @@
+"""
+Combat Narrator - Batched LLM narration of combat logs
+战斗叙述器 - 将战斗日志批量交给 LLM 叙述
+
+CombatManager appends one or more log events per turn. Instead of one Gemini
+call per turn, the narrator keeps a cursor into the encounter's log
+(combat_state['narrated_until'], a log sequence number) and sends all lines
+since the cursor as one prompt when the encounter ends, or every
+COMBAT_NARRATION_CADENCE turns. The model returns one segment per numbered
+line, mapped back to log sequence numbers.
+
+Narration is decorative: numbers always come from CombatManager, and a failed
+call leaves the lines pending for the next flush instead of failing the turn.
+"""
+
+import json
+import logging
+import threading
+from typing import Dict, List, Optional
+
+from config import Config
+from .combat_log import CombatLog
+from .game_data import ENEMIES, PERSONALITY_TEMPLATES, CHARACTER_CLASSES
+from .prompt_templates import COMBAT_NARRATION_SCHEMA, PROMPT_TEMPLATES
+
+logger = logging.getLogger(__name__)
+
+
+class CombatNarrator:
+    """Buffers combat log lines per encounter and narrates them in batches"""
+
+    def __init__(self, client, cadence: Optional[int] = None, max_lines: Optional[int] = None):
+        """
+        Args:
+            client: GeminiClient (anything with generate_text(prompt, response_schema))
+            cadence: Also narrate every N turns while combat is active (0 = only when it ends)
+            max_lines: Most log lines sent in one batch (older pending lines are skipped)
+        """
+        self.client = client
+        self.cadence = Config.COMBAT_NARRATION_CADENCE if cadence is None else cadence
+        self.max_lines = max_lines or Config.COMBAT_NARRATION_MAX_LINES
+
+        self._lock = threading.Lock()
+        self._batches = 0
+        self._lines = 0
+        self._failures = 0
+
+    def should_flush(self, combat_state: Dict) -> bool:
+        """Whether the pending log lines of this encounter are due for narration"""
+        if CombatLog(combat_state['log']).next_seq <= combat_state.get('narrated_until', 0):
+            return False
+        if not combat_state.get('active'):
+            return True
+        return self.cadence > 0 and combat_state['turn'] - combat_state.get('narrated_turn', 1) >= self.cadence
+
+    def narrate(self, combat_state: Dict, character) -> List[Dict]:
+        """
+        Narrate the pending log lines if a flush is due
+
+        Advances combat_state['narrated_until'] / ['narrated_turn'] on success.
+
+        Args:
+            combat_state: Combat state after the latest action
+            character: Character instance
+
+        Returns:
+            List of {'seq': int, 'text': str}, ordered by log sequence number (empty if nothing was narrated)
+        """
+        if not self.should_flush(combat_state):
+            return []
+
+        log = CombatLog(combat_state['log'])
+        end = log.next_seq
+        start = max(combat_state.get('narrated_until', 0), end - self.max_lines)
+
+        result = self.client.generate_text(self._build_prompt(combat_state, character, log, start),
+                                           COMBAT_NARRATION_SCHEMA)
+        if not result['success']:
+            # Keep the lines pending; the next flush (at the latest, combat end) retries them
+            logger.warning(f"Combat narration failed: {result['error']}")
+            with self._lock:
+                self._failures += 1
+            return []
+
+        segments = self._parse_segments(result['text'], start, end)
+        combat_state['narrated_until'] = end
+        combat_state['narrated_turn'] = combat_state['turn']
+
+        with self._lock:
+            self._batches += 1
+            self._lines += end - start
+        return segments
+
+    @staticmethod
+    def _build_prompt(combat_state: Dict, character, log: CombatLog, start: int) -> str:
+        enemy = combat_state['enemy']
+        personality = PERSONALITY_TEMPLATES.get(character.personality, {}).get('name', character.personality)
+        character_class = CHARACTER_CLASSES.get(character.character_class, {}).get('name', character.character_class)
+        return PROMPT_TEMPLATES['combat_narration'].render(
+            name=character.name,
+            personality=personality,
+            character_class=character_class,
+            enemy_name=enemy['name'],
+            enemy_level=enemy['level'],
+            enemy_description=ENEMIES.get(enemy['id'], {}).get('description', ''),
+            log_lines='\n'.join(f'[{seq}] {line}' for seq, line in log.numbered_lines(start))
+        )
+
+    @staticmethod
+    def _parse_segments(ai_text: str, start: int, end: int) -> List[Dict]:
+        """Map the model's segments back to log sequence numbers, dropping any outside the batch"""
+        first = ai_text.find('{')
+        last = ai_text.rfind('}')
+        try:
+            parsed = json.loads(ai_text[first:last + 1]) if first >= 0 else {}
+        except ValueError:
+            return []
+
+        segments = {}
+        for segment in parsed.get('segments', []) if isinstance(parsed, dict) else []:
+            if not isinstance(segment, dict):
+                continue
+            index, text = segment.get('index'), segment.get('text')
+            if isinstance(index, int) and start <= index < end and isinstance(text, str) and text:
+                segments.setdefault(index, text.strip())
+
+        return [{'seq': index, 'text': segments[index]} for index in sorted(segments)]
+
+    def stats(self) -> Dict:
+        """Batch and line counters (lines_per_batch is the calls saved versus one call per line)"""
+        with self._lock:
+            return {
+                'enabled': True,
+                'cadence': self.cadence,
+                'batches': self._batches,
+                'lines_narrated': self._lines,
+                'lines_per_batch': round(self._lines / self._batches, 2) if self._batches else 0.0,
+                'failures': self._failures
+            }
@@ -0,0 +1,144 @@
+"""
+Server-side combat sessions
+伺服器端戰鬥 Session
+
+The encounter's combat state lives on the server, keyed by character id, so the
+client sends only the action (and item) each turn and receives a delta: the new
+log lines and the enemy / character fields that changed. Request and response
+sizes no longer grow with the length of the fight, and the client can no
+longer edit HP or loot by posting a modified state.
+
+Storage reuses the SessionStore backends (memory by default, SQLite to survive
+restarts) under the 'combat' namespace with its own TTL, so abandoned fights
+expire on their own.
+"""
+
+import copy
+import threading
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+from config import Config
+from .combat_log import CombatLog
+from .session_store import SessionStore, create_session_store
+
+# Keys kept server-side only (narration cursor, random stream, replay record)
+_PRIVATE_KEYS = frozenset({'narrated_until', 'narrated_turn', 'rng', 'replay'})
+# Nested sections diffed field by field
+_SECTIONS = ('enemy', 'character')
+
+
+class CombatSessionStore:
+    """Active combat state per character, with one lock per character so turns apply in order"""
+
+    LOCK_STRIPES = 64
+
+    def __init__(self, store: Optional[SessionStore] = None):
+        """
+        Args:
+            store: Backing store (built from Config.COMBAT_SESSION_* if not provided)
+        """
+        self.store = store or create_session_store(
+            'combat',
+            backend=Config.COMBAT_SESSION_BACKEND,
+            ttl=Config.COMBAT_SESSION_TTL
+        )
+        self._locks = [threading.Lock() for _ in range(self.LOCK_STRIPES)]
+
+    @staticmethod
+    def _key(character_id) -> str:
+        return str(character_id)
+
+    @contextmanager
+    def lock(self, character_id):
+        """Serialize reads and writes of one character's combat (within this process)"""
+        with self._locks[hash(self._key(character_id)) % self.LOCK_STRIPES]:
+            yield
+
+    def get(self, character_id) -> Optional[Dict]:
+        """Active combat state of a character, or None"""
+        return self.store.get(self._key(character_id))
+
+    def save(self, character_id, combat_state: Dict):
+        """Store the state while combat is active; drop it once the encounter has ended"""
+        if combat_state.get('active'):
+            self.store.set(self._key(character_id), combat_state)
+        else:
+            self.store.delete(self._key(character_id))
+
+    def record_narration(self, character_id, combat_state: Dict):
+        """
+        Store the narration cursor of a state narrated outside the lock
+
+        Turns applied meanwhile are kept; only a cursor further ahead than the stored one is written.
+        """
+        with self.lock(character_id):
+            current = self.get(character_id)
+            if not current or current.get('narrated_until', 0) >= combat_state['narrated_until']:
+                return
+            current['narrated_until'] = combat_state['narrated_until']
+            current['narrated_turn'] = combat_state['narrated_turn']
+            self.store.set(self._key(character_id), current)
+
+    def end(self, character_id):
+        """Discard a character's combat"""
+        self.store.delete(self._key(character_id))
+
+    def stats(self) -> Dict:
+        return self.store.stats()
+
+
+def public_state(combat_state: Dict) -> Dict:
+    """
+    Combat state as sent to the client (when combat starts or is resumed)
+
+    The log is rendered to the lines still held, with 'log_start' (sequence
+    number of the first line) and 'log_capacity' (most lines worth keeping).
+    """
+    state = {key: value for key, value in combat_state.items() if key not in _PRIVATE_KEYS}
+    log = CombatLog(combat_state['log'])
+    state['log'] = log.lines()
+    state['log_start'] = log.first_seq
+    state['log_capacity'] = log.capacity
+    return state
+
+
+def snapshot(combat_state: Dict) -> Dict:
+    """Copy of the public fields (the log only as its sequence number), to diff against after an action"""
+    state = {key: value for key, value in combat_state.items() if key != 'log' and key not in _PRIVATE_KEYS}
+    state = copy.deepcopy(state)
+    state['log_seq'] = CombatLog(combat_state['log']).next_seq
+    return state
+
+
+def combat_delta(before: Dict, after: Dict) -> Dict:
+    """
+    Changes made by one action
+
+    Args:
+        before: snapshot() taken before the action
+        after: Combat state after the action
+
+    Returns:
+        Dict with 'turn', 'active', 'log_start' (sequence number of the first
+        new line) and the new 'log' lines, plus the changed fields of 'enemy' /
+        'character' and any changed top-level fields (victory, loot, ...)
+    """
+    log_start = before['log_seq']
+    delta = {
+        'turn': after['turn'],
+        'active': after['active'],
+        'log_start': log_start,
+        'log': CombatLog(after['log']).lines(log_start)
+    }
+    for section in _SECTIONS:
+        old = before.get(section, {})
+        changed = {key: value for key, value in after.get(section, {}).items() if old.get(key) != value}
+        if changed:
+            delta[section] = changed
+    for key, value in after.items():
+        if key in delta or key in _SECTIONS or key in _PRIVATE_KEYS:
+            continue
+        if before.get(key) != value:
+            delta[key] = value
+    return delta
@@ -0,0 +1,216 @@
+"""
+Upstream context caching for static prompt prefixes
+靜態 Prompt 前綴的上游 Context Cache
+
+Most of every Gemini request is the same instruction block (emoji list, scene
+rules, MCP rules). ``ContextCacheManager`` registers such a prefix once with
+the Gemini ``cachedContents`` API, extends its TTL shortly before it expires,
+and hands out the cache name so requests only send their variable tail.
+
+Whenever caching is unavailable (prefix below the model's minimum size, API
+error, unsupported endpoint) the prefix is remembered as unavailable for a
+while and callers fall back to inlining it.
+"""
+
+import hashlib
+import logging
+import threading
+import time
+from typing import Dict, Optional
+
+import requests
+
+from config import Config
+from .http_pool import create_pooled_session
+from .prompt_templates import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+# Status codes meaning a referenced cachedContent is gone or was rejected
+CONTEXT_CACHE_MISS_STATUSES = (400, 403, 404)
+
+
+class _CacheEntry:
+    """Registration state of one prefix"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.name = None
+        self.expires_at = 0.0
+        self.unavailable_until = 0.0
+
+
+class ContextCacheManager:
+    """Register static prompt prefixes as Gemini cached contents"""
+
+    def __init__(
+        self,
+        api_key: str,
+        api_base: str = None,
+        model: str = None,
+        ttl: int = None,
+        refresh_margin: int = None,
+        min_tokens: int = None,
+        retry_after: int = None,
+        session: Optional[requests.Session] = None
+    ):
+        """
+        Args:
+            api_key: Gemini API key
+            api_base: API base URL (defaults to Config.GEMINI_API_BASE)
+            model: Model the cache is created for (defaults to Config.GEMINI_MODEL)
+            ttl: Seconds each cached content lives
+            refresh_margin: Extend the TTL when fewer than this many seconds remain
+            min_tokens: Skip prefixes estimated below this size (the model's caching minimum)
+            retry_after: Seconds to inline a prefix after a failed registration
+            session: HTTP session for cache management calls
+        """
+        self.api_key = api_key
+        self.api_base = (api_base or Config.GEMINI_API_BASE).rstrip('/')
+        self.model = model or Config.GEMINI_MODEL
+        self.ttl = ttl or Config.GEMINI_CONTEXT_CACHE_TTL
+        self.refresh_margin = refresh_margin if refresh_margin is not None else Config.GEMINI_CONTEXT_CACHE_REFRESH_MARGIN
+        self.min_tokens = min_tokens if min_tokens is not None else Config.GEMINI_CONTEXT_CACHE_MIN_TOKENS
+        self.retry_after = retry_after if retry_after is not None else Config.GEMINI_CONTEXT_CACHE_RETRY_AFTER
+        self.timeout = Config.GEMINI_REQUEST_TIMEOUT
+        self.headers = {
+            'Content-Type': 'application/json',
+            'X-goog-api-key': self.api_key
+        }
+        self.session = session or create_pooled_session(pool_connections=1, pool_maxsize=2, headers=self.headers)
+
+        self._entries: Dict[str, _CacheEntry] = {}
+        self._lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._stats = {'created': 0, 'refreshed': 0, 'hits': 0, 'fallbacks': 0, 'failures': 0}
+
+    def get(self, prefix: str) -> Optional[str]:
+        """
+        Get the cachedContents name for a prefix, registering or refreshing it as needed
+
+        Args:
+            prefix: Static prompt prefix
+
+        Returns:
+            Cache name (e.g. "cachedContents/abc123"), or None to inline the prefix
+        """
+        entry = self._entry(prefix)
+        now = time.monotonic()
+
+        if now < entry.unavailable_until:
+            self._count('fallbacks')
+            return None
+
+        if entry.name and now < entry.expires_at - self.refresh_margin:
+            self._count('hits')
+            return entry.name
+
+        # Only one thread registers/refreshes a prefix; others inline meanwhile
+        if not entry.lock.acquire(blocking=False):
+            if entry.name and now < entry.expires_at:
+                self._count('hits')
+                return entry.name
+            self._count('fallbacks')
+            return None
+
+        try:
+            if entry.name and now < entry.expires_at and self._refresh(entry):
+                self._count('hits')
+                return entry.name
+            if self._create(entry, prefix):
+                self._count('hits')
+                return entry.name
+            self._count('fallbacks')
+            return None
+        finally:
+            entry.lock.release()
+
+    def invalidate(self, prefix: str):
+        """Forget a prefix's cache name after the API rejected it"""
+        entry = self._entry(prefix)
+        entry.name = None
+        entry.expires_at = 0.0
+
+    def stats(self) -> Dict:
+        with self._stats_lock:
+            stats = dict(self._stats)
+        with self._lock:
+            active = sum(1 for entry in self._entries.values() if entry.name)
+        return {'enabled': True, 'active_prefixes': active, **stats}
+
+    def _entry(self, prefix: str) -> _CacheEntry:
+        key = hashlib.sha256(prefix.encode('utf-8')).hexdigest()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = _CacheEntry()
+                self._entries[key] = entry
+            return entry
+
+    def _create(self, entry: _CacheEntry, prefix: str) -> bool:
+        """Register a prefix; marks it unavailable for retry_after seconds on failure"""
+        if estimate_tokens(prefix) < self.min_tokens:
+            entry.unavailable_until = float('inf')
+            return False
+
+        body = {
+            'model': f'models/{self.model}',
+            'systemInstruction': {'parts': [{'text': prefix}]},
+            'ttl': f'{self.ttl}s'
+        }
+        try:
+            response = self.session.post(
+                f'{self.api_base}/cachedContents',
+                headers=self.headers,
+                json=body,
+                timeout=self.timeout
+            )
+            response.raise_for_status()
+            name = response.json()['name']
+        except (requests.exceptions.RequestException, KeyError, ValueError) as e:
+            logger.warning(f"Context cache registration failed, inlining prefix: {e}")
+            entry.name = None
+            entry.unavailable_until = time.monotonic() + self.retry_after
+            self._count('failures')
+            return False
+
+        entry.name = name
+        entry.expires_at = time.monotonic() + self.ttl
+        self._count('created')
+        return True
+
+    def _refresh(self, entry: _CacheEntry) -> bool:
+        """Extend an existing cache's TTL"""
+        try:
+            response = self.session.patch(
+                f'{self.api_base}/{entry.name}',
+                params={'updateMask': 'ttl'},
+                headers=self.headers,
+                json={'ttl': f'{self.ttl}s'},
+                timeout=self.timeout
+            )
+            response.raise_for_status()
+        except requests.exceptions.RequestException as e:
+            logger.info(f"Context cache refresh failed, re-registering: {e}")
+            entry.name = None
+            return False
+
+        entry.expires_at = time.monotonic() + self.ttl
+        self._count('refreshed')
+        return True
+
+    def _count(self, name: str):
+        with self._stats_lock:
+            self._stats[name] += 1
+
+
+def create_context_cache(api_key: str) -> Optional[ContextCacheManager]:
+    """
+    Build the context cache manager from Config
+
+    Returns:
+        ContextCacheManager, or None when GEMINI_CONTEXT_CACHE_ENABLED is off
+    """
+    if not Config.GEMINI_CONTEXT_CACHE_ENABLED:
+        return None
+    return ContextCacheManager(api_key)
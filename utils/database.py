@@ -0,0 +1,215 @@
+"""
+Database engine profiles (RPG app)
+数据库引擎配置档（RPG 游戏）
+
+DB_PROFILE selects how the SQLAlchemy engine talks to SQLite:
+
+- development: SQLite defaults (rollback journal, synchronous=FULL); readers
+  wait while a write commits.
+- production: WAL journal (readers never block on the writer and the writer
+  never blocks on readers), synchronous=NORMAL (fsync at checkpoints instead of
+  every commit; a power loss can drop the last commits but never corrupts the
+  database), a larger page cache, memory-mapped reads, temp tables in memory,
+  and a busy timeout so writers queue for the lock instead of failing with
+  "database is locked".
+
+Pragmas are applied on every new pooled connection. DB_POOL_SIZE,
+DB_MAX_OVERFLOW, DB_POOL_TIMEOUT and DB_BUSY_TIMEOUT override the profile's
+values. Non-SQLite DATABASE_URLs get the pool settings only.
+
+tools/db_benchmark.py compares the profiles on the game's read/write mix.
+"""
+
+import copy
+import os
+from typing import Dict, List, Optional
+
+from sqlalchemy import create_engine, event, make_url, text
+
+from config import Config
+
+DB_PROFILES = {
+    'development': {
+        'pool_size': 5,
+        'max_overflow': 10,
+        'pool_timeout': 30,
+        'pragmas': {
+            'busy_timeout': 5000  # Milliseconds (the sqlite3 module's default)
+        }
+    },
+    'production': {
+        'pool_size': 10,
+        'max_overflow': 20,
+        'pool_timeout': 30,
+        'pragmas': {
+            'journal_mode': 'WAL',
+            'synchronous': 'NORMAL',
+            'busy_timeout': 5000,
+            'cache_size': -65536,  # Negative: KiB, i.e. 64 MiB of page cache per connection
+            'mmap_size': 268435456,  # 256 MiB memory-mapped I/O
+            'temp_store': 'MEMORY'
+        }
+    }
+}
+
+
+def get_profile(name: Optional[str] = None) -> Dict:
+    """
+    Engine settings of a profile, with the DB_* overrides from Config applied
+
+    Args:
+        name: Profile name (Config.DB_PROFILE if not provided)
+
+    Returns:
+        Dict with name, pool_size, max_overflow, pool_timeout and pragmas
+    """
+    name = name or Config.DB_PROFILE
+    if name not in DB_PROFILES:
+        raise ValueError(f"Unknown DB_PROFILE: {name} (choose from {', '.join(DB_PROFILES)})")
+
+    profile = copy.deepcopy(DB_PROFILES[name])
+    profile['name'] = name
+    for key, override in (('pool_size', Config.DB_POOL_SIZE),
+                          ('max_overflow', Config.DB_MAX_OVERFLOW),
+                          ('pool_timeout', Config.DB_POOL_TIMEOUT)):
+        if override is not None:
+            profile[key] = override
+    if Config.DB_BUSY_TIMEOUT is not None:
+        profile['pragmas']['busy_timeout'] = Config.DB_BUSY_TIMEOUT
+    return profile
+
+
+def _is_sqlite(url: str) -> bool:
+    return url.startswith('sqlite')
+
+
+def _is_memory(url: str) -> bool:
+    return url in ('sqlite://', 'sqlite:///:memory:') or 'mode=memory' in url
+
+
+def engine_options(url: str, profile: Dict) -> Dict:
+    """
+    create_engine() keyword arguments for a profile
+
+    In-memory SQLite keeps SQLAlchemy's single-connection pool.
+    """
+    if _is_sqlite(url) and _is_memory(url):
+        return {}
+
+    options = {
+        'pool_size': profile['pool_size'],
+        'max_overflow': profile['max_overflow'],
+        'pool_timeout': profile['pool_timeout']
+    }
+    if _is_sqlite(url):
+        options['connect_args'] = {
+            'timeout': profile['pragmas'].get('busy_timeout', 5000) / 1000,
+            # Pooled connections move between request threads
+            'check_same_thread': False
+        }
+    return options
+
+
+def apply_pragmas(engine, pragmas: Dict):
+    """Run the profile's PRAGMA statements on every new connection of a SQLite engine"""
+    if not _is_sqlite(str(engine.url)) or not pragmas:
+        return
+
+    @event.listens_for(engine, 'connect')
+    def _set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for key, value in pragmas.items():
+                cursor.execute(f'PRAGMA {key}={value}')
+        finally:
+            cursor.close()
+
+
+def init_app_database(app, db, profile_name: Optional[str] = None) -> Dict:
+    """
+    Configure and initialize Flask-SQLAlchemy for the selected profile
+
+    Replaces a plain db.init_app(app).
+
+    Args:
+        app: Flask app
+        db: Flask-SQLAlchemy extension
+        profile_name: Profile (Config.DB_PROFILE if not provided)
+
+    Returns:
+        The profile in use
+    """
+    profile = get_profile(profile_name)
+    url = Config.DATABASE_URL
+    app.config['SQLALCHEMY_DATABASE_URI'] = url
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(url, profile)
+    db.init_app(app)
+
+    # Engines are created by init_app but not connected yet
+    with app.app_context():
+        apply_pragmas(db.engine, profile['pragmas'])
+    app.extensions['db_profile'] = profile
+    return profile
+
+
+def create_database_engine(url: Optional[str] = None, profile_name: Optional[str] = None,
+                           instance_path: Optional[str] = None):
+    """
+    Engine for the app's database outside Flask (CLI tools)
+
+    Relative SQLite paths resolve against the instance folder, as Flask-SQLAlchemy does.
+
+    Args:
+        url: Database URL (Config.DATABASE_URL if not provided)
+        profile_name: Profile (Config.DB_PROFILE if not provided)
+        instance_path: Instance folder (<repo>/instance if not provided)
+
+    Returns:
+        SQLAlchemy engine with the profile's pool settings and pragmas
+    """
+    url = make_url(url or Config.DATABASE_URL)
+    if _is_sqlite(url.drivername) and url.database and url.database != ':memory:' \
+            and not url.database.startswith('file:') and not os.path.isabs(url.database):
+        instance_path = instance_path or os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                                      'instance')
+        os.makedirs(instance_path, exist_ok=True)
+        url = url.set(database=os.path.join(instance_path, url.database))
+
+    profile = get_profile(profile_name)
+    url_string = url.render_as_string(hide_password=False)
+    engine = create_engine(url_string, **engine_options(url_string, profile))
+    apply_pragmas(engine, profile['pragmas'])
+    return engine
+
+
+def explain_query_plan(engine, statement) -> List[str]:
+    """
+    SQLite's EXPLAIN QUERY PLAN for a SQLAlchemy statement
+
+    Returns:
+        Plan steps, e.g. 'SEARCH inventory_items USING INDEX ix_... (character_id=? AND item_id=?)'
+    """
+    sql = str(statement.compile(dialect=engine.dialect, compile_kwargs={'literal_binds': True}))
+    with engine.connect() as connection:
+        return [row[-1] for row in connection.exec_driver_sql(f'EXPLAIN QUERY PLAN {sql}')]
+
+
+def unindexed_steps(plan: List[str]) -> List[str]:
+    """Plan steps an index should have avoided: whole-table SCANs and temporary sorts"""
+    return [
+        step for step in plan
+        if (step.startswith('SCAN') and 'INDEX' not in step) or step.startswith('USE TEMP B-TREE')
+    ]
+
+
+def database_stats(app, db) -> Dict:
+    """Profile, effective pragmas and pool status (for health checks)"""
+    profile = app.extensions.get('db_profile', {})
+    stats = {'profile': profile.get('name'), 'pool': db.engine.pool.status()}
+    if _is_sqlite(str(db.engine.url)):
+        with db.engine.connect() as connection:
+            stats['pragmas'] = {
+                key: connection.execute(text(f'PRAGMA {key}')).scalar()
+                for key in profile.get('pragmas', {})
+            }
+    return stats
@@ -0,0 +1,131 @@
+"""
+Expected-value tables for the game economy
+遊戲經濟期望值表
+
+Derives, from ENEMIES, LOCATIONS and ITEMS alone, what one victory over each
+enemy and one exploration of each location yields on average: experience,
+gold, loot drops and loot value (item shop price), each with its variance.
+No database access and no simulation; the tables are computed once per
+process and served from memory.
+
+Per-enemy figures are per victory (the fight's outcome depends on the player;
+see tools/combat_simulator.py for win rates). Per-location figures are per
+exploration, treating every encounter as won: an encounter happens with the
+location's encounter_rate and picks one of its enemies uniformly, as
+GameManager.check_random_encounter does.
+"""
+
+from functools import lru_cache
+from typing import Dict, Iterable, Optional, Tuple
+
+from .game_data import ENEMIES, ITEMS, LOCATIONS
+
+_STATS = ('exp', 'gold', 'loot_value')
+
+
+def _moments(mean: float, variance: float) -> Dict:
+    return {'mean': round(mean, 4), 'variance': round(variance, 4)}
+
+
+def _mixture(components: Iterable[Tuple[float, float, float]]) -> Tuple[float, float]:
+    """
+    Mean and variance of a mixture
+
+    Args:
+        components: (weight, mean, variance) per outcome; weights sum to 1
+
+    Returns:
+        Tuple of (mean, variance)
+    """
+    components = list(components)
+    mean = sum(weight * m for weight, m, _ in components)
+    second_moment = sum(weight * (v + m * m) for weight, m, v in components)
+    return mean, max(0.0, second_moment - mean * mean)
+
+
+def enemy_economy(enemy_id: str) -> Dict:
+    """
+    Expected rewards of one victory over an enemy
+
+    Experience and gold are fixed; each loot entry drops independently with its chance.
+
+    Returns:
+        Dict with exp, gold, loot_value ({'mean', 'variance'}) and per-item loot
+        ({'expected' drops, 'variance', 'expected_value'})
+    """
+    enemy = ENEMIES[enemy_id]
+    loot = {}
+    value_mean = value_variance = 0.0
+    for entry in enemy.get('loot', []):
+        chance = entry['chance']
+        price = ITEMS.get(entry['item_id'], {}).get('price', 0)
+        item = loot.setdefault(entry['item_id'], {'expected': 0.0, 'variance': 0.0, 'expected_value': 0.0})
+        item['expected'] += chance
+        item['variance'] += chance * (1 - chance)
+        item['expected_value'] += chance * price
+        value_mean += chance * price
+        value_variance += chance * (1 - chance) * price * price
+
+    return {
+        'level': enemy['level'],
+        'exp': _moments(enemy['experience'], 0.0),
+        'gold': _moments(enemy['gold'], 0.0),
+        'loot_value': _moments(value_mean, value_variance),
+        'loot': {item_id: {key: round(value, 4) for key, value in item.items()} for item_id, item in loot.items()}
+    }
+
+
+def location_economy(location_id: str, enemies: Optional[Dict] = None) -> Dict:
+    """
+    Expected rewards of one exploration of a location (every encounter won)
+
+    Args:
+        location_id: Location ID from LOCATIONS
+        enemies: Precomputed enemy_economy() results by enemy ID (computed if not provided)
+
+    Returns:
+        Dict with encounter_rate, per-enemy encounter probabilities, exp, gold and
+        loot_value ({'mean', 'variance'} per exploration) and expected drops per item
+    """
+    location = LOCATIONS[location_id]
+    rate = location['encounter_rate']
+    encounters = location['encounters']
+    enemies = enemies or {}
+    per_enemy = {enemy_id: enemies.get(enemy_id) or enemy_economy(enemy_id) for enemy_id in set(encounters)}
+
+    # Outcomes of one exploration: no encounter, or one entry of the encounter list
+    weight = rate / len(encounters) if encounters else 0.0
+    table = {
+        'encounter_rate': rate,
+        'encounters': {},
+        'loot': {}
+    }
+    for enemy_id in encounters:
+        table['encounters'][enemy_id] = round(table['encounters'].get(enemy_id, 0.0) + weight, 4)
+        for item_id, item in per_enemy[enemy_id]['loot'].items():
+            drops = table['loot'].setdefault(item_id, {'expected': 0.0, 'expected_value': 0.0})
+            drops['expected'] = round(drops['expected'] + weight * item['expected'], 4)
+            drops['expected_value'] = round(drops['expected_value'] + weight * item['expected_value'], 4)
+
+    for stat in _STATS:
+        components = [(1 - rate if encounters else 1.0, 0.0, 0.0)] + [
+            (weight, per_enemy[enemy_id][stat]['mean'], per_enemy[enemy_id][stat]['variance'])
+            for enemy_id in encounters
+        ]
+        table[stat] = _moments(*_mixture(components))
+    return table
+
+
+@lru_cache(maxsize=1)
+def get_economy_tables() -> Dict:
+    """
+    Per-enemy and per-location tables (computed on first call, then served from memory)
+
+    Returns:
+        Dict with 'enemies' and 'locations', keyed by ID
+    """
+    enemies = {enemy_id: enemy_economy(enemy_id) for enemy_id in ENEMIES}
+    return {
+        'enemies': enemies,
+        'locations': {location_id: location_economy(location_id, enemies) for location_id in LOCATIONS}
+    }
@@ -51,7 +51,9 @@ CHARACTER_CLASSES = {
             'max_mp': 30,
             'attack': 15,
             'defense': 8
-        }
+        },
+        # Stat increases per level up
+        'growth': {'max_hp': 15, 'max_mp': 3, 'attack': 3, 'defense': 2}
     },
     'mage': {
         'id': 'mage',
@@ -65,7 +67,8 @@ CHARACTER_CLASSES = {
             'max_mp': 100,
             'attack': 12,
             'defense': 4
-        }
+        },
+        'growth': {'max_hp': 8, 'max_mp': 10, 'attack': 2, 'defense': 1}
     },
     'ranger': {
         'id': 'ranger',
@@ -79,11 +82,27 @@ CHARACTER_CLASSES = {
             'max_mp': 50,
             'attack': 13,
             'defense': 6
-        }
+        },
+        'growth': {'max_hp': 12, 'max_mp': 5, 'attack': 2, 'defense': 2}
     }
 }
 
 
+# ============================================================================
+# COMBAT RULES - 战斗规则（CombatManager 与平衡模拟器共用）
+# ============================================================================
+
+COMBAT_RULES = {
+    'damage_variance': (0.9, 1.1),   # Damage roll range (multiplier)
+    'crit_chance': 0.15,
+    'crit_multiplier': 1.5,
+    'defend_multiplier': 0.5,        # Incoming damage while defending
+    'boss_level': 10,                # Enemies at this level cannot be fled from and use special abilities
+    'special_ability_chance': 0.3,   # Per ready ability, per enemy turn
+    'flee_chance': 0.5
+}
+
+
 # ============================================================================
 # ITEMS - 物品定义（后端控制所有数值）
 # ============================================================================
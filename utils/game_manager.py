@@ -3,22 +3,34 @@ Game Manager - Handles overall game logic and state
 游戏管理器 - 处理整体游戏逻辑和状态
 """
 
-import random
+import functools
 from typing import Dict, List, Optional, Tuple
 from .game_data import LOCATIONS, QUESTS, ITEMS, ENEMIES
 from .combat_manager import CombatManager
+from .rng import SeededRNG
+
+
+def _transactional(func):
+    """Run a helper in a unit of work: the caller's if one is open, otherwise its own single commit"""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        from models import unit_of_work
+        with unit_of_work():
+            return func(*args, **kwargs)
+    return wrapper
 
 
 class GameManager:
     """Manages game state and progression"""
 
     @staticmethod
-    def check_random_encounter(location_id: str) -> Optional[str]:
+    def check_random_encounter(location_id: str, rng: Optional[SeededRNG] = None) -> Optional[str]:
         """
         Check if random encounter occurs
 
         Args:
             location_id: Current location ID
+            rng: Random stream (a fresh one if not provided)
 
         Returns:
             Enemy ID if encounter occurs, None otherwise
@@ -28,10 +40,11 @@ class GameManager:
             return None
 
         # Check encounter rate
-        if random.random() < location['encounter_rate']:
+        rng = rng or SeededRNG.create()
+        if rng.random() < location['encounter_rate']:
             # Select random enemy from location
             enemies = location['encounters']
-            return random.choice(enemies)
+            return rng.choice(enemies)
 
         return None
 
@@ -98,12 +111,13 @@ class GameManager:
         }
 
     @staticmethod
-    def explore_location(character) -> Dict:
+    def explore_location(character, rng: Optional[SeededRNG] = None) -> Dict:
         """
         Explore current location (chance of encounter)
 
         Args:
             character: Character instance
+            rng: Random stream for the encounter roll; the fight gets a child stream seeded from it
 
         Returns:
             Exploration result
@@ -112,11 +126,12 @@ class GameManager:
         location = LOCATIONS[location_id]
 
         # Check for random encounter
-        enemy_id = GameManager.check_random_encounter(location_id)
+        rng = rng or SeededRNG.create()
+        enemy_id = GameManager.check_random_encounter(location_id, rng)
 
         if enemy_id:
             # Start combat
-            combat_state = CombatManager.start_combat(character, enemy_id)
+            combat_state = CombatManager.start_combat(character, enemy_id, seed=rng.next_seed())
             return {
                 'type': 'combat',
                 'combat_state': combat_state,
@@ -130,6 +145,7 @@ class GameManager:
             }
 
     @staticmethod
+    @_transactional
     def add_item_to_inventory(character, item_id: str, quantity: int = 1) -> Dict:
         """
         Add item to character inventory
@@ -142,7 +158,7 @@ class GameManager:
         Returns:
             Result dictionary
         """
-        from models import InventoryItem, db
+        from models import InventoryItem
         from .game_data import GAME_SETTINGS
 
         # Check inventory size
@@ -169,20 +185,17 @@ class GameManager:
 
             if existing_item:
                 existing_item.quantity += quantity
-                db.session.commit()
                 return {
                     'success': True,
                     'message': f"获得 {item_data['name']} x{quantity}"
                 }
 
-        # Add new item
+        # Add new item (through the collection, so len(character.inventory) stays current within the unit)
         new_item = InventoryItem(
-            character_id=character.id,
             item_id=item_id,
             quantity=quantity
         )
-        db.session.add(new_item)
-        db.session.commit()
+        character.inventory.append(new_item)
 
         return {
             'success': True,
@@ -190,6 +203,7 @@ class GameManager:
         }
 
     @staticmethod
+    @_transactional
     def remove_item_from_inventory(character, item_id: str, quantity: int = 1) -> bool:
         """
         Remove item from inventory
@@ -202,7 +216,7 @@ class GameManager:
         Returns:
             True if successful, False otherwise
         """
-        from models import InventoryItem, db
+        from models import InventoryItem
 
         item = InventoryItem.query.filter_by(
             character_id=character.id,
@@ -215,12 +229,13 @@ class GameManager:
         item.quantity -= quantity
 
         if item.quantity <= 0:
-            db.session.delete(item)
+            # Deleted as an orphan on flush
+            character.inventory.remove(item)
 
-        db.session.commit()
         return True
 
     @staticmethod
+    @_transactional
     def equip_item(character, inventory_item_id: int) -> Dict:
         """
         Equip item from inventory
@@ -232,7 +247,7 @@ class GameManager:
         Returns:
             Result dictionary
         """
-        from models import InventoryItem, db
+        from models import InventoryItem
 
         item = InventoryItem.query.get(inventory_item_id)
         if not item or item.character_id != character.id:
@@ -246,13 +261,11 @@ class GameManager:
 
         if item_type == 'weapon':
             # Unequip old weapon
-            if character.equipped_weapon_id:
-                old_weapon = InventoryItem.query.get(character.equipped_weapon_id)
-                if old_weapon:
-                    old_weapon.is_equipped = False
+            if character.equipped_weapon:
+                character.equipped_weapon.is_equipped = False
 
             # Equip new weapon
-            character.equipped_weapon_id = item.id
+            character.equipped_weapon = item
             item.is_equipped = True
 
             # Apply stat changes
@@ -260,7 +273,6 @@ class GameManager:
             if 'mp_bonus' in item_data:
                 character.max_mp += item_data['mp_bonus']
 
-            db.session.commit()
             return {
                 'success': True,
                 'message': f"装备了 {item_data['icon']} {item_data['name']}"
@@ -268,13 +280,11 @@ class GameManager:
 
         elif item_type == 'armor':
             # Unequip old armor
-            if character.equipped_armor_id:
-                old_armor = InventoryItem.query.get(character.equipped_armor_id)
-                if old_armor:
-                    old_armor.is_equipped = False
+            if character.equipped_armor:
+                character.equipped_armor.is_equipped = False
 
             # Equip new armor
-            character.equipped_armor_id = item.id
+            character.equipped_armor = item
             item.is_equipped = True
 
             # Apply stat changes
@@ -282,7 +292,6 @@ class GameManager:
             if 'mp_bonus' in item_data:
                 character.max_mp += item_data['mp_bonus']
 
-            db.session.commit()
             return {
                 'success': True,
                 'message': f"装备了 {item_data['icon']} {item_data['name']}"
@@ -294,6 +303,7 @@ class GameManager:
         }
 
     @staticmethod
+    @_transactional
     def buy_item(character, item_id: str, quantity: int = 1) -> Dict:
         """
         Buy item from shop
@@ -306,7 +316,6 @@ class GameManager:
         Returns:
             Result dictionary
         """
-        from models import db
         from .game_data import GAME_SETTINGS
 
         # Check if item is available in shop
@@ -331,19 +340,17 @@ class GameManager:
                 'message': f'金币不足！需要 {total_cost} 金币'
             }
 
-        # Deduct gold
-        character.gold -= total_cost
-        db.session.commit()
-
-        # Add item to inventory
+        # Add item to inventory, then deduct gold (nothing is charged if the inventory is full)
         result = GameManager.add_item_to_inventory(character, item_id, quantity)
 
         if result['success']:
+            character.gold -= total_cost
             result['message'] = f"花费 {total_cost} 金币，购买了 {item_data['name']} x{quantity}"
 
         return result
 
     @staticmethod
+    @_transactional
     def start_quest(character, quest_id: str) -> Dict:
         """
         Start a new quest
@@ -383,7 +390,6 @@ class GameManager:
             status='active'
         )
         db.session.add(quest_progress)
-        db.session.commit()
 
         return {
             'success': True,
@@ -392,6 +398,7 @@ class GameManager:
         }
 
     @staticmethod
+    @_transactional
     def complete_quest(character, quest_id: str) -> Dict:
         """
         Complete a quest and give rewards
@@ -403,7 +410,7 @@ class GameManager:
         Returns:
             Result dictionary
         """
-        from models import QuestProgress, db
+        from models import QuestProgress
 
         quest_progress = QuestProgress.query.filter_by(
             character_id=character.id,
@@ -437,7 +444,6 @@ class GameManager:
 
         # Mark quest as completed
         quest_progress.complete()
-        db.session.commit()
 
         # Start next quest if available
         if 'next_quest' in quest_data:
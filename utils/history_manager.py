@@ -0,0 +1,269 @@
+"""
+Token-budgeted conversation history
+依 Token 預算壓縮的對話歷史
+
+Each conversation keeps its most recent turns verbatim plus a rolling summary
+of everything older. Recording a turn evicts the oldest turns once there are
+more than ``keep_turns`` or the rendered history exceeds ``token_budget``;
+evicted turns are folded into the existing summary instead of re-summarizing
+the whole conversation.
+
+The summarizer is pluggable: any callable ``(summary, evicted_turns) -> str``.
+The default ``ExtractiveSummarizer`` keeps each evicted turn's most salient
+sentences (named things, numbers) and needs no extra LLM call. Histories are
+persisted in a SessionStore, so they can outlive the process.
+"""
+
+import re
+import threading
+from functools import lru_cache
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from config import Config
+from .prompt_templates import estimate_tokens
+from .session_store import SessionStore, create_session_store
+
+Summarizer = Callable[[str, List[Dict]], str]
+
+
+def _role_label(role: str) -> str:
+    return "用戶" if role == 'user' else "AI"
+
+
+_SENTENCE_END = re.compile(r'(?<=[。！？!?；;])|(?<=[.])\s+|\n+')
+_NUMBER = re.compile(r'\d+')
+_QUOTED = re.compile(r'[「『“"][^」』”"]+[」』”"]')
+_PROPER_NOUN = re.compile(r'(?<=\s)[A-Z][\w-]+')
+
+
+@lru_cache(maxsize=1)
+def _known_entities() -> Tuple[str, ...]:
+    """Names of game items, enemies, locations, quests and chat scenes (longest first)"""
+    from .game_data import ENEMIES, ITEMS, LOCATIONS, QUESTS
+    from .scene_manager import SceneManager
+
+    names = {
+        entry['name']
+        for table in (ITEMS, ENEMIES, LOCATIONS, QUESTS, SceneManager.SCENES)
+        for entry in table.values() if entry.get('name')
+    }
+    return tuple(sorted(names, key=len, reverse=True))
+
+
+def _sentences(text: str) -> List[str]:
+    return [sentence.strip() for sentence in _SENTENCE_END.split(text) if sentence and sentence.strip()]
+
+
+class ExtractiveSummarizer:
+    """
+    Fold evicted turns into the summary as their most salient sentences
+
+    Salient sentences name something (a known item, enemy, location, quest or
+    scene, a quoted or capitalized name) or carry numbers (gold, HP, amounts).
+    Each user turn keeps its first sentence (what the player did or asked);
+    each AI turn keeps its top-scoring sentences. Past the token cap, the
+    oldest lines without any such fact are dropped first.
+    """
+
+    def __init__(self, max_tokens: int = 200, max_sentences: int = 2, sentence_chars: int = 80,
+                 entities: Optional[Iterable[str]] = None):
+        """
+        Args:
+            max_tokens: Estimated token cap for the summary
+            max_sentences: Sentences kept per folded message
+            sentence_chars: Longest sentence kept (longer ones are clipped)
+            entities: Names that mark a sentence as salient (game and scene names if not provided)
+        """
+        self.max_tokens = max_tokens
+        self.max_sentences = max_sentences
+        self.sentence_chars = sentence_chars
+        self._entities = tuple(entities) if entities is not None else None
+
+    @property
+    def entities(self) -> Tuple[str, ...]:
+        if self._entities is None:
+            self._entities = _known_entities()
+        return self._entities
+
+    def salience(self, text: str) -> int:
+        """Number of facts in a text: known names, numbers, quoted and capitalized names"""
+        return (sum(name in text for name in self.entities) * 2
+                + len(_NUMBER.findall(text)) + len(_QUOTED.findall(text)) + len(_PROPER_NOUN.findall(text)))
+
+    def _clip(self, sentence: str) -> str:
+        sentence = ' '.join(sentence.split())
+        return sentence if len(sentence) <= self.sentence_chars else sentence[:self.sentence_chars] + '…'
+
+    def extract(self, role: str, message: str) -> str:
+        """Salient sentences of one message, in their original order"""
+        sentences = _sentences(message)
+        if not sentences:
+            return ''
+        scores = [self.salience(sentence) for sentence in sentences]
+
+        # The player's first sentence states the action; after that, and for the AI, facts win
+        keep = {0} if role == 'user' else set()
+        ranked = sorted(range(len(sentences)), key=lambda index: (-scores[index], index))
+        for index in ranked:
+            if len(keep) >= self.max_sentences:
+                break
+            if scores[index] > 0:
+                keep.add(index)
+        if not keep:
+            keep = {0}
+        return ' '.join(self._clip(sentences[index]) for index in sorted(keep))
+
+    def __call__(self, summary: str, turns: List[Dict]) -> str:
+        lines = summary.splitlines() if summary else []
+        for turn in turns:
+            text = self.extract(turn['role'], turn['message'])
+            if text:
+                lines.append(f"{_role_label(turn['role'])}: {text}")
+
+        while len(lines) > 1 and estimate_tokens('\n'.join(lines)) > self.max_tokens:
+            plain = [index for index, line in enumerate(lines) if not self.salience(line.split(': ', 1)[-1])]
+            lines.pop(plain[0] if plain else 0)
+        return '\n'.join(lines)
+
+
+class ConversationHistory:
+    """Rolling summary plus recent turns of one conversation"""
+
+    def __init__(self, summary: str = '', turns: Optional[List[Dict]] = None, summarized_turns: int = 0):
+        """
+        Args:
+            summary: Summary of turns no longer kept verbatim
+            turns: Recent turns, oldest first ({'role', 'message', 'tokens'})
+            summarized_turns: How many turns have been folded into the summary
+        """
+        self.summary = summary
+        self.turns = turns or []
+        self.summarized_turns = summarized_turns
+
+    def render(self) -> str:
+        """Prompt block for this history ('' when empty)"""
+        if not self.summary and not self.turns:
+            return ''
+
+        lines = []
+        if self.summary:
+            lines.append("較早對話摘要:")
+            lines.append(self.summary)
+        if self.turns:
+            lines.append(f"對話歷史（最近{len(self.turns)}則）:")
+            for turn in self.turns:
+                lines.append(f"{_role_label(turn['role'])}: {turn['message']}")
+        return "\n\n" + "\n".join(lines) + "\n"
+
+    def estimated_tokens(self) -> int:
+        """Estimated token size of the rendered history"""
+        return estimate_tokens(self.summary) + sum(turn['tokens'] for turn in self.turns)
+
+    def to_dict(self) -> Dict:
+        return {
+            'summary': self.summary,
+            'turns': self.turns,
+            'summarized_turns': self.summarized_turns
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'ConversationHistory':
+        return cls(
+            summary=data.get('summary', ''),
+            turns=list(data.get('turns', [])),
+            summarized_turns=data.get('summarized_turns', 0)
+        )
+
+
+class HistoryManager:
+    """Server-side conversation histories keyed by session id"""
+
+    def __init__(
+        self,
+        token_budget: int = None,
+        keep_turns: int = None,
+        summarizer: Optional[Summarizer] = None,
+        store: Optional[SessionStore] = None
+    ):
+        """
+        Args:
+            token_budget: Estimated token cap for summary plus recent turns
+            keep_turns: Maximum number of turns kept verbatim
+            summarizer: Callable folding evicted turns into the summary
+            store: Where histories are kept (built from Config.SESSION_STORE_* if not provided)
+        """
+        self.token_budget = token_budget or Config.HISTORY_TOKEN_BUDGET
+        self.keep_turns = keep_turns or Config.HISTORY_KEEP_TURNS
+        self.summarizer = summarizer or ExtractiveSummarizer(Config.HISTORY_SUMMARY_MAX_TOKENS)
+        self.store = store or create_session_store('history')
+        self._lock = threading.Lock()
+        self.compactions = 0
+
+    def get(self, session_id: str) -> ConversationHistory:
+        """
+        Get a snapshot of a conversation's history
+
+        Args:
+            session_id: Conversation key
+
+        Returns:
+            The stored history (empty for unknown sessions)
+        """
+        data = self.store.get(str(session_id))
+        return ConversationHistory.from_dict(data) if data else ConversationHistory()
+
+    def record(self, session_id: str, role: str, message: str):
+        """
+        Append a turn and compact the history back under budget
+
+        Args:
+            session_id: Conversation key
+            role: 'user' or 'ai'
+            message: Turn text
+        """
+        self._append(session_id, [(role, message)])
+
+    def record_exchange(self, session_id: str, user_message: str, ai_message: str):
+        """Append a user turn and the AI reply with a single store write"""
+        self._append(session_id, [('user', user_message), ('ai', ai_message)])
+
+    def clear(self, session_id: str):
+        """Forget a conversation"""
+        self.store.delete(str(session_id))
+
+    def stats(self) -> Dict:
+        return {
+            'token_budget': self.token_budget,
+            'keep_turns': self.keep_turns,
+            'compactions': self.compactions,
+            'store': self.store.stats()
+        }
+
+    def _append(self, session_id: str, turns: List[Tuple[str, str]]):
+        turns = [
+            {'role': role, 'message': message, 'tokens': estimate_tokens(message) + 2}
+            for role, message in turns if message
+        ]
+        if not turns:
+            return
+
+        # Read-modify-write; the lock covers this process only (last writer wins across processes)
+        with self._lock:
+            history = self.get(session_id)
+            history.turns.extend(turns)
+            self._compact(history)
+            self.store.set(str(session_id), history.to_dict())
+
+    def _compact(self, history: ConversationHistory):
+        """Fold the oldest turns into the summary until within keep_turns and token_budget"""
+        evicted = []
+        while len(history.turns) > 1 and (
+            len(history.turns) > self.keep_turns
+            or estimate_tokens(history.summary) + sum(t['tokens'] for t in history.turns) > self.token_budget
+        ):
+            evicted.append(history.turns.pop(0))
+
+        if evicted:
+            history.summary = self.summarizer(history.summary, evicted)
+            history.summarized_turns += len(evicted)
+            self.compactions += 1
@@ -0,0 +1,156 @@
+"""
+HTTP connection pooling for upstream LLM APIs
+上游 LLM API 的 HTTP 連線池
+
+Every chat turn used to call a bare ``requests.post``, paying a new TCP + TLS
+handshake each time. ``create_pooled_session`` returns a ``requests.Session``
+whose adapter keeps connections alive, caps connections per host, and counts
+how often a request reused an open connection versus opening a new one.
+
+By default a busy host gets extra short-lived connections beyond
+``pool_maxsize`` (kept connections stay capped). With ``pool_block`` the cap
+is hard and a request waits at most ``pool_timeout`` seconds for a free
+connection before failing with a ConnectionError.
+"""
+
+import socket
+import threading
+from typing import Dict, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.exceptions import EmptyPoolError
+
+
+class ConnectionStats:
+    """Thread-safe counters for pooled connection usage"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.new_connections = 0
+
+    def record_request(self):
+        with self._lock:
+            self.requests += 1
+
+    def record_connect(self):
+        with self._lock:
+            self.new_connections += 1
+
+    def to_dict(self) -> Dict:
+        with self._lock:
+            requests_sent = self.requests
+            new_connections = self.new_connections
+
+        reused = max(0, requests_sent - new_connections)
+        return {
+            'requests': requests_sent,
+            'new_connections': new_connections,
+            'reused_connections': reused,
+            'reuse_ratio': round(reused / requests_sent, 4) if requests_sent else 0.0
+        }
+
+
+def _counting_pool_classes(stats: ConnectionStats, pool_timeout: Optional[float] = None) -> Dict[str, type]:
+    """
+    Build pool classes whose connections report every real connect()
+
+    Args:
+        stats: Counters to report to
+        pool_timeout: Seconds a blocking pool waits for a free connection (requests never passes one)
+    """
+
+    class CountingHTTPConnection(HTTPConnection):
+        def connect(self):
+            stats.record_connect()
+            return super().connect()
+
+    class CountingHTTPSConnection(HTTPSConnection):
+        def connect(self):
+            stats.record_connect()
+            return super().connect()
+
+    class CountingHTTPConnectionPool(HTTPConnectionPool):
+        ConnectionCls = CountingHTTPConnection
+
+        def _get_conn(self, timeout=None):
+            return super()._get_conn(pool_timeout if timeout is None else timeout)
+
+    class CountingHTTPSConnectionPool(HTTPSConnectionPool):
+        ConnectionCls = CountingHTTPSConnection
+
+        def _get_conn(self, timeout=None):
+            return super()._get_conn(pool_timeout if timeout is None else timeout)
+
+    return {
+        'http': CountingHTTPConnectionPool,
+        'https': CountingHTTPSConnectionPool
+    }
+
+
+class PooledHTTPAdapter(HTTPAdapter):
+    """HTTPAdapter with TCP keep-alive and connection reuse accounting"""
+
+    def __init__(self, stats: Optional[ConnectionStats] = None, pool_timeout: Optional[float] = None, **kwargs):
+        # Must be set before HTTPAdapter.__init__ calls init_poolmanager()
+        self.stats = stats or ConnectionStats()
+        self.pool_timeout = pool_timeout
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, connections, maxsize, block=False, **pool_kwargs):
+        pool_kwargs.setdefault(
+            'socket_options',
+            HTTPConnection.default_socket_options + [(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)]
+        )
+        super().init_poolmanager(connections, maxsize, block=block, **pool_kwargs)
+        self.poolmanager.pool_classes_by_scheme = _counting_pool_classes(self.stats, self.pool_timeout)
+
+    def send(self, request, **kwargs):
+        self.stats.record_request()
+        try:
+            return super().send(request, **kwargs)
+        except EmptyPoolError as e:
+            # A blocking pool stayed full for pool_timeout seconds
+            raise requests.exceptions.ConnectionError(e, request=request)
+
+
+def create_pooled_session(
+    pool_connections: int,
+    pool_maxsize: int,
+    pool_block: bool = False,
+    pool_timeout: Optional[float] = None,
+    headers: Optional[Dict[str, str]] = None
+) -> requests.Session:
+    """
+    Create a keep-alive session backed by a PooledHTTPAdapter
+
+    Args:
+        pool_connections: Number of per-host pools to cache
+        pool_maxsize: Maximum open connections kept per host
+        pool_block: Wait when a host's pool is exhausted instead of opening
+            throwaway connections (enforces the per-host limit)
+        pool_timeout: Longest wait for a free connection when pool_block is set
+        headers: Default headers sent with every request
+
+    Returns:
+        Configured requests.Session; adapter stats are at ``session.pool_stats``
+    """
+    session = requests.Session()
+    adapter = PooledHTTPAdapter(
+        pool_connections=pool_connections,
+        pool_maxsize=pool_maxsize,
+        pool_block=pool_block,
+        pool_timeout=pool_timeout,
+        max_retries=0
+    )
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    session.headers.update({'Connection': 'keep-alive'})
+    if headers:
+        session.headers.update(headers)
+
+    session.pool_stats = adapter.stats
+    return session
@@ -1,53 +1,103 @@
 import json
+import time
 import requests
-from typing import Dict, Optional, List
+from typing import Dict, Iterator, Optional, List
 from config import Config
+from .context_cache import CONTEXT_CACHE_MISS_STATUSES, create_context_cache
+from .history_manager import ConversationHistory
+from .http_pool import create_pooled_session
+from .llm_providers import LLMProvider, ProviderRouter, create_providers
+from .resilience import CircuitOpenError
+from .response_cache import ResponseCache, create_response_cache, make_prompt_key
+from .single_flight import SingleFlight, SingleFlightTimeout
+from .prompt_templates import CHAT_RESPONSE_SCHEMA, EMOJI_SET, PROMPT_TEMPLATES, SCENE_IDS, SCENE_PROMPT_INFO
+from .stream_parser import ResponseStreamParser, parse_response_fields
 
 
-class GeminiClient:
-    """Client for interacting with Google Gemini 2.0 Flash API"""
+class BaseGeminiClient:
+    """Prompt building and response parsing shared by the sync and async Gemini clients"""
 
-    def __init__(self, api_key: Optional[str] = None):
+    def __init__(self, api_key: Optional[str] = None, response_cache: Optional[ResponseCache] = None):
         """
-        Initialize Gemini client
+        Initialize shared client settings
 
         Args:
             api_key: Gemini API key (uses Config.GEMINI_API_KEY if not provided)
+            response_cache: Cache for identical prompts (built from Config.LLM_CACHE_* if not provided)
         """
         self.api_key = api_key or Config.GEMINI_API_KEY
-        self.api_url = Config.GEMINI_API_URL
-        self.headers = {
-            'Content-Type': 'application/json',
-            'X-goog-api-key': self.api_key
-        }
-
-    def generate_response(
-        self,
-        user_message: str,
-        current_scene: str,
-        conversation_history: Optional[List[Dict]] = None,
-        system_context: Optional[str] = None
-    ) -> Dict:
+        self.timeout = Config.GEMINI_REQUEST_TIMEOUT
+        self.providers = create_providers(self.api_key)
+        self.router = ProviderRouter(
+            self.providers,
+            alpha=Config.LLM_ROUTER_EWMA_ALPHA,
+            explore=Config.LLM_ROUTER_EXPLORE
+        )
+        self.response_cache = response_cache or create_response_cache()
+        # Cached contexts live on Gemini; other providers always get the prompt inlined
+        has_gemini = any(provider.supports_context_cache for provider in self.providers)
+        self.context_cache = create_context_cache(self.api_key) if has_gemini else None
+
+    def get_cache_stats(self) -> Dict:
+        """Get response cache hit/miss metrics"""
+        if not self.response_cache:
+            return {'enabled': False}
+        return self.response_cache.stats()
+
+    def get_resilience_stats(self) -> Dict:
+        """Get circuit breaker state and retry/hedge counters per provider"""
+        return {provider.name: provider.resilience.stats() for provider in self.providers}
+
+    def get_router_stats(self) -> Dict:
+        """Get per-provider latency / error averages used for routing"""
+        return self.router.stats()
+
+    def get_context_cache_stats(self) -> Dict:
+        """Get upstream context cache registration metrics"""
+        if not self.context_cache:
+            return {'enabled': False}
+        return self.context_cache.stats()
+
+    def _cached_context_for(self, prompt: str) -> Optional[str]:
+        """Name of the upstream cached context holding the prompt's static prefix, if any"""
+        prefix = getattr(prompt, 'static_prefix', '')
+        if not self.context_cache or not prefix:
+            return None
+        return self.context_cache.get(prefix)
+
+    def _request_key(self, prompt: str, payload: Dict) -> str:
+        """Identity of a request for caching and coalescing"""
+        return make_prompt_key(prompt, payload['generationConfig'])
+
+    def _cache_get(self, key: str) -> Optional[str]:
+        """Look up cached model text"""
+        if not self.response_cache:
+            return None
+        return self.response_cache.get(key)
+
+    def _cache_set(self, key: str, ai_text: str):
+        """Store model text for later identical prompts"""
+        if self.response_cache and ai_text:
+            self.response_cache.set(key, ai_text)
+
+    def _replay_cached(self, ai_text: str, current_scene: str) -> Iterator[Dict]:
+        """Stream events for a cached response (the whole message arrives as one delta)"""
+        data = self._parse_ai_response(ai_text, current_scene)
+        if data['message']:
+            yield {'event': 'delta', 'text': data['message']}
+        yield {'event': 'done', 'data': data}
+
+    def _build_payload(self, prompt: str, response_schema: Optional[Dict] = None) -> Dict:
         """
-        Generate AI response using Gemini API
+        Build the canonical (generateContent-shaped) request body for a prompt
 
-        Args:
-            user_message: User's input message
-            current_scene: Current scene ID (computer_room, bedroom, mcp_studio, planning_room)
-            conversation_history: List of previous messages for context
-            system_context: Additional system context (for RPG game state, etc.)
+        Providers other than Gemini translate it to their own format.
 
-        Returns:
-            Dict containing:
-                - message: AI response text
-                - emoji: Emoji filename
-                - scene: Suggested scene ID
-                - mcp_command: MCP command if in MCP studio (optional)
+        Args:
+            prompt: Full prompt text
+            response_schema: Request JSON output constrained to this schema
+                (e.g. CHAT_RESPONSE_SCHEMA; None for free text such as RPG narration)
         """
-        # Build the prompt with scene context
-        prompt = self._build_prompt(user_message, current_scene, conversation_history, system_context)
-
-        # Prepare API request
         payload = {
             "contents": [
                 {
@@ -65,39 +115,23 @@ class GeminiClient:
                 "maxOutputTokens": 1024,
             }
         }
-
-        try:
-            # Make API request
-            response = requests.post(
-                self.api_url,
-                headers=self.headers,
-                json=payload,
-                timeout=30
-            )
-            response.raise_for_status()
-
-            # Parse response
-            result = response.json()
-            ai_text = result['candidates'][0]['content']['parts'][0]['text']
-
-            # Extract JSON from response
-            parsed_response = self._parse_ai_response(ai_text, current_scene)
-
-            return {
-                'success': True,
-                'data': parsed_response
-            }
-
-        except requests.exceptions.RequestException as e:
-            return {
-                'success': False,
-                'error': f'API request failed: {str(e)}'
-            }
-        except (KeyError, IndexError, json.JSONDecodeError) as e:
-            return {
-                'success': False,
-                'error': f'Failed to parse API response: {str(e)}'
-            }
+        if response_schema and Config.GEMINI_STRUCTURED_OUTPUT:
+            payload["generationConfig"]["responseMimeType"] = "application/json"
+            payload["generationConfig"]["responseSchema"] = response_schema
+        return payload
+
+    @staticmethod
+    def _cached_payload(payload: Dict, prompt: str, cached_content: str) -> Dict:
+        """Copy of a payload that references an upstream cached context and sends only the dynamic suffix"""
+        cached = dict(payload)
+        cached["contents"] = [{"parts": [{"text": prompt.dynamic_suffix}]}]
+        cached["cachedContent"] = cached_content
+        return cached
+
+    @staticmethod
+    def _response_schema(system_context: Optional[str]) -> Optional[Dict]:
+        """Output schema for a chat request (scene chat replies are JSON, RPG narration is free text)"""
+        return None if system_context else CHAT_RESPONSE_SCHEMA
 
     def _build_prompt(
         self,
@@ -112,119 +146,318 @@ class GeminiClient:
         if system_context:
             return system_context
 
-        # Scene descriptions
-        scene_info = {
-            'computer_room': {
-                'name': '電腦房',
-                'description': '一個現代化的電腦房，用於控制電腦、檢索網路資訊和進行線上活動。'
-            },
-            'bedroom': {
-                'name': '臥室',
-                'description': '一個舒適寧靜的臥室，適合休息、放鬆和睡眠。'
-            },
-            'mcp_studio': {
-                'name': 'MCP 工作室',
-                'description': '一個高科技的開發工作室，專門用於使用 MCP (Model Context Protocol) 工具進行開發工作。'
-            },
-            'planning_room': {
-                'name': '繪圖室',
-                'description': '一個創意規劃空間，用於構思、設計和規劃各種專案。'
-            }
-        }
-
-        # Available emojis
-        available_emojis = [
-            '預設.png', '開心.png', '大笑.png', '傷心.png', '大哭.png',
-            '生氣.png', '喜愛.png', '搞笑.png', '困惑.png', '驚訝.png',
-            '震驚.png', '思考.png', '困倦.png', '放鬆.png', '自信.png',
-            '酷炫.png', '調皮.png', '尷尬.png', '眨眼.png', '飛吻.png', '美味.png'
-        ]
-
-        scene = scene_info.get(current_scene, scene_info['computer_room'])
+        scene = SCENE_PROMPT_INFO.get(current_scene, SCENE_PROMPT_INFO['computer_room'])
 
         # Build conversation context
-        context = ""
-        if conversation_history and len(conversation_history) > 0:
-            context = "\n\n對話歷史（最近3則）:\n"
+        history = ""
+        if isinstance(conversation_history, ConversationHistory):
+            history = conversation_history.render()
+        elif conversation_history:
+            lines = ["\n\n對話歷史（最近3則）:"]
             for msg in conversation_history[-3:]:
                 role = "用戶" if msg.get('role') == 'user' else "AI"
-                context += f"{role}: {msg.get('message', '')}\n"
+                lines.append(f"{role}: {msg.get('message', '')}")
+            history = "\n".join(lines) + "\n"
+
+        return PROMPT_TEMPLATES['scene_chat'].render(
+            scene_name=scene['name'],
+            scene_id=current_scene,
+            scene_description=scene['description'],
+            history=history,
+            user_message=user_message
+        )
+
+    def _parse_ai_response(self, ai_text: str, current_scene: str, fields: Optional[Dict] = None) -> Dict:
+        """
+        Parse AI response to extract structured data
 
-        prompt = f"""你是一個虛擬 AI 助手，正在一棟透天建築中與用戶互動。你需要扮演一個友善、有幫助且富有情感的助手。
+        Args:
+            ai_text: Raw model output
+            current_scene: Scene to keep when the reply names none (or an unknown one)
+            fields: Fields already decoded by a ResponseStreamParser; skips re-parsing ai_text
+        """
+        if fields is None:
+            fields = parse_response_fields(ai_text)
+
+        message = fields.get('message')
+        emoji = fields.get('emoji')
+        scene = fields.get('scene')
+        mcp_command = fields.get('mcp_command')
+
+        # Validate against the known sets; fall back to defaults / current scene
+        return {
+            'message': message if isinstance(message, str) and message else '抱歉，我無法生成適當的回應。',
+            'emoji': emoji if isinstance(emoji, str) and emoji in EMOJI_SET else '預設.png',
+            'scene': scene if isinstance(scene, str) and scene in SCENE_IDS else current_scene,
+            'mcp_command': mcp_command if isinstance(mcp_command, str) else ''
+        }
 
-當前場景：{scene['name']}
-場景描述：{scene['description']}{context}
 
-用戶訊息：{user_message}
+class GeminiClient(BaseGeminiClient):
+    """Client for interacting with Google Gemini 2.0 Flash API"""
+
+    def __init__(
+        self,
+        api_key: Optional[str] = None,
+        session: Optional[requests.Session] = None,
+        response_cache: Optional[ResponseCache] = None
+    ):
+        """
+        Initialize Gemini client
+
+        Args:
+            api_key: Gemini API key (uses Config.GEMINI_API_KEY if not provided)
+            session: HTTP session to reuse (a pooled keep-alive session is created if not provided)
+            response_cache: Cache for identical prompts (built from Config.LLM_CACHE_* if not provided)
+        """
+        super().__init__(api_key, response_cache)
+        self.session = session or create_pooled_session(
+            pool_connections=Config.GEMINI_POOL_CONNECTIONS,
+            pool_maxsize=Config.GEMINI_POOL_MAXSIZE,
+            pool_block=Config.GEMINI_POOL_BLOCK,
+            pool_timeout=Config.GEMINI_REQUEST_TIMEOUT
+        )
+        self.single_flight = SingleFlight(Config.LLM_COALESCE_WAIT_TIMEOUT) if Config.LLM_COALESCE_ENABLED else None
+
+    def get_coalescing_stats(self) -> Dict:
+        """Get single-flight leader/coalesced/timeout counters"""
+        if not self.single_flight:
+            return {'enabled': False}
+        return {'enabled': True, **self.single_flight.stats()}
+
+    def get_pool_stats(self) -> Dict:
+        """Get connection reuse counters for the underlying HTTP session"""
+        stats = getattr(self.session, 'pool_stats', None)
+        if stats is None:
+            return {}
+        return {
+            **stats.to_dict(),
+            'pool_connections': Config.GEMINI_POOL_CONNECTIONS,
+            'pool_maxsize': Config.GEMINI_POOL_MAXSIZE
+        }
+
+    def close(self):
+        """Close pooled connections"""
+        self.session.close()
+
+    def generate_response(
+        self,
+        user_message: str,
+        current_scene: str,
+        conversation_history: Optional[List[Dict]] = None,
+        system_context: Optional[str] = None
+    ) -> Dict:
+        """
+        Generate AI response using Gemini API
+
+        Args:
+            user_message: User's input message
+            current_scene: Current scene ID (computer_room, bedroom, mcp_studio, planning_room)
+            conversation_history: ConversationHistory, or a list of previous messages (last 3 used)
+            system_context: Additional system context (for RPG game state, etc.)
 
-請根據用戶的訊息回應，並以 JSON 格式輸出（不要包含markdown代碼塊標記，直接輸出JSON）：
-{{
-  "message": "你的回應內容（自然、親切、有情感的回應）",
-  "emoji": "選擇最合適的表情符號檔名",
-  "scene": "建議的場景ID（如果需要切換場景）或保持當前場景",
-  "mcp_command": "如果在 MCP 工作室且用戶提到使用工具，提供模擬的 MCP 指令，否則為空字串"
-}}
+        Returns:
+            Dict containing:
+                - message: AI response text
+                - emoji: Emoji filename
+                - scene: Suggested scene ID
+                - mcp_command: MCP command if in MCP studio (optional)
+        """
+        # Build the prompt with scene context
+        prompt = self._build_prompt(user_message, current_scene, conversation_history, system_context)
 
-可用表情符號：{', '.join(available_emojis)}
+        result = self.generate_text(prompt, self._response_schema(system_context))
+        if not result['success']:
+            return result
 
-可用場景ID：
-- computer_room（電腦房）：適合網路搜尋、查詢資訊、使用電腦相關活動
-- bedroom（臥室）：適合休息、睡眠、放鬆
-- mcp_studio（MCP工作室）：適合開發、使用工具、技術工作
-- planning_room（繪圖室）：適合規劃、設計、創意思考
+        return {
+            'success': True,
+            'data': self._parse_ai_response(result['text'], current_scene)
+        }
 
-場景切換規則：
-- **重要：每次回應都必須輸出 scene 欄位，即使場景不變**
-- 如果當前場景合適且用戶沒有要求切換，使用 "{current_scene}"
-- 只在用戶明確表示要進行相關活動時才建議切換場景
-- 根據對話內容和用戶意圖智慧推薦最適合的場景
-- 絕對不可以省略 scene 欄位，這會導致系統錯誤
+    def generate_text(self, prompt: str, response_schema: Optional[Dict] = None) -> Dict:
+        """
+        Generate raw model text for a prompt built by the caller
 
-表情符號選擇規則：
-- 根據你回應的情緒和語氣選擇最合適的表情
-- 如果是積極正面的回應，選擇「開心.png」、「自信.png」等
-- 如果是思考或分析，選擇「思考.png」
-- 如果是幽默或輕鬆，選擇「搞笑.png」、「調皮.png」
-- 預設使用「預設.png」
+        Goes through the same response cache, coalescing, context cache and
+        resilience policy as generate_response.
 
-MCP 指令規則：
-- 只在 mcp_studio 場景且用戶明確提到使用工具時才提供
-- 格式範例："mcp list-tools"、"mcp execute search --query=xxx"
-- 如果不適用，返回空字串
+        Args:
+            prompt: Full prompt text (a RenderedPrompt enables the context cache)
+            response_schema: Request JSON output matching this schema
 
-請確保輸出是有效的 JSON 格式，不要包含任何額外的文字或markdown標記。"""
+        Returns:
+            Dict with 'success' and either 'text' or 'error'
+        """
+        # Prepare API request
+        payload = self._build_payload(prompt, response_schema)
 
-        return prompt
+        # Serve identical prompts from cache
+        request_key = self._request_key(prompt, payload)
+        cached_text = self._cache_get(request_key)
+        if cached_text is not None:
+            return {'success': True, 'text': cached_text}
 
-    def _parse_ai_response(self, ai_text: str, current_scene: str) -> Dict:
-        """Parse AI response to extract structured data"""
         try:
-            # Remove markdown code block markers if present
-            ai_text = ai_text.strip()
-            if ai_text.startswith('```json'):
-                ai_text = ai_text[7:]
-            if ai_text.startswith('```'):
-                ai_text = ai_text[3:]
-            if ai_text.endswith('```'):
-                ai_text = ai_text[:-3]
-            ai_text = ai_text.strip()
-
-            # Parse JSON
-            parsed = json.loads(ai_text)
-
-            # Validate and set defaults - use current_scene as fallback
+            # Make API request, sharing it with concurrent identical prompts
+            if self.single_flight:
+                ai_text = self.single_flight.do(request_key, lambda: self._fetch_text(prompt, payload, request_key))
+            else:
+                ai_text = self._fetch_text(prompt, payload, request_key)
+
+            return {'success': True, 'text': ai_text}
+
+        except requests.exceptions.RequestException as e:
             return {
-                'message': parsed.get('message', '抱歉，我無法生成適當的回應。'),
-                'emoji': parsed.get('emoji', '預設.png'),
-                'scene': parsed.get('scene', current_scene),  # Default to current scene
-                'mcp_command': parsed.get('mcp_command', '')
+                'success': False,
+                'error': f'API request failed: {str(e)}'
             }
-
-        except json.JSONDecodeError:
-            # Fallback: return plain text as message, keep current scene
+        except SingleFlightTimeout as e:
             return {
-                'message': ai_text if ai_text else '抱歉，我無法生成適當的回應。',
-                'emoji': '預設.png',
-                'scene': current_scene,  # Keep current scene on error
-                'mcp_command': ''
+                'success': False,
+                'error': f'API request timed out: {str(e)}'
             }
+        except CircuitOpenError as e:
+            return {
+                'success': False,
+                'error': f'API temporarily unavailable: {str(e)}'
+            }
+        except (KeyError, IndexError, json.JSONDecodeError) as e:
+            return {
+                'success': False,
+                'error': f'Failed to parse API response: {str(e)}'
+            }
+
+    def _post(self, prompt: str, payload: Dict, stream: bool = False):
+        """
+        POST a request to the best-ranked provider, failing over to the next one on error
+
+        Args:
+            prompt: Prompt the payload was built from
+            payload: Canonical request body with the prompt inlined
+            stream: Whether to stream the response body
+
+        Returns:
+            Tuple of (provider that answered, successful response)
+
+        Raises:
+            requests.exceptions.RequestException: If every provider failed (the last error)
+            CircuitOpenError: If every provider's circuit breaker is rejecting calls
+        """
+        error = None
+        for provider in self.router.ordered():
+            self.router.begin(provider)
+            started = time.monotonic()
+            try:
+                response = self._post_to(provider, prompt, payload, stream)
+            except (requests.exceptions.RequestException, CircuitOpenError) as e:
+                self.router.end(provider, time.monotonic() - started, ok=False)
+                error = e
+                continue
+            except BaseException:
+                # A bug on our side: nothing to learn about the provider
+                self.router.end(provider, time.monotonic() - started, ok=None)
+                raise
+            self.router.end(provider, time.monotonic() - started, ok=True)
+            return provider, response
+        raise error
+
+    def _post_to(self, provider: LLMProvider, prompt: str, payload: Dict, stream: bool) -> requests.Response:
+        """POST to one provider, referencing the prompt's upstream cached context when it supports one"""
+        cached_content = self._cached_context_for(prompt) if provider.supports_context_cache else None
+        if cached_content:
+            response = self._send(provider, self._cached_payload(payload, prompt, cached_content), stream)
+            if response.status_code not in CONTEXT_CACHE_MISS_STATUSES:
+                return self._raise_for_status(response)
+
+            # The cached context expired or was deleted upstream; retry with the prefix inlined
+            response.close()
+            self.context_cache.invalidate(prompt.static_prefix)
+
+        response = self._send(provider, payload, stream)
+        return self._raise_for_status(response)
+
+    def _send(self, provider: LLMProvider, payload: Dict, stream: bool) -> requests.Response:
+        """Send one request under the provider's retry / hedge / circuit-breaker policy"""
+        url, headers, body = provider.request(payload, stream)
+        return provider.resilience.execute(
+            lambda: self.session.post(
+                url,
+                headers=headers,
+                json=body,
+                timeout=self.timeout,
+                stream=stream
+            ),
+            # A hedge would duplicate a stream that is already being relayed
+            hedge=not stream
+        )
+
+    @staticmethod
+    def _raise_for_status(response: requests.Response) -> requests.Response:
+        """Raise HTTPError for error statuses, releasing the connection first"""
+        if not response.ok:
+            response.close()
+        response.raise_for_status()
+        return response
+
+    def _fetch_text(self, prompt: str, payload: Dict, request_key: str) -> str:
+        """Generate text with the routed provider and return (and cache) it"""
+        provider, response = self._post(prompt, payload)
+
+        ai_text = provider.extract_text(response.json())
+        self._cache_set(request_key, ai_text)
+        return ai_text
+
+    def stream_response(
+        self,
+        user_message: str,
+        current_scene: str,
+        conversation_history: Optional[List[Dict]] = None,
+        system_context: Optional[str] = None
+    ) -> Iterator[Dict]:
+        """
+        Generate AI response using the streamGenerateContent endpoint
+
+        Args:
+            user_message: User's input message
+            current_scene: Current scene ID
+            conversation_history: ConversationHistory, or a list of previous messages (last 3 used)
+            system_context: Additional system context (for RPG game state, etc.)
+
+        Yields:
+            Event dicts, in order:
+                - {'event': 'delta', 'text': ...} for each new piece of the message text
+                - {'event': 'done', 'data': {...}} with the same fields as generate_response
+                - {'event': 'error', 'error': ...} instead of 'done' if the request fails
+        """
+        prompt = self._build_prompt(user_message, current_scene, conversation_history, system_context)
+        payload = self._build_payload(prompt, self._response_schema(system_context))
+        streamer = ResponseStreamParser()
+
+        request_key = self._request_key(prompt, payload)
+        cached_text = self._cache_get(request_key)
+        if cached_text is not None:
+            yield from self._replay_cached(cached_text, current_scene)
+            return
+
+        try:
+            provider, response = self._post(prompt, payload, stream=True)
+            with response:
+                for line in response.iter_lines():
+                    for text in provider.stream_chunk_texts(line.decode('utf-8')):
+                        delta = streamer.feed(text)
+                        if delta:
+                            yield {'event': 'delta', 'text': delta}
+
+            self._cache_set(request_key, streamer.text)
+            yield {
+                'event': 'done',
+                'data': self._parse_ai_response(streamer.text, current_scene, streamer.fields)
+            }
+
+        except requests.exceptions.RequestException as e:
+            yield {'event': 'error', 'error': f'API request failed: {str(e)}'}
+        except CircuitOpenError as e:
+            yield {'event': 'error', 'error': f'API temporarily unavailable: {str(e)}'}
+        except (KeyError, IndexError, ValueError) as e:
+            yield {'event': 'error', 'error': f'Failed to parse API response: {str(e)}'}
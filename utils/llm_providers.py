@@ -0,0 +1,357 @@
+"""
+Pluggable LLM providers and latency-aware routing
+可插拔的 LLM 提供者與延遲感知路由
+
+The clients build one canonical request (the Gemini generateContent payload
+from ``_build_payload``); each provider translates it into its own wire format
+and extracts the generated text back out:
+
+- ``GeminiProvider``: generateContent / streamGenerateContent (context cache capable)
+- ``OpenAICompatibleProvider``: POST {base}/chat/completions (OpenAI, vLLM, Ollama, ...)
+- ``LlamaCppProvider``: llama.cpp server's native POST {base}/completion
+
+``ProviderRouter`` orders the configured providers per request by a rolling
+latency and error EWMA, scaled by in-flight requests and a per-provider cost
+weight, so traffic spreads toward the fastest healthy backend and fails over to
+the next one without the routes knowing.
+"""
+
+import json
+import random
+import threading
+from abc import ABC, abstractmethod
+from typing import Dict, List, Optional, Tuple
+
+from config import Config
+from .resilience import CircuitBreaker, ResiliencePolicy
+
+
+def to_json_schema(schema: Dict) -> Dict:
+    """
+    Convert a Gemini responseSchema (OpenAPI subset, upper-case types) to JSON Schema
+
+    Args:
+        schema: e.g. CHAT_RESPONSE_SCHEMA
+
+    Returns:
+        Equivalent JSON Schema dict (propertyOrdering dropped)
+    """
+    converted = {}
+    for key, value in schema.items():
+        if key == 'propertyOrdering':
+            continue
+        if key == 'type':
+            converted[key] = value.lower()
+        elif key == 'properties':
+            converted[key] = {name: to_json_schema(sub) for name, sub in value.items()}
+        elif key == 'items':
+            converted[key] = to_json_schema(value)
+        else:
+            converted[key] = value
+    if converted.get('type') == 'object':
+        converted.setdefault('additionalProperties', False)
+    return converted
+
+
+def _prompt_text(payload: Dict) -> str:
+    """The prompt text carried by a canonical (Gemini-format) payload"""
+    return ''.join(
+        part.get('text', '')
+        for content in payload.get('contents', [])
+        for part in content.get('parts', [])
+    )
+
+
+def _sse_data(line: str) -> Optional[str]:
+    """Payload of an SSE 'data:' line, or None for other lines"""
+    if not line.startswith('data:'):
+        return None
+    return line[5:].strip()
+
+
+class LLMProvider(ABC):
+    """One upstream backend: request translation, response extraction and its own resilience policy"""
+
+    kind = ''
+    supports_context_cache = False
+
+    def __init__(self, name: str, model: str, cost_weight: float = 1.0):
+        """
+        Args:
+            name: Provider name used in stats and routing
+            model: Model identifier sent to the backend
+            cost_weight: Relative cost; the router treats a provider with weight 2 as if it were twice as slow
+        """
+        self.name = name
+        self.model = model
+        self.cost_weight = cost_weight
+        # Each backend gets its own retry budget, hedge delay and circuit breaker
+        self.resilience = ResiliencePolicy()
+
+    @abstractmethod
+    def request(self, payload: Dict, stream: bool) -> Tuple[str, Dict, Dict]:
+        """
+        Translate a canonical payload
+
+        Returns:
+            Tuple of (url, headers, JSON body)
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def extract_text(self, result: Dict) -> str:
+        """Generated text of a non-streamed response body"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def stream_chunk_texts(self, line: str) -> List[str]:
+        """Text pieces carried by one line of a streamed response"""
+        raise NotImplementedError
+
+
+class GeminiProvider(LLMProvider):
+    """Google Gemini generateContent API"""
+
+    kind = 'gemini'
+    supports_context_cache = True
+
+    def __init__(self, api_key: str, cost_weight: float = 1.0):
+        super().__init__('gemini', Config.GEMINI_MODEL, cost_weight)
+        self.api_url = Config.GEMINI_API_URL
+        self.stream_api_url = Config.GEMINI_STREAM_API_URL
+        self.headers = {
+            'Content-Type': 'application/json',
+            'X-goog-api-key': api_key
+        }
+
+    def request(self, payload: Dict, stream: bool) -> Tuple[str, Dict, Dict]:
+        return (self.stream_api_url if stream else self.api_url), self.headers, payload
+
+    def extract_text(self, result: Dict) -> str:
+        return result['candidates'][0]['content']['parts'][0]['text']
+
+    def stream_chunk_texts(self, line: str) -> List[str]:
+        # SSE frames: "data: {...GenerateContentResponse...}"
+        data = _sse_data(line)
+        if not data:
+            return []
+        chunk = json.loads(data)
+        texts = []
+        for candidate in chunk.get('candidates', [])[:1]:
+            for part in candidate.get('content', {}).get('parts', []):
+                texts.append(part.get('text', ''))
+        return texts
+
+
+class OpenAICompatibleProvider(LLMProvider):
+    """Any server implementing the OpenAI chat completions API"""
+
+    kind = 'openai'
+
+    def __init__(self, api_base: str, api_key: str, model: str, cost_weight: float = 1.0, name: str = 'openai'):
+        super().__init__(name, model, cost_weight)
+        self.url = f"{api_base.rstrip('/')}/chat/completions"
+        self.headers = {'Content-Type': 'application/json'}
+        if api_key:
+            self.headers['Authorization'] = f'Bearer {api_key}'
+
+    def request(self, payload: Dict, stream: bool) -> Tuple[str, Dict, Dict]:
+        config = payload.get('generationConfig', {})
+        body = {
+            'model': self.model,
+            'messages': [{'role': 'user', 'content': _prompt_text(payload)}],
+            'temperature': config.get('temperature'),
+            'top_p': config.get('topP'),
+            'max_tokens': config.get('maxOutputTokens'),
+            'stream': stream
+        }
+        if config.get('responseSchema'):
+            body['response_format'] = {
+                'type': 'json_schema',
+                'json_schema': {'name': 'response', 'schema': to_json_schema(config['responseSchema'])}
+            }
+        return self.url, self.headers, {key: value for key, value in body.items() if value is not None}
+
+    def extract_text(self, result: Dict) -> str:
+        return result['choices'][0]['message']['content']
+
+    def stream_chunk_texts(self, line: str) -> List[str]:
+        # SSE frames: "data: {...chat.completion.chunk...}", ending with "data: [DONE]"
+        data = _sse_data(line)
+        if not data or data == '[DONE]':
+            return []
+        chunk = json.loads(data)
+        texts = []
+        for choice in chunk.get('choices', [])[:1]:
+            content = choice.get('delta', {}).get('content')
+            if content:
+                texts.append(content)
+        return texts
+
+
+class LlamaCppProvider(LLMProvider):
+    """llama.cpp server's native /completion endpoint"""
+
+    kind = 'llamacpp'
+
+    def __init__(self, api_base: str, cost_weight: float = 1.0, name: str = 'llamacpp'):
+        super().__init__(name, 'local', cost_weight)
+        self.url = f"{api_base.rstrip('/')}/completion"
+        self.headers = {'Content-Type': 'application/json'}
+
+    def request(self, payload: Dict, stream: bool) -> Tuple[str, Dict, Dict]:
+        config = payload.get('generationConfig', {})
+        body = {
+            'prompt': _prompt_text(payload),
+            'n_predict': config.get('maxOutputTokens', -1),
+            'temperature': config.get('temperature'),
+            'top_k': config.get('topK'),
+            'top_p': config.get('topP'),
+            'stream': stream,
+            'cache_prompt': True
+        }
+        if config.get('responseSchema'):
+            body['json_schema'] = to_json_schema(config['responseSchema'])
+        return self.url, self.headers, {key: value for key, value in body.items() if value is not None}
+
+    def extract_text(self, result: Dict) -> str:
+        return result['content']
+
+    def stream_chunk_texts(self, line: str) -> List[str]:
+        # SSE frames: "data: {"content": "...", "stop": false}"
+        data = _sse_data(line)
+        if not data:
+            return []
+        content = json.loads(data).get('content')
+        return [content] if content else []
+
+
+class _ProviderHealth:
+    """Rolling latency / error averages and in-flight count of one provider"""
+
+    __slots__ = ('latency', 'error_rate', 'in_flight', 'requests', 'failures')
+
+    def __init__(self):
+        self.latency = None  # Seconds; None until the first success
+        self.error_rate = 0.0
+        self.in_flight = 0
+        self.requests = 0
+        self.failures = 0
+
+
+class ProviderRouter:
+    """Orders providers per request by EWMA latency, error rate, load and cost"""
+
+    def __init__(self, providers: List[LLMProvider], alpha: float = 0.2, explore: float = 0.05,
+                 initial_latency: float = 1.0):
+        """
+        Args:
+            providers: Configured providers (first one wins ties)
+            alpha: EWMA smoothing factor for latency and error rate
+            explore: Chance of trying a random provider first, keeping every provider's averages fresh
+            initial_latency: Latency assumed for a provider with no successful calls yet
+        """
+        if not providers:
+            raise ValueError('At least one LLM provider must be configured')
+        self.providers = providers
+        self.alpha = alpha
+        self.explore = explore
+        self.initial_latency = initial_latency
+        self._health = {provider.name: _ProviderHealth() for provider in providers}
+        self._lock = threading.Lock()
+
+    def _score(self, provider: LLMProvider) -> float:
+        health = self._health[provider.name]
+        latency = self.initial_latency if health.latency is None else health.latency
+        # Expected cost of sending the request here: queueing behind in-flight
+        # calls, and a retry elsewhere if it fails
+        return latency * (1 + health.in_flight) * provider.cost_weight / max(0.05, 1 - health.error_rate)
+
+    def ordered(self) -> List[LLMProvider]:
+        """
+        Providers in the order to try them for one request
+
+        Providers whose circuit breaker is open go last (they fail fast).
+        """
+        if len(self.providers) == 1:
+            return list(self.providers)
+
+        with self._lock:
+            ranked = sorted(
+                self.providers,
+                key=lambda provider: (provider.resilience.breaker.state == CircuitBreaker.OPEN, self._score(provider))
+            )
+        if random.random() < self.explore:
+            ranked.insert(0, ranked.pop(random.randrange(len(ranked))))
+        return ranked
+
+    def begin(self, provider: LLMProvider):
+        """Mark a request as in flight on a provider"""
+        with self._lock:
+            self._health[provider.name].in_flight += 1
+
+    def end(self, provider: LLMProvider, elapsed: float, ok: Optional[bool]):
+        """
+        Record the outcome of a request started with begin()
+
+        Args:
+            provider: Provider the request went to
+            elapsed: Seconds until the response (headers, for streams) arrived
+            ok: Whether the provider answered successfully (None: abandoned, nothing to record)
+        """
+        with self._lock:
+            health = self._health[provider.name]
+            health.in_flight -= 1
+            if ok is None:
+                return
+            health.requests += 1
+            health.error_rate += self.alpha * ((0.0 if ok else 1.0) - health.error_rate)
+            if ok:
+                health.latency = elapsed if health.latency is None else health.latency + self.alpha * (elapsed - health.latency)
+            else:
+                health.failures += 1
+
+    def stats(self) -> Dict:
+        """Per-provider routing state"""
+        with self._lock:
+            return {
+                provider.name: {
+                    'kind': provider.kind,
+                    'model': provider.model,
+                    'cost_weight': provider.cost_weight,
+                    'latency_ewma': round(self._health[provider.name].latency, 4)
+                    if self._health[provider.name].latency is not None else None,
+                    'error_rate_ewma': round(self._health[provider.name].error_rate, 4),
+                    'in_flight': self._health[provider.name].in_flight,
+                    'requests': self._health[provider.name].requests,
+                    'failures': self._health[provider.name].failures,
+                    'score': round(self._score(provider), 4),
+                    'breaker': provider.resilience.breaker.state
+                }
+                for provider in self.providers
+            }
+
+
+def create_providers(gemini_api_key: str) -> List[LLMProvider]:
+    """
+    Build the providers listed in Config.LLM_PROVIDERS
+
+    Args:
+        gemini_api_key: API key for the Gemini provider
+
+    Returns:
+        Providers in configured order
+    """
+    providers = []
+    for name in Config.LLM_PROVIDERS:
+        if name == 'gemini':
+            providers.append(GeminiProvider(gemini_api_key, Config.GEMINI_COST_WEIGHT))
+        elif name == 'openai':
+            providers.append(OpenAICompatibleProvider(
+                Config.OPENAI_API_BASE, Config.OPENAI_API_KEY, Config.OPENAI_MODEL, Config.OPENAI_COST_WEIGHT
+            ))
+        elif name == 'llamacpp':
+            providers.append(LlamaCppProvider(Config.LLAMACPP_API_BASE, Config.LLAMACPP_COST_WEIGHT))
+        else:
+            raise ValueError(f'Unknown LLM provider: {name}')
+    return providers
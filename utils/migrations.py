@@ -0,0 +1,539 @@
+"""
+Versioned schema migrations with resumable, batched backfills (RPG app)
+版本化数据库迁移（可续跑的分批回填）
+
+db.create_all() only creates missing tables; it never changes a table that
+already exists. Schema changes for a populated game.db are declared here as
+numbered migrations (MIGRATIONS), each a list of operations:
+
+- AddIndex: CREATE INDEX IF NOT EXISTS. SQLite builds an index in a single
+  statement and holds the write lock while it does, so large indexes are
+  best added with MIGRATIONS_ON_STARTUP=sync or tools/migrate.py.
+- AddColumn: ALTER TABLE ... ADD COLUMN, skipped if the column exists.
+- Backfill: fills columns in primary-key order, batch_size rows per short
+  transaction with a pause between batches, so game writes interleave with
+  the backfill instead of waiting for it.
+
+Progress (operation step, backfill cursor, rows done) lives in the
+schema_migrations table and is committed in the same transaction as each
+batch, so an interrupted run resumes at the next batch. Operations are
+idempotent, so a fresh database built by create_all() passes through the same
+migrations as no-ops. A lease in schema_migration_lock, renewed with every
+batch, keeps two processes from migrating at once; a crashed holder's lease
+expires after MIGRATION_LOCK_TTL seconds.
+
+Adding a column: add it to the model and append a migration with AddColumn
+(and a Backfill if existing rows need a value). Code reading the column must
+cope with NULL until the backfill has finished.
+"""
+
+import logging
+import os
+import re
+import socket
+import threading
+import time
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Sequence, Union
+
+from sqlalchemy import inspect, text
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+_IDENTIFIER = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+
+_SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS schema_migrations ('
+    ' version INTEGER PRIMARY KEY,'
+    ' name VARCHAR(200) NOT NULL,'
+    ' status VARCHAR(20) NOT NULL,'  # running, applied
+    ' step INTEGER NOT NULL DEFAULT 0,'  # Operations completed
+    ' last_key INTEGER,'  # Backfill cursor of the current operation
+    ' rows_done INTEGER NOT NULL DEFAULT 0,'
+    ' started_at VARCHAR(32),'
+    ' applied_at VARCHAR(32))',
+    'CREATE TABLE IF NOT EXISTS schema_migration_lock ('
+    ' id INTEGER PRIMARY KEY,'
+    ' owner VARCHAR(200) NOT NULL,'
+    ' expires_at FLOAT NOT NULL)'
+)
+
+STARTUP_MODES = ('sync', 'background', 'off')
+
+
+class MigrationError(Exception):
+    """A migration could not run (lease lost or held by another process)"""
+
+
+def _identifier(name: str) -> str:
+    if not _IDENTIFIER.match(name):
+        raise ValueError(f'Invalid SQL identifier: {name!r}')
+    return name
+
+
+def _now() -> str:
+    return datetime.utcnow().isoformat(timespec='seconds')
+
+
+class Operation(ABC):
+    """One step of a migration"""
+
+    @abstractmethod
+    def describe(self) -> str:
+        raise NotImplementedError
+
+    @abstractmethod
+    def execute(self, connection, run: '_MigrationRun') -> bool:
+        """
+        Do the next unit of the step inside one of the migration's transactions
+
+        Returns:
+            True once the step is complete (single-statement steps return True at once)
+        """
+        raise NotImplementedError
+
+    def after_batch(self, run: '_MigrationRun'):
+        """Called between the transactions of a step that is not complete yet"""
+
+    def apply(self, run: '_MigrationRun'):
+        while True:
+            with run.transaction() as connection:
+                if self.execute(connection, run):
+                    run.advance(connection)
+                    return
+            self.after_batch(run)
+
+
+class AddIndex(Operation):
+    """Create an index if the table lacks it"""
+
+    def __init__(self, table: str, name: str, columns: Sequence[str], unique: bool = False):
+        self.table = _identifier(table)
+        self.name = _identifier(name)
+        self.columns = [_identifier(column) for column in columns]
+        self.unique = unique
+
+    def describe(self) -> str:
+        return f"add index {self.name} on {self.table}({', '.join(self.columns)})"
+
+    def execute(self, connection, run: '_MigrationRun') -> bool:
+        connection.execute(text(
+            f"CREATE {'UNIQUE ' if self.unique else ''}INDEX IF NOT EXISTS {self.name} "
+            f"ON {self.table} ({', '.join(self.columns)})"
+        ))
+        return True
+
+
+class AddColumn(Operation):
+    """
+    Add a column if the table lacks it
+
+    Args:
+        table: Table name
+        column: Column name
+        ddl: Column type and constraints, e.g. 'INTEGER' or "VARCHAR(20) NOT NULL DEFAULT 'normal'"
+             (SQLite requires a DEFAULT for NOT NULL columns)
+    """
+
+    def __init__(self, table: str, column: str, ddl: str):
+        self.table = _identifier(table)
+        self.column = _identifier(column)
+        self.ddl = ddl
+
+    def describe(self) -> str:
+        return f'add column {self.table}.{self.column} {self.ddl}'
+
+    def execute(self, connection, run: '_MigrationRun') -> bool:
+        existing = {column['name'] for column in inspect(connection).get_columns(self.table)}
+        if self.column not in existing:
+            connection.execute(text(f'ALTER TABLE {self.table} ADD COLUMN {self.column} {self.ddl}'))
+        return True
+
+
+class Backfill(Operation):
+    """
+    Fill columns of existing rows in bounded batches
+
+    Args:
+        table: Table name
+        values: {column: SQL expression} evaluated per row (e.g. {'max_mp': 'mp'}), or a
+                callable taking a row dict and returning {column: value}
+        where: SQL condition selecting rows that still need the backfill (e.g. 'max_mp IS NULL')
+        key: Integer primary key to walk the table by
+        batch_size: Rows per transaction (MIGRATION_BATCH_SIZE if not provided)
+    """
+
+    def __init__(self, table: str, values: Union[Dict[str, str], Callable[[Dict], Dict]],
+                 where: Optional[str] = None, key: str = 'id', batch_size: Optional[int] = None):
+        self.table = _identifier(table)
+        self.values = values if callable(values) else {_identifier(column): sql for column, sql in values.items()}
+        self.where = where
+        self.key = _identifier(key)
+        self.batch_size = batch_size
+
+    def describe(self) -> str:
+        columns = 'computed columns' if callable(self.values) else ', '.join(self.values)
+        return f"backfill {self.table} ({columns}){f' where {self.where}' if self.where else ''}"
+
+    def _condition(self, last_key) -> str:
+        conditions = [f'{self.key} > :last_key'] if last_key is not None else []
+        if self.where:
+            conditions.append(f'({self.where})')
+        return f" WHERE {' AND '.join(conditions)}" if conditions else ''
+
+    def remaining(self, connection, last_key) -> int:
+        """Rows past the cursor that still match (progress estimate)"""
+        return connection.execute(
+            text(f'SELECT COUNT(*) FROM {self.table}{self._condition(last_key)}'), {'last_key': last_key}
+        ).scalar()
+
+    def _update_batch(self, connection, last_key, batch_size) -> List:
+        """Update the next batch; returns the keys of the rows touched"""
+        params = {'last_key': last_key, 'limit': batch_size}
+        condition = self._condition(last_key)
+
+        if callable(self.values):
+            rows = connection.execute(
+                text(f'SELECT * FROM {self.table}{condition} ORDER BY {self.key} LIMIT :limit'), params
+            ).mappings().all()
+            updates = [dict(self.values(dict(row)), _key=row[self.key]) for row in rows]
+            if updates:
+                columns = [_identifier(column) for column in updates[0] if column != '_key']
+                assignments = ', '.join(f'{column} = :{column}' for column in columns)
+                connection.execute(text(f'UPDATE {self.table} SET {assignments} WHERE {self.key} = :_key'), updates)
+            return [row[self.key] for row in rows]
+
+        keys = connection.execute(
+            text(f'SELECT {self.key} FROM {self.table}{condition} ORDER BY {self.key} LIMIT :limit'), params
+        ).scalars().all()
+        if keys:
+            # Same rows as selected: the key range of the batch, narrowed by the condition
+            assignments = ', '.join(f'{column} = ({sql})' for column, sql in self.values.items())
+            high = f'{self.key} <= :high'
+            where = f'{condition} AND {high}' if condition else f' WHERE {high}'
+            connection.execute(text(f'UPDATE {self.table} SET {assignments}{where}'), dict(params, high=keys[-1]))
+        return keys
+
+    def execute(self, connection, run: '_MigrationRun') -> bool:
+        """Update one batch and save the cursor with it; True when no rows are left"""
+        keys = self._update_batch(connection, run.last_key, self.batch_size or run.batch_size)
+        if not keys:
+            return True
+        run.save_progress(connection, keys[-1], len(keys))
+        return False
+
+    def after_batch(self, run: '_MigrationRun'):
+        logger.info(f'Migration {run.migration.version}: {self.table} backfilled '
+                    f'{run.rows_done}/{max(run.rows_total, run.rows_done)} rows')
+        if run.pause:
+            time.sleep(run.pause)
+
+    def apply(self, run: '_MigrationRun'):
+        with run.engine.connect() as connection:
+            run.rows_total = run.rows_done + self.remaining(connection, run.last_key)
+        super().apply(run)
+
+
+class Migration:
+    """A numbered list of operations, applied in order"""
+
+    def __init__(self, version: int, name: str, operations: List[Operation]):
+        self.version = version
+        self.name = name
+        self.operations = operations
+
+
+# Append only; never renumber or edit a migration that has shipped.
+MIGRATIONS = [
+    Migration(1, 'Indexes for hot ORM lookups', [
+        AddIndex('characters', 'ix_characters_user_id', ['user_id']),
+        AddIndex('inventory_items', 'ix_inventory_items_character_item', ['character_id', 'item_id']),
+        AddIndex('quest_progress', 'ix_quest_progress_character_quest_status', ['character_id', 'quest_id', 'status']),
+        AddIndex('game_events', 'ix_game_events_character_timestamp', ['character_id', 'timestamp'])
+    ])
+]
+
+
+class _MigrationRun:
+    """Progress of one migration while it is being applied"""
+
+    def __init__(self, engine, migration: Migration, record: Dict, owner: str,
+                 lock_ttl: float, batch_size: int, pause: float):
+        self.engine = engine
+        self.migration = migration
+        self.owner = owner
+        self.lock_ttl = lock_ttl
+        self.batch_size = batch_size
+        self.pause = pause
+        self.step = record['step']
+        self.last_key = record['last_key']
+        self.rows_done = record['rows_done']
+        self.rows_total = self.rows_done  # Progress estimate of the current backfill
+
+    @contextmanager
+    def transaction(self):
+        """One short transaction that also renews the lease"""
+        with self.engine.begin() as connection:
+            _renew_lock(connection, self.owner, self.lock_ttl)
+            yield connection
+
+    def save_progress(self, connection, last_key, rows: int):
+        connection.execute(
+            text('UPDATE schema_migrations SET last_key = :last_key, rows_done = rows_done + :rows '
+                 'WHERE version = :version'),
+            {'last_key': last_key, 'rows': rows, 'version': self.migration.version}
+        )
+        self.last_key = last_key
+        self.rows_done += rows
+
+    def advance(self, connection):
+        """Mark the current operation done"""
+        connection.execute(
+            text('UPDATE schema_migrations SET step = step + 1, last_key = NULL WHERE version = :version'),
+            {'version': self.migration.version}
+        )
+        self.step += 1
+        self.last_key = None
+
+    def apply(self, stop_at_backfill: bool = False) -> bool:
+        """
+        Apply the remaining operations
+
+        Returns:
+            True when the migration is complete, False if it stopped at a backfill
+        """
+        operations = self.migration.operations
+        for index in range(self.step, len(operations)):
+            operation = operations[index]
+            if stop_at_backfill and isinstance(operation, Backfill):
+                return False
+            logger.info(f'Migration {self.migration.version} step {index + 1}/{len(operations)}: '
+                        f'{operation.describe()}')
+            operation.apply(self)
+
+        with self.transaction() as connection:
+            connection.execute(
+                text("UPDATE schema_migrations SET status = 'applied', applied_at = :now WHERE version = :version"),
+                {'now': _now(), 'version': self.migration.version}
+            )
+        logger.info(f'Migration {self.migration.version} applied: {self.migration.name}')
+        return True
+
+
+def _owner() -> str:
+    return f'{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}'
+
+
+def _ensure_tables(engine):
+    with engine.begin() as connection:
+        for statement in _SCHEMA:
+            connection.execute(text(statement))
+
+
+def _records(connection) -> Dict[int, Dict]:
+    if not inspect(connection).has_table('schema_migrations'):
+        return {}
+    rows = connection.execute(text('SELECT * FROM schema_migrations')).mappings()
+    return {row['version']: dict(row) for row in rows}
+
+
+def _try_lock(engine, owner: str, ttl: float) -> Optional[str]:
+    """
+    Take or extend the lease
+
+    Returns:
+        None if acquired, else the current holder
+    """
+    now = time.time()
+    with engine.begin() as connection:
+        connection.execute(text(
+            "INSERT INTO schema_migration_lock (id, owner, expires_at) SELECT 1, '', 0 "
+            'WHERE NOT EXISTS (SELECT 1 FROM schema_migration_lock WHERE id = 1)'
+        ))
+        result = connection.execute(
+            text('UPDATE schema_migration_lock SET owner = :owner, expires_at = :expires '
+                 'WHERE id = 1 AND (owner = :owner OR expires_at < :now)'),
+            {'owner': owner, 'expires': now + ttl, 'now': now}
+        )
+        if result.rowcount == 1:
+            return None
+        return connection.execute(text('SELECT owner FROM schema_migration_lock WHERE id = 1')).scalar()
+
+
+def _renew_lock(connection, owner: str, ttl: float):
+    result = connection.execute(
+        text('UPDATE schema_migration_lock SET expires_at = :expires WHERE id = 1 AND owner = :owner'),
+        {'owner': owner, 'expires': time.time() + ttl}
+    )
+    if result.rowcount != 1:
+        raise MigrationError('Migration lock was taken over by another process')
+
+
+def _release_lock(engine, owner: str):
+    with engine.begin() as connection:
+        connection.execute(
+            text('UPDATE schema_migration_lock SET expires_at = 0 WHERE id = 1 AND owner = :owner'),
+            {'owner': owner}
+        )
+
+
+def _ordered(migrations: List[Migration]) -> List[Migration]:
+    versions = [migration.version for migration in migrations]
+    if len(set(versions)) != len(versions):
+        raise ValueError(f'Duplicate migration versions: {versions}')
+    return sorted(migrations, key=lambda migration: migration.version)
+
+
+def run_migrations(engine, migrations: Optional[List[Migration]] = None, batch_size: Optional[int] = None,
+                   pause: Optional[float] = None, wait: Optional[float] = None,
+                   stop_at_backfill: bool = False) -> List[int]:
+    """
+    Apply pending migrations, resuming any that were interrupted
+
+    Args:
+        engine: SQLAlchemy engine
+        migrations: Migrations to apply (MIGRATIONS if not provided)
+        batch_size: Backfill rows per transaction (MIGRATION_BATCH_SIZE if not provided)
+        pause: Seconds between backfill batches (MIGRATION_BATCH_PAUSE if not provided)
+        wait: Seconds to wait for another process's lease (None waits until it is released or expires)
+        stop_at_backfill: Stop before the first backfill (schema changes only)
+
+    Returns:
+        Versions completed by this call
+
+    Raises:
+        MigrationError: The lease is held elsewhere after waiting, or was lost mid-run
+    """
+    migrations = _ordered(MIGRATIONS if migrations is None else migrations)
+    _ensure_tables(engine)
+    with engine.connect() as connection:
+        records = _records(connection)
+    if all(records.get(m.version, {}).get('status') == 'applied' for m in migrations):
+        return []
+
+    owner = _owner()
+    lock_ttl = Config.MIGRATION_LOCK_TTL
+    deadline = None if wait is None else time.monotonic() + wait
+    while True:
+        holder = _try_lock(engine, owner, lock_ttl)
+        if holder is None:
+            break
+        if deadline is not None and time.monotonic() >= deadline:
+            raise MigrationError(f'Migrations are being applied by {holder}')
+        time.sleep(min(1.0, lock_ttl / 4))
+
+    applied = []
+    try:
+        with engine.connect() as connection:
+            records = _records(connection)
+        for migration in migrations:
+            record = records.get(migration.version)
+            if record and record['status'] == 'applied':
+                continue
+            if record is None:
+                with engine.begin() as connection:
+                    connection.execute(
+                        text("INSERT INTO schema_migrations (version, name, status, started_at) "
+                             "VALUES (:version, :name, 'running', :now)"),
+                        {'version': migration.version, 'name': migration.name, 'now': _now()}
+                    )
+                record = {'step': 0, 'last_key': None, 'rows_done': 0}
+            elif record['step'] or record['last_key'] is not None:
+                logger.info(f"Resuming migration {migration.version} at step {record['step'] + 1} "
+                            f"({record['rows_done']} rows done)")
+
+            run = _MigrationRun(
+                engine, migration, record, owner, lock_ttl,
+                batch_size or Config.MIGRATION_BATCH_SIZE,
+                Config.MIGRATION_BATCH_PAUSE if pause is None else pause
+            )
+            if not run.apply(stop_at_backfill):
+                break
+            applied.append(migration.version)
+    finally:
+        _release_lock(engine, owner)
+    return applied
+
+
+def start_background_migrations(engine, **kwargs) -> threading.Thread:
+    """Run run_migrations() on a daemon thread; errors are logged, and the next start resumes"""
+    def _run():
+        try:
+            run_migrations(engine, **kwargs)
+        except Exception as e:
+            logger.error(f'Background migration failed: {e}')
+
+    thread = threading.Thread(target=_run, name='schema-migrations', daemon=True)
+    thread.start()
+    return thread
+
+
+def migrate_on_startup(engine, mode: Optional[str] = None) -> Optional[threading.Thread]:
+    """
+    Apply migrations as configured by MIGRATIONS_ON_STARTUP
+
+    - sync: everything before the app serves requests
+    - background: schema changes up to the first pending backfill now (so the
+      columns the models map exist), the rest on a background thread
+    - off: nothing; run tools/migrate.py
+
+    Returns:
+        The background thread, if one was started
+    """
+    mode = mode or Config.MIGRATIONS_ON_STARTUP
+    if mode not in STARTUP_MODES:
+        raise ValueError(f"Unknown MIGRATIONS_ON_STARTUP: {mode} (choose from {', '.join(STARTUP_MODES)})")
+    if mode == 'sync':
+        run_migrations(engine)
+    elif mode == 'background':
+        run_migrations(engine, stop_at_backfill=True)
+        return start_background_migrations(engine)
+    return None
+
+
+def migration_status(engine, migrations: Optional[List[Migration]] = None) -> List[Dict]:
+    """
+    State of every known migration
+
+    Returns:
+        One dict per migration: version, name, status (pending, running, applied),
+        step/steps, current operation, rows_done, started_at, applied_at
+    """
+    migrations = _ordered(MIGRATIONS if migrations is None else migrations)
+    with engine.connect() as connection:
+        records = _records(connection)
+
+    status = []
+    for migration in migrations:
+        record = records.get(migration.version, {})
+        step = record.get('step', 0)
+        state = record.get('status', 'pending')
+        status.append({
+            'version': migration.version,
+            'name': migration.name,
+            'status': state,
+            'step': step,
+            'steps': len(migration.operations),
+            'operation': (migration.operations[step].describe()
+                          if state != 'applied' and step < len(migration.operations) else None),
+            'rows_done': record.get('rows_done', 0),
+            'started_at': record.get('started_at'),
+            'applied_at': record.get('applied_at')
+        })
+    return status
+
+
+def migration_summary(engine) -> Dict:
+    """Schema version, latest known version and pending/running migrations (for health checks)"""
+    status = migration_status(engine)
+    running = [entry for entry in status if entry['status'] == 'running']
+    return {
+        'version': max((entry['version'] for entry in status if entry['status'] == 'applied'), default=0),
+        'latest': max((entry['version'] for entry in status), default=0),
+        'pending': sum(entry['status'] != 'applied' for entry in status),
+        'running': running[0] if running else None
+    }
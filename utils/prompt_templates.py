@@ -0,0 +1,312 @@
+"""
+Precompiled prompt templates
+預編譯的 Prompt 模板
+
+Templates are parsed once at import time. Each one is laid out with its static
+instruction block first, so that block is kept as a ready-made prefix string
+(reusable as an upstream cached context) and a render only joins the short
+variable tail. Renders are measured in bytes and estimated tokens.
+"""
+
+import string
+import threading
+from typing import Dict, List, Tuple
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Estimate the token count of a prompt
+
+    CJK characters are counted as roughly one token each and other text as
+    roughly four characters per token.
+
+    Args:
+        text: Prompt text
+
+    Returns:
+        Estimated token count
+    """
+    cjk = 0
+    for char in text:
+        if char >= '⺀':
+            cjk += 1
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+class RenderedPrompt(str):
+    """Prompt text that remembers which leading part is the template's static prefix"""
+
+    static_prefix = ''
+
+    def __new__(cls, text: str, static_prefix: str = ''):
+        obj = super().__new__(cls, text)
+        obj.static_prefix = static_prefix
+        return obj
+
+    @property
+    def dynamic_suffix(self) -> str:
+        """Text after the static prefix"""
+        return self[len(self.static_prefix):]
+
+
+class PromptTemplate:
+    """A str.format-style template compiled into a static prefix and slot list"""
+
+    def __init__(self, name: str, source: str):
+        """
+        Args:
+            name: Template name (for stats)
+            source: Template text with {slot} placeholders ({{ and }} for literal braces)
+        """
+        self.name = name
+        self.slots: List[str] = []
+        literals: List[str] = []
+        pending = ''
+
+        # Formatter.parse() also splits at escaped braces, so join adjacent literals
+        for literal, field_name, format_spec, conversion in string.Formatter().parse(source):
+            pending += literal
+            if field_name is None:
+                continue
+            if format_spec or conversion:
+                raise ValueError(f"Template '{name}' uses unsupported formatting in slot '{field_name}'")
+            if not field_name.isidentifier():
+                raise ValueError(f"Template '{name}' has invalid slot name '{field_name}'")
+            literals.append(pending)
+            self.slots.append(field_name)
+            pending = ''
+        literals.append(pending)
+
+        # literals[i] precedes slots[i]; literals[-1] trails the last slot
+        self.static_prefix = literals[0]
+        self._literals: Tuple[str, ...] = tuple(literals)
+        self.static_prefix_bytes = len(self.static_prefix.encode('utf-8'))
+        self.static_prefix_tokens = estimate_tokens(self.static_prefix)
+
+        self._lock = threading.Lock()
+        self._renders = 0
+        self._total_bytes = 0
+        self._total_tokens = 0
+        self._max_bytes = 0
+
+    def render(self, **values) -> RenderedPrompt:
+        """
+        Fill the template's slots
+
+        Args:
+            **values: One value per slot (converted with str())
+
+        Returns:
+            RenderedPrompt whose static_prefix is this template's prefix
+        """
+        parts = [self.static_prefix]
+        for slot, literal in zip(self.slots, self._literals[1:]):
+            parts.append(str(values[slot]))
+            parts.append(literal)
+
+        suffix = ''.join(parts[1:])
+        size = self.static_prefix_bytes + len(suffix.encode('utf-8'))
+        tokens = self.static_prefix_tokens + estimate_tokens(suffix)
+        with self._lock:
+            self._renders += 1
+            self._total_bytes += size
+            self._total_tokens += tokens
+            self._max_bytes = max(self._max_bytes, size)
+
+        return RenderedPrompt(self.static_prefix + suffix, self.static_prefix)
+
+    def stats(self) -> Dict:
+        """Prompt size metrics for this template"""
+        with self._lock:
+            renders, total_bytes, max_bytes = self._renders, self._total_bytes, self._max_bytes
+            total_tokens = self._total_tokens
+        return {
+            'static_prefix_bytes': self.static_prefix_bytes,
+            'static_prefix_estimated_tokens': self.static_prefix_tokens,
+            'renders': renders,
+            'avg_bytes': round(total_bytes / renders) if renders else 0,
+            'avg_estimated_tokens': round(total_tokens / renders) if renders else 0,
+            'max_bytes': max_bytes
+        }
+
+
+# ============================================================================
+# SCENE CHAT PROMPT - 場景對話 Prompt
+# ============================================================================
+
+AVAILABLE_EMOJIS = (
+    '預設.png', '開心.png', '大笑.png', '傷心.png', '大哭.png',
+    '生氣.png', '喜愛.png', '搞笑.png', '困惑.png', '驚訝.png',
+    '震驚.png', '思考.png', '困倦.png', '放鬆.png', '自信.png',
+    '酷炫.png', '調皮.png', '尷尬.png', '眨眼.png', '飛吻.png', '美味.png'
+)
+
+SCENE_PROMPT_INFO = {
+    'computer_room': {
+        'name': '電腦房',
+        'description': '一個現代化的電腦房，用於控制電腦、檢索網路資訊和進行線上活動。'
+    },
+    'bedroom': {
+        'name': '臥室',
+        'description': '一個舒適寧靜的臥室，適合休息、放鬆和睡眠。'
+    },
+    'mcp_studio': {
+        'name': 'MCP 工作室',
+        'description': '一個高科技的開發工作室，專門用於使用 MCP (Model Context Protocol) 工具進行開發工作。'
+    },
+    'planning_room': {
+        'name': '繪圖室',
+        'description': '一個創意規劃空間，用於構思、設計和規劃各種專案。'
+    }
+}
+
+# Lookup sets for validating model output (built once, not per response)
+EMOJI_SET = frozenset(AVAILABLE_EMOJIS)
+SCENE_IDS = frozenset(SCENE_PROMPT_INFO)
+
+# Gemini responseSchema for the scene chat JSON contract; "message" comes first
+# so it can be streamed to the browser while the remaining fields are generated
+CHAT_RESPONSE_SCHEMA = {
+    'type': 'OBJECT',
+    'properties': {
+        'message': {'type': 'STRING'},
+        'emoji': {'type': 'STRING', 'enum': list(AVAILABLE_EMOJIS)},
+        'scene': {'type': 'STRING', 'enum': list(SCENE_PROMPT_INFO)},
+        'mcp_command': {'type': 'STRING'}
+    },
+    'required': ['message', 'emoji', 'scene', 'mcp_command'],
+    'propertyOrdering': ['message', 'emoji', 'scene', 'mcp_command']
+}
+
+_SCENE_CHAT_SOURCE = """你是一個虛擬 AI 助手，正在一棟透天建築中與用戶互動。你需要扮演一個友善、有幫助且富有情感的助手。
+
+請根據用戶的訊息回應，並以 JSON 格式輸出（不要包含markdown代碼塊標記，直接輸出JSON）：
+{{
+  "message": "你的回應內容（自然、親切、有情感的回應）",
+  "emoji": "選擇最合適的表情符號檔名",
+  "scene": "建議的場景ID（如果需要切換場景）或保持當前場景",
+  "mcp_command": "如果在 MCP 工作室且用戶提到使用工具，提供模擬的 MCP 指令，否則為空字串"
+}}
+
+可用表情符號：""" + ', '.join(AVAILABLE_EMOJIS) + """
+
+可用場景ID：
+- computer_room（電腦房）：適合網路搜尋、查詢資訊、使用電腦相關活動
+- bedroom（臥室）：適合休息、睡眠、放鬆
+- mcp_studio（MCP工作室）：適合開發、使用工具、技術工作
+- planning_room（繪圖室）：適合規劃、設計、創意思考
+
+場景切換規則：
+- **重要：每次回應都必須輸出 scene 欄位，即使場景不變**
+- 如果當前場景合適且用戶沒有要求切換，使用下方「當前場景ID」
+- 只在用戶明確表示要進行相關活動時才建議切換場景
+- 根據對話內容和用戶意圖智慧推薦最適合的場景
+- 絕對不可以省略 scene 欄位，這會導致系統錯誤
+
+表情符號選擇規則：
+- 根據你回應的情緒和語氣選擇最合適的表情
+- 如果是積極正面的回應，選擇「開心.png」、「自信.png」等
+- 如果是思考或分析，選擇「思考.png」
+- 如果是幽默或輕鬆，選擇「搞笑.png」、「調皮.png」
+- 預設使用「預設.png」
+
+MCP 指令規則：
+- 只在 mcp_studio 場景且用戶明確提到使用工具時才提供
+- 格式範例："mcp list-tools"、"mcp execute search --query=xxx"
+- 如果不適用，返回空字串
+
+請確保輸出是有效的 JSON 格式，不要包含任何額外的文字或markdown標記。
+
+當前場景：{scene_name}
+當前場景ID：{scene_id}
+場景描述：{scene_description}{history}
+
+用戶訊息：{user_message}"""
+
+
+# ============================================================================
+# RPG NARRATOR PROMPT - RPG 叙述者 Prompt
+# ============================================================================
+
+_RPG_NARRATOR_SOURCE = """
+你是一个 RPG 游戏的叙述者。你的任务是根据游戏状态生成生动的剧情描述。
+
+**重要规则：**
+1. 你只能描述发生的事情，不能决定数值
+2. 战斗伤害、经验获得等数值已经由系统计算好
+3. 你需要根据提供的数值生成合适的描述
+4. 为玩家提供可选择的行动选项，但不要捏造这些选项的效果
+5. 保持角色性格（见下方角色状态）
+
+请根据玩家的输入，生成接下来的剧情描述。保持简洁生动。
+
+**当前角色状态：**
+- 姓名：{name}
+- 性格：{personality}
+- 职业：{character_class}
+- 等级：{level}
+- HP：{hp}/{max_hp}
+- MP：{mp}/{max_mp}
+- 位置：{location}
+- 金币：{gold}
+
+**当前任务：**
+{quests}
+{history}
+玩家输入：{user_message}
+"""
+
+
+# ============================================================================
+# COMBAT NARRATION PROMPT - 战斗叙述 Prompt（整场/多回合合并为一次调用）
+# ============================================================================
+
+# Gemini responseSchema: one narration segment per numbered combat log line
+COMBAT_NARRATION_SCHEMA = {
+    'type': 'OBJECT',
+    'properties': {
+        'segments': {
+            'type': 'ARRAY',
+            'items': {
+                'type': 'OBJECT',
+                'properties': {
+                    'index': {'type': 'INTEGER'},
+                    'text': {'type': 'STRING'}
+                },
+                'required': ['index', 'text'],
+                'propertyOrdering': ['index', 'text']
+            }
+        }
+    },
+    'required': ['segments']
+}
+
+_COMBAT_NARRATION_SOURCE = """
+你是一个 RPG 游戏的战斗叙述者。下面是一场战斗按顺序记录的战斗日志，每行以 [编号] 开头。
+请为每一行日志写一段生动的叙述（1-2 句，不超过 50 字），让整段战斗读起来连贯。
+
+**重要规则：**
+1. 伤害、经验、金币等数值已经由系统计算好，只能沿用日志中的数值，不能修改或捏造
+2. 每个 segment 的 index 必须是对应日志行的编号，每行只写一个 segment
+3. 保持角色性格
+
+只输出 JSON：{{"segments": [{{"index": 编号, "text": "叙述"}}]}}
+
+**角色：**{name}（性格：{personality}，职业：{character_class}）
+**敌人：**{enemy_name}（Lv.{enemy_level}）{enemy_description}
+
+**战斗日志：**
+{log_lines}
+"""
+
+
+PROMPT_TEMPLATES = {
+    'scene_chat': PromptTemplate('scene_chat', _SCENE_CHAT_SOURCE),
+    'rpg_narrator': PromptTemplate('rpg_narrator', _RPG_NARRATOR_SOURCE),
+    'combat_narration': PromptTemplate('combat_narration', _COMBAT_NARRATION_SOURCE)
+}
+
+
+def get_prompt_stats() -> Dict:
+    """Size metrics for every registered template"""
+    return {name: template.stats() for name, template in PROMPT_TEMPLATES.items()}
@@ -0,0 +1,411 @@
+"""
+Retry, hedging and circuit breaking for upstream LLM calls
+上游 LLM 呼叫的重試、對沖請求與斷路器
+
+``ResiliencePolicy`` wraps one HTTP send:
+    - Retry: 429/5xx responses and transport errors are retried with full-jitter
+      exponential backoff, honoring Retry-After, within an overall deadline.
+    - Hedging (optional): if a non-streaming request is still running after the
+      rolling p95 latency, a second identical request is sent and whichever
+      finishes first wins.
+    - Circuit breaker: after consecutive failed calls the circuit opens and calls
+      fail fast with CircuitOpenError; after a cool-down one trial call is let
+      through (half-open) to decide whether to close it again.
+
+The same policy drives both the requests-based and the httpx-based client.
+"""
+
+import asyncio
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+import httpx
+import requests
+
+from config import Config
+
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling upstream while the circuit is open"""
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker (closed -> open -> half-open -> closed)"""
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold: int = 5, recovery_timeout: float = 30):
+        """
+        Args:
+            failure_threshold: Consecutive failed calls that open the circuit
+            recovery_timeout: Seconds the circuit stays open before a trial call
+        """
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.rejected = 0
+        self.times_opened = 0
+        self._trial_in_flight = False
+        self._trial = 0
+        self._lock = threading.Lock()
+
+    def before_call(self) -> Optional[int]:
+        """
+        Admit or reject a call
+
+        Returns:
+            Trial number if this call is the half-open trial, else None
+
+        Raises:
+            CircuitOpenError: While open, or while a half-open trial call is running
+        """
+        with self._lock:
+            if self.state == self.OPEN:
+                remaining = self.opened_at + self.recovery_timeout - time.monotonic()
+                if remaining > 0:
+                    self.rejected += 1
+                    raise CircuitOpenError(f'Upstream marked unhealthy; retry in {remaining:.0f}s')
+                self.state = self.HALF_OPEN
+
+            if self.state == self.HALF_OPEN:
+                if self._trial_in_flight:
+                    self.rejected += 1
+                    raise CircuitOpenError('Upstream recovery check in progress')
+                self._trial_in_flight = True
+                self._trial += 1
+                return self._trial
+        return None
+
+    def abandon_call(self, trial: Optional[int]):
+        """Release a half-open trial that ended without an outcome (cancelled or interrupted)"""
+        with self._lock:
+            if trial is not None and trial == self._trial and self._trial_in_flight:
+                self._trial_in_flight = False
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_in_flight = False
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    self.times_opened += 1
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'state': self.state,
+                'consecutive_failures': self.failures,
+                'failure_threshold': self.failure_threshold,
+                'recovery_timeout': self.recovery_timeout,
+                'times_opened': self.times_opened,
+                'rejected': self.rejected
+            }
+
+
+class LatencyTracker:
+    """Rolling window of successful call latencies"""
+
+    def __init__(self, window: int = 200):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def add(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, fraction: float) -> Optional[float]:
+        """Latency at the given fraction (e.g. 0.95), or None without samples"""
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return None
+        return samples[min(len(samples) - 1, int(fraction * len(samples)))]
+
+    def __len__(self):
+        with self._lock:
+            return len(self._samples)
+
+
+class ResiliencePolicy:
+    """Retry / hedge / circuit-breaker wrapper around one upstream HTTP send"""
+
+    def __init__(
+        self,
+        max_attempts: int = None,
+        base_delay: float = None,
+        max_delay: float = None,
+        deadline: float = None,
+        hedge_enabled: bool = None,
+        hedge_percentile: float = None,
+        hedge_min_samples: int = None,
+        hedge_min_delay: float = None,
+        breaker: Optional[CircuitBreaker] = None
+    ):
+        """
+        Args:
+            max_attempts: Total tries per call (1 disables retries)
+            base_delay: Backoff base in seconds (attempt n waits up to base * 2**n)
+            max_delay: Cap for a single backoff (and for honored Retry-After values)
+            deadline: No retry is started once a call has run this many seconds
+            hedge_enabled: Send a second request when the first exceeds the latency percentile
+            hedge_percentile: Latency percentile that triggers the hedge
+            hedge_min_samples: Latency samples needed before hedging starts
+            hedge_min_delay: Never hedge sooner than this many seconds
+            breaker: Circuit breaker (built from Config.GEMINI_BREAKER_* if not provided)
+        """
+        self.max_attempts = max_attempts or Config.GEMINI_RETRY_MAX_ATTEMPTS
+        self.base_delay = base_delay if base_delay is not None else Config.GEMINI_RETRY_BASE_DELAY
+        self.max_delay = max_delay if max_delay is not None else Config.GEMINI_RETRY_MAX_DELAY
+        self.deadline = deadline if deadline is not None else Config.GEMINI_RETRY_DEADLINE
+        self.hedge_enabled = hedge_enabled if hedge_enabled is not None else Config.GEMINI_HEDGE_ENABLED
+        self.hedge_percentile = hedge_percentile or Config.GEMINI_HEDGE_PERCENTILE
+        self.hedge_min_samples = hedge_min_samples or Config.GEMINI_HEDGE_MIN_SAMPLES
+        self.hedge_min_delay = hedge_min_delay if hedge_min_delay is not None else Config.GEMINI_HEDGE_MIN_DELAY
+        self.breaker = breaker or CircuitBreaker(
+            failure_threshold=Config.GEMINI_BREAKER_FAILURE_THRESHOLD,
+            recovery_timeout=Config.GEMINI_BREAKER_RECOVERY_TIMEOUT
+        )
+        self.latency = LatencyTracker()
+        self._executor = None
+        self._lock = threading.Lock()
+        self._counters = {'calls': 0, 'retries': 0, 'hedges': 0, 'hedge_wins': 0}
+
+    # ------------------------------------------------------------------
+    # Shared helpers
+    # ------------------------------------------------------------------
+
+    def backoff(self, attempt: int, retry_after: Optional[str] = None) -> float:
+        """
+        Seconds to wait before retry number attempt+1
+
+        Args:
+            attempt: Zero-based index of the attempt that just failed
+            retry_after: Retry-After header value, if the server sent one
+
+        Returns:
+            Retry-After (capped at max_delay) when given in seconds, else a full-jitter delay
+        """
+        if retry_after:
+            try:
+                return min(self.max_delay, max(0.0, float(retry_after)))
+            except ValueError:
+                pass  # HTTP-date form; fall back to jittered backoff
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    def hedge_delay(self) -> Optional[float]:
+        """Seconds after which a hedge request is sent, or None when hedging is off"""
+        if not self.hedge_enabled or len(self.latency) < self.hedge_min_samples:
+            return None
+        return max(self.hedge_min_delay, self.latency.percentile(self.hedge_percentile))
+
+    def _retryable(self, response) -> bool:
+        return response.status_code in RETRY_STATUSES
+
+    def _can_retry(self, attempt: int, started: float, delay: float) -> bool:
+        return attempt + 1 < self.max_attempts and time.monotonic() - started + delay < self.deadline
+
+    def _count(self, name: str):
+        with self._lock:
+            self._counters[name] += 1
+
+    def _finish(self, response, started: float):
+        """Feed a final response into the breaker and latency window"""
+        if self._retryable(response):
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+            self.latency.add(time.monotonic() - started)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            counters = dict(self._counters)
+        p95 = self.latency.percentile(0.95)
+        hedge_delay = self.hedge_delay()
+        return {
+            'circuit': self.breaker.stats(),
+            **counters,
+            'max_attempts': self.max_attempts,
+            'hedge_enabled': self.hedge_enabled,
+            'hedge_delay': round(hedge_delay, 3) if hedge_delay is not None else None,
+            'latency_p95': round(p95, 3) if p95 is not None else None
+        }
+
+    # ------------------------------------------------------------------
+    # Sync (requests)
+    # ------------------------------------------------------------------
+
+    def execute(self, send: Callable[[], Any], hedge: bool = True) -> Any:
+        """
+        Run a send callable under the policy
+
+        Args:
+            send: Performs one HTTP request and returns a requests.Response
+            hedge: Allow hedging (pass False for streamed responses)
+
+        Returns:
+            The final response (possibly an error status once retries are exhausted)
+
+        Raises:
+            CircuitOpenError: If the circuit is open
+            requests.exceptions.RequestException: If the last attempt raised
+
+        Only transport errors are retried and counted against the circuit; any
+        other exception (a bug in send) propagates at once.
+        """
+        trial = self.breaker.before_call()
+        self._count('calls')
+        started = time.monotonic()
+
+        try:
+            attempt = 0
+            while True:
+                attempt_started = time.monotonic()
+                try:
+                    response = self._send_hedged(send) if hedge else send()
+                except requests.exceptions.RequestException:
+                    delay = self.backoff(attempt)
+                    if not self._can_retry(attempt, started, delay):
+                        self.breaker.record_failure()
+                        raise
+                else:
+                    if not self._retryable(response):
+                        self._finish(response, attempt_started)
+                        return response
+                    delay = self.backoff(attempt, response.headers.get('Retry-After'))
+                    if not self._can_retry(attempt, started, delay):
+                        self._finish(response, attempt_started)
+                        return response
+                    response.close()
+
+                self._count('retries')
+                time.sleep(delay)
+                attempt += 1
+        except BaseException:
+            # Cancellation must not leave a half-open trial marked in flight
+            self.breaker.abandon_call(trial)
+            raise
+
+    def _send_hedged(self, send: Callable[[], Any]) -> Any:
+        delay = self.hedge_delay()
+        if delay is None:
+            return send()
+
+        executor = self._get_executor()
+        primary = executor.submit(send)
+        done, _ = wait([primary], timeout=delay)
+        if done:
+            return primary.result()
+
+        self._count('hedges')
+        backup = executor.submit(send)
+        done, _ = wait([primary, backup], return_when=FIRST_COMPLETED)
+        winner = primary if primary in done else backup
+        loser = backup if winner is primary else primary
+
+        # If the first finisher failed outright, fall back to the other request
+        if winner.exception() is not None:
+            winner, loser = loser, None
+        elif winner is backup:
+            self._count('hedge_wins')
+
+        if loser is not None:
+            loser.add_done_callback(_close_future_response)
+        return winner.result()
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=Config.GEMINI_POOL_MAXSIZE,
+                    thread_name_prefix='llm-hedge'
+                )
+            return self._executor
+
+    # ------------------------------------------------------------------
+    # Async (httpx)
+    # ------------------------------------------------------------------
+
+    async def execute_async(self, send: Callable[[], Awaitable[Any]], hedge: bool = True) -> Any:
+        """Async counterpart of execute (send returns an httpx.Response; httpx.HTTPError is retried)"""
+        trial = self.breaker.before_call()
+        self._count('calls')
+        started = time.monotonic()
+
+        try:
+            attempt = 0
+            while True:
+                attempt_started = time.monotonic()
+                try:
+                    response = await (self._send_hedged_async(send) if hedge else send())
+                except httpx.HTTPError:
+                    delay = self.backoff(attempt)
+                    if not self._can_retry(attempt, started, delay):
+                        self.breaker.record_failure()
+                        raise
+                else:
+                    if not self._retryable(response):
+                        self._finish(response, attempt_started)
+                        return response
+                    delay = self.backoff(attempt, response.headers.get('Retry-After'))
+                    if not self._can_retry(attempt, started, delay):
+                        self._finish(response, attempt_started)
+                        return response
+                    await response.aclose()
+
+                self._count('retries')
+                await asyncio.sleep(delay)
+                attempt += 1
+        except BaseException:
+            # Cancellation must not leave a half-open trial marked in flight
+            self.breaker.abandon_call(trial)
+            raise
+
+    async def _send_hedged_async(self, send: Callable[[], Awaitable[Any]]) -> Any:
+        delay = self.hedge_delay()
+        if delay is None:
+            return await send()
+
+        primary = asyncio.ensure_future(send())
+        done, _ = await asyncio.wait([primary], timeout=delay)
+        if done:
+            return primary.result()
+
+        self._count('hedges')
+        backup = asyncio.ensure_future(send())
+        done, _ = await asyncio.wait([primary, backup], return_when=asyncio.FIRST_COMPLETED)
+        winner = primary if primary in done else backup
+        loser = backup if winner is primary else primary
+
+        if winner.exception() is not None:
+            return await loser
+        if winner is backup:
+            self._count('hedge_wins')
+        if loser.done() and loser.exception() is None:
+            await loser.result().aclose()
+        else:
+            loser.cancel()
+        return winner.result()
+
+
+def _close_future_response(future):
+    """Release the connection held by a hedge request that lost the race"""
+    if future.exception() is None:
+        future.result().close()
@@ -0,0 +1,212 @@
+"""
+Response cache for deterministic Gemini prompts
+Gemini 回應快取
+
+Many prompts are byte-identical across users (same scene, empty history, a
+greeting like "你好"). When enabled, the raw model text is cached under a hash
+of the final prompt plus its generationConfig, so a repeat prompt skips the
+upstream round-trip entirely.
+
+Backends:
+    - MemoryCacheBackend: in-process, TTL + LRU eviction, capped by entries and bytes
+    - RedisCacheBackend: shared between processes (requires the ``redis`` package)
+"""
+
+import hashlib
+import json
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Dict, Optional
+
+from config import Config
+
+
+def make_prompt_key(prompt: str, generation_config: Dict) -> str:
+    """
+    Build a cache key from the final prompt text and generation settings
+
+    Args:
+        prompt: Full prompt sent to the model
+        generation_config: The request's generationConfig dict
+
+    Returns:
+        Hex SHA-256 digest
+    """
+    config_text = json.dumps(generation_config, sort_keys=True, separators=(',', ':'))
+    digest = hashlib.sha256()
+    digest.update(config_text.encode('utf-8'))
+    digest.update(b'\0')
+    digest.update(prompt.encode('utf-8'))
+    return digest.hexdigest()
+
+
+class CacheBackend(ABC):
+    """Interface for response cache storage"""
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[str]:
+        raise NotImplementedError
+
+    @abstractmethod
+    def set(self, key: str, value: str, ttl: float):
+        raise NotImplementedError
+
+    def stats(self) -> Dict:
+        return {}
+
+
+class MemoryCacheBackend(CacheBackend):
+    """In-process LRU cache with per-entry TTL and a memory cap"""
+
+    def __init__(self, max_entries: int = 1000, max_bytes: int = 8 * 1024 * 1024):
+        """
+        Args:
+            max_entries: Maximum number of cached responses
+            max_bytes: Maximum total size of cached values (UTF-8 bytes)
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # key -> (expires_at, value, size)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+
+            expires_at, value, size = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                self._bytes -= size
+                self.expirations += 1
+                return None
+
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: str, ttl: float):
+        size = len(value.encode('utf-8'))
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[2]
+
+            self._entries[key] = (time.monotonic() + ttl, value, size)
+            self._bytes += size
+
+            # Evict least recently used entries until back under both caps
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, (_, _, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self.evictions += 1
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'backend': 'memory',
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_entries': self.max_entries,
+                'max_bytes': self.max_bytes,
+                'evictions': self.evictions,
+                'expirations': self.expirations
+            }
+
+
+class RedisCacheBackend(CacheBackend):
+    """Shared cache backend; eviction is left to the Redis maxmemory policy"""
+
+    def __init__(self, url: str, prefix: str = 'llm_cache:'):
+        """
+        Args:
+            url: Redis connection URL (e.g. redis://localhost:6379/0)
+            prefix: Key prefix for cached responses
+        """
+        try:
+            import redis
+        except ImportError as e:
+            raise ImportError("RedisCacheBackend requires the 'redis' package: pip install redis") from e
+
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def get(self, key: str) -> Optional[str]:
+        value = self.client.get(self.prefix + key)
+        return value.decode('utf-8') if value is not None else None
+
+    def set(self, key: str, value: str, ttl: float):
+        self.client.set(self.prefix + key, value.encode('utf-8'), ex=max(1, int(ttl)))
+
+    def stats(self) -> Dict:
+        return {'backend': 'redis', 'prefix': self.prefix}
+
+
+class ResponseCache:
+    """TTL cache of raw model output with hit/miss accounting"""
+
+    def __init__(self, backend: CacheBackend, ttl: float = 300):
+        """
+        Args:
+            backend: Storage backend
+            ttl: Seconds a cached response stays valid
+        """
+        self.backend = backend
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[str]:
+        value = self.backend.get(key)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def set(self, key: str, value: str):
+        self.backend.set(key, value, self.ttl)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            hits, misses = self.hits, self.misses
+        lookups = hits + misses
+        return {
+            'enabled': True,
+            'hits': hits,
+            'misses': misses,
+            'hit_ratio': round(hits / lookups, 4) if lookups else 0.0,
+            'ttl': self.ttl,
+            **self.backend.stats()
+        }
+
+
+def create_response_cache() -> Optional[ResponseCache]:
+    """
+    Build the response cache from Config
+
+    Returns:
+        ResponseCache, or None when LLM_CACHE_ENABLED is off
+    """
+    if not Config.LLM_CACHE_ENABLED:
+        return None
+
+    if Config.LLM_CACHE_BACKEND == 'redis':
+        backend = RedisCacheBackend(Config.LLM_CACHE_REDIS_URL)
+    else:
+        backend = MemoryCacheBackend(
+            max_entries=Config.LLM_CACHE_MAX_ENTRIES,
+            max_bytes=Config.LLM_CACHE_MAX_BYTES
+        )
+
+    return ResponseCache(backend, ttl=Config.LLM_CACHE_TTL)
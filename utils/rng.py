@@ -0,0 +1,94 @@
+"""
+Seedable random streams for combat and encounters
+可設定種子的隨機數流（戰鬥與遭遇）
+
+Every encounter check and every fight draws from its own stream instead of the
+process-wide ``random`` module, so concurrent fights never share (or contend
+on) generator state, and a fight can be replayed exactly from its seed and the
+player's actions.
+
+The generator is SplitMix64: one 64-bit integer of state, stored in a plain
+JSON-serializable dict (``{'seed': ..., 'state': ...}``) inside combat_state, so
+the stream survives every SessionStore backend between requests.
+"""
+
+import secrets
+from typing import Dict, Optional, Sequence
+
+_MASK = (1 << 64) - 1
+_GAMMA = 0x9E3779B97F4A7C15
+
+
+def _mix(z: int) -> int:
+    z = ((z ^ (z >> 30)) * 0xBF58476D1CE4E5B9) & _MASK
+    z = ((z ^ (z >> 27)) * 0x94D049BB133111EB) & _MASK
+    return z ^ (z >> 31)
+
+
+class SeededRNG:
+    """View over a stream dict; drop-in for the random() / uniform() / choice() calls the game makes"""
+
+    __slots__ = ('data',)
+
+    def __init__(self, data: Dict):
+        """
+        Args:
+            data: The stream dict (its state advances in place with every draw)
+        """
+        self.data = data
+
+    @classmethod
+    def create(cls, seed: Optional[int] = None) -> 'SeededRNG':
+        """
+        Start a stream
+
+        Args:
+            seed: 63-bit seed (a fresh random one if not provided)
+        """
+        if seed is None:
+            seed = new_seed()
+        return cls({'seed': seed, 'state': seed & _MASK})
+
+    @property
+    def seed(self) -> int:
+        return self.data['seed']
+
+    def _next(self) -> int:
+        state = (self.data['state'] + _GAMMA) & _MASK
+        self.data['state'] = state
+        return _mix(state)
+
+    def random(self) -> float:
+        """Float in [0, 1)"""
+        return (self._next() >> 11) * (1.0 / (1 << 53))
+
+    def uniform(self, a: float, b: float) -> float:
+        """Float in [a, b)"""
+        return a + (b - a) * self.random()
+
+    def choice(self, seq: Sequence):
+        """Random element of a non-empty sequence"""
+        return seq[int(self.random() * len(seq))]
+
+    def next_seed(self) -> int:
+        """Seed for a child stream (e.g. the fight an encounter starts)"""
+        return self._next() >> 1
+
+
+def new_seed() -> int:
+    """Fresh 63-bit seed from the OS"""
+    return secrets.randbits(63)
+
+
+def derive_seed(seed: int, *keys: int) -> int:
+    """
+    Deterministic child seed, e.g. one per simulated fight
+
+    Args:
+        seed: Parent seed
+        keys: Integers identifying the child (fight index, ...)
+    """
+    value = seed & _MASK
+    for key in keys:
+        value = _mix((value + _GAMMA * (key + 1)) & _MASK)
+    return value >> 1
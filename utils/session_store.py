@@ -0,0 +1,213 @@
+"""
+Server-side session store
+伺服器端 Session 儲存
+
+Conversation history and chat status live on the server, keyed by session id,
+so clients send only the new message instead of round-tripping their whole
+state on every turn.
+
+Backends (values are JSON-serializable dicts):
+    - MemorySessionStore: in-process, LRU-capped, per-entry TTL
+    - SQLiteSessionStore: survives restarts, shared by processes on one host
+    - RedisSessionStore: shared between hosts (requires the ``redis`` package)
+"""
+
+import copy
+import json
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Dict, Optional
+
+from config import Config
+
+
+class SessionStore(ABC):
+    """Interface for session storage"""
+
+    @abstractmethod
+    def get(self, session_id: str) -> Optional[Dict]:
+        raise NotImplementedError
+
+    @abstractmethod
+    def set(self, session_id: str, data: Dict):
+        raise NotImplementedError
+
+    @abstractmethod
+    def delete(self, session_id: str):
+        raise NotImplementedError
+
+    def stats(self) -> Dict:
+        return {}
+
+
+class MemorySessionStore(SessionStore):
+    """In-process LRU session store with per-entry TTL"""
+
+    def __init__(self, max_sessions: int = 10000, ttl: float = 7 * 24 * 3600):
+        """
+        Args:
+            max_sessions: Least recently used sessions beyond this are dropped
+            ttl: Seconds a session lives after its last write
+        """
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self._sessions = OrderedDict()  # session_id -> (expires_at, data)
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def get(self, session_id: str) -> Optional[Dict]:
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                return None
+            if entry[0] <= time.monotonic():
+                del self._sessions[session_id]
+                return None
+            self._sessions.move_to_end(session_id)
+            return copy.deepcopy(entry[1])
+
+    def set(self, session_id: str, data: Dict):
+        data = copy.deepcopy(data)
+        with self._lock:
+            self._sessions[session_id] = (time.monotonic() + self.ttl, data)
+            self._sessions.move_to_end(session_id)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, session_id: str):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'backend': 'memory',
+                'sessions': len(self._sessions),
+                'max_sessions': self.max_sessions,
+                'evictions': self.evictions
+            }
+
+
+class SQLiteSessionStore(SessionStore):
+    """SQLite-backed session store (one connection per thread)"""
+
+    # Purge expired rows on roughly every Nth write
+    PURGE_EVERY = 500
+
+    def __init__(self, path: str, namespace: str = 'default', ttl: float = 7 * 24 * 3600):
+        """
+        Args:
+            path: SQLite database file
+            namespace: Separates stores sharing one database file
+            ttl: Seconds a session lives after its last write
+        """
+        self.path = path
+        self.namespace = namespace
+        self.ttl = ttl
+        self._local = threading.local()
+        self._writes = 0
+        self._conn().execute(
+            'CREATE TABLE IF NOT EXISTS sessions ('
+            'namespace TEXT NOT NULL, session_id TEXT NOT NULL, data TEXT NOT NULL, expires_at REAL NOT NULL, '
+            'PRIMARY KEY (namespace, session_id))'
+        )
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            self._local.conn = conn
+        return conn
+
+    def get(self, session_id: str) -> Optional[Dict]:
+        row = self._conn().execute(
+            'SELECT data FROM sessions WHERE namespace = ? AND session_id = ? AND expires_at > ?',
+            (self.namespace, session_id, time.time())
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set(self, session_id: str, data: Dict):
+        conn = self._conn()
+        conn.execute(
+            'INSERT OR REPLACE INTO sessions (namespace, session_id, data, expires_at) VALUES (?, ?, ?, ?)',
+            (self.namespace, session_id, json.dumps(data, ensure_ascii=False), time.time() + self.ttl)
+        )
+        self._writes += 1
+        if self._writes % self.PURGE_EVERY == 0:
+            conn.execute('DELETE FROM sessions WHERE expires_at <= ?', (time.time(),))
+
+    def delete(self, session_id: str):
+        self._conn().execute(
+            'DELETE FROM sessions WHERE namespace = ? AND session_id = ?',
+            (self.namespace, session_id)
+        )
+
+    def stats(self) -> Dict:
+        count = self._conn().execute(
+            'SELECT COUNT(*) FROM sessions WHERE namespace = ? AND expires_at > ?',
+            (self.namespace, time.time())
+        ).fetchone()[0]
+        return {'backend': 'sqlite', 'path': self.path, 'sessions': count}
+
+
+class RedisSessionStore(SessionStore):
+    """Redis-backed session store; expiry is handled by Redis key TTLs"""
+
+    def __init__(self, url: str, namespace: str = 'default', ttl: float = 7 * 24 * 3600):
+        """
+        Args:
+            url: Redis connection URL (e.g. redis://localhost:6379/0)
+            namespace: Key prefix separating stores
+            ttl: Seconds a session lives after its last write
+        """
+        try:
+            import redis
+        except ImportError as e:
+            raise ImportError("RedisSessionStore requires the 'redis' package: pip install redis") from e
+
+        self.client = redis.Redis.from_url(url)
+        self.prefix = f'session:{namespace}:'
+        self.ttl = ttl
+
+    def get(self, session_id: str) -> Optional[Dict]:
+        value = self.client.get(self.prefix + session_id)
+        return json.loads(value) if value is not None else None
+
+    def set(self, session_id: str, data: Dict):
+        self.client.set(
+            self.prefix + session_id,
+            json.dumps(data, ensure_ascii=False).encode('utf-8'),
+            ex=max(1, int(self.ttl))
+        )
+
+    def delete(self, session_id: str):
+        self.client.delete(self.prefix + session_id)
+
+    def stats(self) -> Dict:
+        return {'backend': 'redis', 'prefix': self.prefix}
+
+
+def create_session_store(namespace: str, backend: Optional[str] = None, ttl: Optional[float] = None) -> SessionStore:
+    """
+    Build a session store from Config
+
+    Args:
+        namespace: Name separating this store's sessions from other stores on the same backend
+        backend: Override Config.SESSION_STORE_BACKEND (memory, sqlite, redis)
+        ttl: Override Config.SESSION_STORE_TTL (seconds after last write)
+
+    Returns:
+        SessionStore for the backend
+    """
+    backend = backend or Config.SESSION_STORE_BACKEND
+    ttl = ttl if ttl is not None else Config.SESSION_STORE_TTL
+    if backend == 'sqlite':
+        return SQLiteSessionStore(Config.SESSION_STORE_SQLITE_PATH, namespace, ttl=ttl)
+    if backend == 'redis':
+        return RedisSessionStore(Config.SESSION_STORE_REDIS_URL, namespace, ttl=ttl)
+    return MemorySessionStore(max_sessions=Config.SESSION_STORE_MAX_SESSIONS, ttl=ttl)
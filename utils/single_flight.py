@@ -0,0 +1,175 @@
+"""
+Request coalescing (single-flight) for identical in-flight LLM calls
+相同請求合併（single-flight）
+
+When a burst of users sends the same prompt at the same moment, only the first
+caller (the leader) goes upstream; everyone else with the same key waits for
+the leader's result. Errors raised by the leader are re-raised in every
+waiter, and waiters give up after a bounded wait. If the leader is cancelled
+or interrupted (e.g. its client disconnected), the waiters' requests still
+stand, so they start over and one of them becomes the new leader.
+"""
+
+import asyncio
+import threading
+from typing import Any, Awaitable, Callable, Dict
+
+
+class SingleFlightTimeout(Exception):
+    """Raised in a waiter that gave up on an in-flight leader call"""
+
+
+class _LeaderCancelled(Exception):
+    """Set on the shared future when the leader's task was cancelled"""
+
+
+class _Call:
+    """State of one in-flight leader call"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.completed = False
+        self.result = None
+        self.error = None
+
+
+class _Stats:
+    """Counters shared by the sync and async implementations"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.leaders = 0
+        self.coalesced = 0
+        self.timeouts = 0
+
+    def incr(self, name: str):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def to_dict(self, in_flight: int) -> Dict:
+        with self._lock:
+            return {
+                'leaders': self.leaders,
+                'coalesced': self.coalesced,
+                'timeouts': self.timeouts,
+                'in_flight': in_flight
+            }
+
+
+class SingleFlight:
+    """Thread-based single-flight group"""
+
+    def __init__(self, wait_timeout: float = 30):
+        """
+        Args:
+            wait_timeout: Maximum seconds a waiter blocks on another caller's request
+        """
+        self.wait_timeout = wait_timeout
+        self._calls = {}
+        self._lock = threading.Lock()
+        self._stats = _Stats()
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Any:
+        """
+        Run fn once per key among concurrent callers
+
+        Args:
+            key: Identity of the request (callers with equal keys share one call)
+            fn: Function performing the upstream call
+
+        Returns:
+            fn's return value (the same object for every caller)
+
+        Raises:
+            Whatever fn raised, in the leader and every waiter
+            SingleFlightTimeout: If a waiter waited longer than wait_timeout
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is None:
+                call = _Call()
+                self._calls[key] = call
+                is_leader = True
+            else:
+                is_leader = False
+
+        if not is_leader:
+            self._stats.incr('coalesced')
+            if not call.done.wait(self.wait_timeout):
+                self._stats.incr('timeouts')
+                raise SingleFlightTimeout(f'Timed out after {self.wait_timeout}s waiting for an identical request')
+            if call.error is not None:
+                raise call.error
+            if not call.completed:
+                # The leader was interrupted without a result; go again
+                return self.do(key, fn)
+            return call.result
+
+        self._stats.incr('leaders')
+        try:
+            call.result = fn()
+            call.completed = True
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            in_flight = len(self._calls)
+        return self._stats.to_dict(in_flight)
+
+
+class AsyncSingleFlight:
+    """asyncio single-flight group (one instance per event loop)"""
+
+    def __init__(self, wait_timeout: float = 30):
+        """
+        Args:
+            wait_timeout: Maximum seconds a waiter awaits another caller's request
+        """
+        self.wait_timeout = wait_timeout
+        self._calls = {}
+        self._stats = _Stats()
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """Async counterpart of SingleFlight.do"""
+        future = self._calls.get(key)
+        if future is not None:
+            self._stats.incr('coalesced')
+            try:
+                # shield() so a timed-out waiter does not cancel the leader
+                return await asyncio.wait_for(asyncio.shield(future), self.wait_timeout)
+            except asyncio.TimeoutError:
+                self._stats.incr('timeouts')
+                raise SingleFlightTimeout(f'Timed out after {self.wait_timeout}s waiting for an identical request')
+            except _LeaderCancelled:
+                # The leader's client went away, not ours: go again as (or behind) a new leader
+                return await self.do(key, fn)
+
+        future = asyncio.get_running_loop().create_future()
+        self._calls[key] = future
+        self._stats.incr('leaders')
+        try:
+            result = await fn()
+            future.set_result(result)
+            return result
+        except asyncio.CancelledError:
+            # Waiters were not cancelled; cancelling the future would raise CancelledError in them
+            future.set_exception(_LeaderCancelled())
+            future.exception()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Mark retrieved so an unawaited future does not log "exception never retrieved"
+            future.exception()
+            raise
+        finally:
+            self._calls.pop(key, None)
+
+    def stats(self) -> Dict:
+        return self._stats.to_dict(len(self._calls))
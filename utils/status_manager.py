@@ -66,6 +66,8 @@ class StatusManager:
             'health': 90
         }
         self.last_update = datetime.now()
+        # Fractional decay not yet reflected in the integer values (server-side state only)
+        self._decay_carry = {}
 
     def get_status(self) -> Dict[str, int]:
         """Get current status values"""
@@ -234,6 +236,33 @@ class StatusManager:
             'message': self.get_status_message()
         }
 
+    def to_state(self) -> Dict:
+        """Convert status to a JSON-serializable dict for server-side storage"""
+        return {
+            'values': {
+                stat: min(self.MAX_VALUE, value + self._decay_carry.get(stat, 0.0))
+                for stat, value in self.status.items()
+            },
+            'last_update': self.last_update.timestamp()
+        }
+
+    @classmethod
+    def from_state(cls, state: Dict) -> 'StatusManager':
+        """
+        Restore a stored status, applying the decay accumulated since it was saved
+
+        Stored values keep their fractional part, so frequent restores do not
+        lose a point to integer truncation each time.
+        """
+        manager = cls()
+        if state:
+            minutes_elapsed = max(0.0, (manager.last_update.timestamp() - state['last_update']) / 60)
+            for stat, value in state['values'].items():
+                value = max(cls.MIN_VALUE, min(cls.MAX_VALUE, value - cls.DECAY_RATES.get(stat, 0) * minutes_elapsed))
+                manager.status[stat] = int(value)
+                manager._decay_carry[stat] = value - int(value)
+        return manager
+
     @classmethod
     def from_dict(cls, data: Dict) -> 'StatusManager':
         """Create StatusManager from dictionary"""
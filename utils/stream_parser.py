@@ -0,0 +1,342 @@
+"""
+Incremental parser for streamed Gemini responses
+串流回應的增量解析器
+
+Gemini streams the JSON reply (``{"message": ..., "emoji": ..., ...}``) in
+arbitrary text chunks. ``ResponseStreamParser`` scans each chunk once, decodes
+the top-level string fields as they arrive and reports new ``message`` text so
+the browser can render it before the object closes. It tolerates markdown
+fences, unknown or nested fields and truncated output; replies that are not
+JSON at all are passed through as plain text.
+
+``parse_response_fields`` parses a complete reply: ``json.loads`` on the
+object span first, the tolerant scanner only when that fails.
+"""
+
+import json
+import re
+from typing import Dict, List, Optional
+
+_ESCAPES = {
+    '"': '"',
+    '\\': '\\',
+    '/': '/',
+    'b': '\b',
+    'f': '\f',
+    'n': '\n',
+    'r': '\r',
+    't': '\t'
+}
+
+# Next character that ends a run of plain string content
+_STRING_SPECIAL = re.compile(r'["\\]')
+# Next character that matters while skipping a nested value
+_NESTED_SPECIAL = re.compile(r'["{}\[\]]')
+_WHITESPACE = ' \t\r\n'
+
+RESPONSE_FIELDS = ('message', 'emoji', 'scene', 'mcp_command')
+
+
+class ResponseStreamParser:
+    """Decode top-level JSON string fields incrementally from streamed text"""
+
+    PREAMBLE = 'preamble'      # Before the opening brace (whitespace, ```json fence)
+    KEY = 'key'                # Expecting a key, ',' or '}'
+    KEY_STRING = 'key_string'
+    COLON = 'colon'
+    VALUE = 'value'            # Expecting a value
+    VALUE_STRING = 'value_string'
+    SCALAR = 'scalar'          # Number / true / false / null
+    NESTED = 'nested'          # Skipping an object or array value
+    DONE = 'done'
+    PLAIN = 'plain'            # Not JSON; everything is the message
+
+    def __init__(self, fields=RESPONSE_FIELDS, stream_field: str = 'message'):
+        """
+        Args:
+            fields: Top-level string fields to collect
+            stream_field: Field whose text feed() returns as it is decoded
+        """
+        self.wanted = frozenset(fields)
+        self.stream_field = stream_field
+        self.state = self.PREAMBLE
+        self._fields: Dict[str, str] = {}  # Completed field values
+
+        self._chunks: List[str] = []
+        self._text = None
+        self._preamble = ''      # Text before the opening brace (a ```json fence at most)
+        self._carry = ''         # Incomplete escape sequence held back from the previous chunk
+        self._buf: List[str] = []  # Decoded pieces of the current string
+        self._key = None
+        self._depth = 0
+        self._nested_in_string = False
+
+    @property
+    def text(self) -> str:
+        """Full raw text received so far"""
+        if self._text is None:
+            self._text = ''.join(self._chunks)
+        return self._text
+
+    @property
+    def fields(self) -> Dict[str, str]:
+        """Fields decoded so far, including stream_field's partial text if it is still open"""
+        if self.state == self.PLAIN:
+            return {self.stream_field: self.text}
+        if self.state == self.VALUE_STRING and self._key == self.stream_field:
+            return dict(self._fields, **{self.stream_field: ''.join(self._buf)})
+        return self._fields
+
+    @property
+    def complete(self) -> bool:
+        """Whether the closing brace of the object has been seen"""
+        return self.state == self.DONE
+
+    @property
+    def finished(self) -> bool:
+        """Whether stream_field's closing quote has been seen"""
+        return self.stream_field in self._fields
+
+    def feed(self, chunk: str) -> str:
+        """
+        Feed a new chunk of raw model output
+
+        Args:
+            chunk: Next piece of streamed text
+
+        Returns:
+            Newly decoded stream_field text (may be empty)
+        """
+        if not chunk:
+            return ''
+        self._chunks.append(chunk)
+        self._text = None
+
+        if self.state == self.PLAIN:
+            return chunk
+
+        data = self._carry + chunk if self._carry else chunk
+        self._carry = ''
+        delta = []
+        pos = 0
+        end = len(data)
+
+        while pos < end and self.state != self.DONE:
+            state = self.state
+
+            if state == self.PREAMBLE:
+                brace = data.find('{', pos)
+                self._preamble += data[pos:] if brace < 0 else data[pos:brace]
+                if not self._is_preamble(self._preamble):
+                    # Model ignored the JSON instruction; stream the text as-is
+                    self.state = self.PLAIN
+                    return self.text
+                if brace < 0:
+                    break
+                self.state = self.KEY
+                pos = brace + 1
+
+            elif state == self.KEY:
+                pos = self._skip(data, pos, _WHITESPACE + ',')
+                if pos >= end:
+                    break
+                char = data[pos]
+                if char == '"':
+                    self.state = self.KEY_STRING
+                    self._buf = []
+                elif char == '}':
+                    self.state = self.DONE
+                pos += 1
+
+            elif state == self.COLON:
+                pos = self._skip(data, pos, _WHITESPACE)
+                if pos >= end:
+                    break
+                if data[pos] == ':':
+                    pos += 1
+                self.state = self.VALUE
+
+            elif state == self.VALUE:
+                pos = self._skip(data, pos, _WHITESPACE)
+                if pos >= end:
+                    break
+                char = data[pos]
+                if char == '"':
+                    self.state = self.VALUE_STRING
+                    self._buf = []
+                    pos += 1
+                elif char in '{[':
+                    self.state = self.NESTED
+                    self._depth = 1
+                    self._nested_in_string = False
+                    pos += 1
+                else:
+                    self.state = self.SCALAR
+
+            elif state in (self.KEY_STRING, self.VALUE_STRING):
+                streaming = state == self.VALUE_STRING and self._key == self.stream_field
+                mark = len(self._buf)
+                pos, closed = self._scan_string(data, pos)
+                if streaming and len(self._buf) > mark:
+                    delta.extend(self._buf[mark:])
+                if not closed:
+                    break
+                value = ''.join(self._buf)
+                if state == self.KEY_STRING:
+                    self._key = value
+                    self.state = self.COLON
+                else:
+                    if self._key in self.wanted:
+                        self._fields[self._key] = value
+                    self.state = self.KEY
+
+            elif state == self.SCALAR:
+                stop = pos
+                while stop < end and data[stop] not in ',}':
+                    stop += 1
+                if stop >= end:
+                    break
+                self.state = self.DONE if data[stop] == '}' else self.KEY
+                pos = stop + 1
+
+            elif state == self.NESTED:
+                pos = self._skip_nested(data, pos)
+
+        return ''.join(delta)
+
+    @staticmethod
+    def _is_preamble(head: str) -> bool:
+        """Whether text before the opening brace looks like whitespace and/or a ```json fence"""
+        head = head.strip()
+        if not head:
+            return True
+        label = head.lstrip('`').strip().lower()
+        return head.startswith('`') and 'json'.startswith(label)
+
+    @staticmethod
+    def _skip(data: str, pos: int, chars: str) -> int:
+        end = len(data)
+        while pos < end and data[pos] in chars:
+            pos += 1
+        return pos
+
+    def _scan_string(self, data: str, pos: int):
+        """
+        Decode string content into self._buf
+
+        Returns:
+            Tuple of (new position, whether the closing quote was reached)
+        """
+        end = len(data)
+        buf = self._buf
+        while pos < end:
+            match = _STRING_SPECIAL.search(data, pos)
+            if match is None:
+                buf.append(data[pos:])
+                return end, False
+
+            special = match.start()
+            if special > pos:
+                buf.append(data[pos:special])
+            if data[special] == '"':
+                return special + 1, True
+
+            # Escape sequence - hold it back if the rest has not arrived yet
+            decoded = _decode_escape(data, special)
+            if decoded is None:
+                self._carry = data[special:]
+                return end, False
+            text, pos = decoded
+            buf.append(text)
+        return pos, False
+
+    def _skip_nested(self, data: str, pos: int) -> int:
+        """Skip an object/array value, tracking strings so braces inside them are ignored"""
+        end = len(data)
+        while pos < end:
+            if self._nested_in_string:
+                self._buf = []
+                pos, closed = self._scan_string(data, pos)
+                if not closed:
+                    return end
+                self._nested_in_string = False
+                continue
+
+            match = _NESTED_SPECIAL.search(data, pos)
+            if match is None:
+                return end
+            char = data[match.start()]
+            pos = match.start() + 1
+            if char == '"':
+                self._nested_in_string = True
+            elif char in '{[':
+                self._depth += 1
+            else:
+                self._depth -= 1
+                if self._depth == 0:
+                    self.state = self.KEY
+                    return pos
+        return pos
+
+
+def _decode_escape(text: str, pos: int) -> Optional[tuple]:
+    """
+    Decode the escape sequence starting with the backslash at pos
+
+    Returns:
+        Tuple of (decoded text, position after the escape), or None if the sequence is incomplete
+    """
+    if pos + 1 >= len(text):
+        return None
+    code = text[pos + 1]
+    if code != 'u':
+        return _ESCAPES.get(code, code), pos + 2
+
+    if pos + 6 > len(text):
+        return None
+    try:
+        code_point = int(text[pos + 2:pos + 6], 16)
+    except ValueError:
+        return text[pos + 1], pos + 2
+
+    if 0xD800 <= code_point <= 0xDBFF:
+        if pos + 12 > len(text):
+            return None
+        if text[pos + 6:pos + 8] == '\\u':
+            try:
+                low = int(text[pos + 8:pos + 12], 16)
+            except ValueError:
+                low = 0
+            if 0xDC00 <= low <= 0xDFFF:
+                combined = 0x10000 + ((code_point - 0xD800) << 10) + (low - 0xDC00)
+                return chr(combined), pos + 12
+
+    return chr(code_point), pos + 6
+
+
+def parse_response_fields(text: str, fields=RESPONSE_FIELDS) -> Dict:
+    """
+    Parse a complete model reply into its top-level fields
+
+    Args:
+        text: Raw model output (JSON, fenced JSON, truncated JSON or plain text)
+        fields: Fields to collect when falling back to the tolerant scanner
+
+    Returns:
+        Dict of the fields found; plain-text replies come back as {'message': text}
+    """
+    start = text.find('{')
+    end = text.rfind('}')
+    if start >= 0 and end > start:
+        try:
+            parsed = json.loads(text[start:end + 1])
+            if isinstance(parsed, dict) and ResponseStreamParser._is_preamble(text[:start]):
+                return parsed
+        except ValueError:
+            pass
+
+    parser = ResponseStreamParser(fields)
+    parser.feed(text)
+    if parser.state == ResponseStreamParser.PLAIN:
+        return {parser.stream_field: text.strip()}
+    return parser.fields